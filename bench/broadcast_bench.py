@@ -0,0 +1,64 @@
+"""Бенчмарк движка рассылки против локального фейкового Bot API.
+
+Запуск из корня проекта:
+    python -m bench.broadcast_bench --users 3000 --latency 0.05
+
+Сравнивает последовательную отправку (как было раньше) с broadcast_copy
+и проверяет, что устойчивая скорость держится у лимита BROADCAST_RATE,
+а ответы 429 от сервера корректно переживаются.
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot
+
+from bench.fake_bot_api import FakeBotAPI, FAKE_TOKEN
+from services.broadcast import TokenBucket, broadcast_copy
+
+
+async def sequential(bot: Bot, chat_ids):
+    for chat_id in chat_ids:
+        await bot.copy_message(chat_id=chat_id, from_chat_id=1, message_id=1)
+
+
+async def run(args):
+    api = FakeBotAPI(port=args.port, latency=args.latency, rate_limit=args.server_limit)
+    await api.start()
+    bot = Bot(token=FAKE_TOKEN, session=api.session())
+    chat_ids = list(range(1, args.users + 1))
+    try:
+        if args.sequential:
+            sample = chat_ids[:min(len(chat_ids), 200)]
+            started = time.perf_counter()
+            await sequential(bot, sample)
+            elapsed = time.perf_counter() - started
+            print(f"sequential: {len(sample)} msgs in {elapsed:.2f}s -> {len(sample) / elapsed:.1f} msg/s")
+            api.reset()
+
+        started = time.perf_counter()
+        stats = await broadcast_copy(bot, from_chat_id=1, message_id=1, chat_ids=chat_ids,
+                                     limiter=TokenBucket(args.rate), workers=args.workers)
+        elapsed = time.perf_counter() - started
+        print(f"broadcast:  {stats.sent} sent, {stats.failed} failed, {stats.retries} retry_after "
+              f"in {elapsed:.2f}s -> {stats.sent / elapsed:.1f} msg/s "
+              f"(limit {args.rate}, server 429s: {api.flood_errors})")
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1500)
+    parser.add_argument("--rate", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="имитация сетевой задержки, сек.")
+    parser.add_argument("--server-limit", type=float, default=None, help="лимит сервера, сообщ./сек. (429 сверх него)")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--sequential", action="store_true", help="также замерить старую последовательную отправку")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Цена выбора хендлера: сколько фильтров проверяет aiogram, пока не найдёт нужный.
+
+Запуск из корня проекта (ни MySQL, ни Bot API не нужны):
+    python -m bench.dispatch_bench --rounds 2000
+
+Берутся настоящие роутеры из main.create_dispatcher(), и для каждого типового
+сообщения повторяется обход, который делает Router.propagate_event: фильтры
+роутеров и хендлеров по порядку до первого совпадения. Сами хендлеры и
+middleware не вызываются — выводится только время фильтрации и число
+проверенных хендлеров.
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram.types import Chat, Message, User
+
+from filters.menu import menu_button
+from filters.admin import ADMIN_ID
+from handlers.menu import MenuObserver
+from main import create_dispatcher
+
+USER_ID = 42
+
+# (название, текст, FSM-состояние, id отправителя)
+CASES = [
+    ("/start", "/start", None, USER_ID),
+    ("account button", "👤 Аккаунт", None, USER_ID),
+    ("events button", "🎯 События", None, USER_ID),
+    ("contact button", "📩 Связь", None, USER_ID),
+    ("promo button", "🎟️ Промокоды", None, USER_ID),
+    ("manage button", "⚙️ Управление", None, USER_ID),
+    ("/slow", "/slow", None, ADMIN_ID),
+    ("free text", "Здравствуйте, вопрос по событию", None, USER_ID),
+    ("promo code in state", "SUMMER2024", "PromoState:waiting_for_code", USER_ID),
+    ("event media in state", "skip", "EventCreation:waiting_for_media", ADMIN_ID),
+    ("broadcast in state", "Всем привет", "BroadcastState:waiting_for_broadcast_message", ADMIN_ID),
+]
+
+
+def make_message(text: str, user_id: int) -> Message:
+    return Message(
+        message_id=1, date=int(time.time()), text=text,
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Bench"),
+    )
+
+
+async def resolve(dp, event: Message, data: dict):
+    """Обход роутеров как в propagate_event; возвращает (хендлер, проверено хендлеров)."""
+    checked = 0
+    for router in dp.chain_tail:
+        observer = router.message
+        passed, kwargs = await observer.check_root_filters(event, **data)
+        if not passed:
+            continue
+        if isinstance(observer, MenuObserver):
+            # Кнопки меню: поиск в словаре вместо фильтров, как в MenuObserver.trigger
+            handler = observer.resolve(kwargs.get("menu_button"))
+            if handler is not None:
+                return handler.callback.__name__, checked
+            continue
+        for handler in observer.handlers:
+            checked += 1
+            kwargs["handler"] = handler
+            passed, _ = await handler.check(event, **kwargs)
+            if passed:
+                return handler.callback.__name__, checked
+    return None, checked
+
+
+async def run(args):
+    dp = create_dispatcher()
+    user = {"tg_id": USER_ID, "rank": "Участник", "balance": 0, "ledger_folded_id": 0, "blocked": 0}
+    print(f"{'case':22} {'handler':26} {'checked':>7} {'us/update':>10}")
+    total = 0.0
+    for name, text, state, user_id in CASES:
+        event = make_message(text, user_id)
+        data = {"bot": None, "event_from_user": event.from_user, "event_chat": event.chat,
+                "raw_state": state, "user": user, "event_update": None,
+                # Как MenuButtonMiddleware: кнопка ищется один раз до выбора хендлера
+                "menu_button": menu_button(text)}
+        handler, checked = await resolve(dp, event, data)
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            await resolve(dp, event, data)
+        per_update = (time.perf_counter() - started) / args.rounds * 1e6
+        total += per_update
+        print(f"{name:22} {handler or '-':26} {checked:7d} {per_update:10.1f}")
+    print(f"{'mean':22} {'':26} {'':7} {total / len(CASES):10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Проверка планов запросов ленты событий, списка обращений и поиска по ним через EXPLAIN.
+
+Запуск из корня проекта против локальной базы из DATABASE_URL:
+    python -m bench.explain_queries
+
+Таблицы должны быть наполнены — на почти пустых оптимизатор законно
+предпочитает полный скан.
+
+Завершается с кодом 1, если какой-то запрос не использует ожидаемый индекс,
+делает filesort или (для следующих страниц) читает индекс не диапазоном.
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from aiomysql import DictCursor
+
+from database import init_db, acquire, close_pool
+from services.pagination import seek_condition
+
+NOW = datetime.now().replace(microsecond=0)
+
+# Условия следующей страницы — ровно те, что строит fetch_keyset_page
+EVENTS_SEEK, EVENTS_SEEK_ARGS = seek_condition(("starts_at", "id"), (NOW, 2 ** 31 - 1))
+CONTACTS_SEEK, CONTACTS_SEEK_ARGS = seek_condition(("created_at", "id"), (NOW, 2 ** 31 - 1))
+ID_SEEK, ID_SEEK_ARGS = seek_condition(("id",), (2 ** 31 - 1,))
+
+# (описание, запрос, параметры, ожидаемый индекс[, {"filesort": допустим ли, "type": тип доступа}])
+QUERIES = [
+    (
+        "предстоящие события",
+        "SELECT id FROM events WHERE starts_at >= %s ORDER BY starts_at, id",
+        (NOW,),
+        "idx_events_starts_at",
+    ),
+    (
+        "прошедшие события",
+        "SELECT id FROM events WHERE starts_at < %s ORDER BY starts_at DESC, id DESC LIMIT 50",
+        (NOW,),
+        "idx_events_starts_at",
+    ),
+    (
+        "события в админке, следующая страница",
+        f"SELECT * FROM events WHERE {EVENTS_SEEK} ORDER BY starts_at DESC, id DESC LIMIT 10",
+        EVENTS_SEEK_ARGS,
+        "idx_events_starts_at",
+        {"type": "range"},
+    ),
+    (
+        "новые обращения",
+        "SELECT * FROM contacts WHERE answered = FALSE ORDER BY created_at DESC, id DESC LIMIT 10",
+        (),
+        "idx_contacts_answered_created",
+    ),
+    (
+        "новые обращения, следующая страница",
+        f"SELECT * FROM contacts WHERE answered = FALSE AND {CONTACTS_SEEK} "
+        "ORDER BY created_at DESC, id DESC LIMIT 10",
+        CONTACTS_SEEK_ARGS,
+        "idx_contacts_answered_created",
+        {"type": "range"},
+    ),
+    (
+        "поиск обращений по tg_id",
+        f"SELECT id FROM contacts WHERE tg_id = %s AND {ID_SEEK} ORDER BY id DESC LIMIT 10",
+        (1, *ID_SEEK_ARGS),
+        "idx_contacts_tg_id",
+        {"type": "range"},
+    ),
+    (
+        "поиск обращений по username",
+        "SELECT id FROM contacts WHERE username = %s ORDER BY id DESC LIMIT 10",
+        ("username",),
+        "idx_contacts_username",
+    ),
+    (
+        # Совпадения приходят из полнотекстового индекса без порядка — сортируются только id
+        "полнотекстовый поиск обращений",
+        "SELECT id FROM contacts WHERE MATCH(message) AGAINST (%s IN BOOLEAN MODE) ORDER BY id DESC LIMIT 10",
+        ("+обращение*",),
+        "ft_contacts_message",
+        {"filesort": True},
+    ),
+]
+
+
+async def check_plans(cur):
+    """EXPLAIN каждого запроса из QUERIES: список (описание, ok, первая строка плана)."""
+    results = []
+    for title, sql, params, index, *expect in QUERIES:
+        expect = expect[0] if expect else {}
+        await cur.execute("EXPLAIN " + sql, params)
+        plan = await cur.fetchall()
+        row = plan[0]
+        extra = row.get("Extra") or ""
+        ok = (row.get("key") == index
+              and (expect.get("filesort") or "filesort" not in extra.lower())
+              and row.get("type") == expect.get("type", row.get("type")))
+        results.append((title, ok, row))
+    return results
+
+
+async def main() -> int:
+    await init_db()
+    try:
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                results = await check_plans(cur)
+    finally:
+        await close_pool()
+    for title, ok, row in results:
+        print(f"{'OK  ' if ok else 'FAIL'} {title}: key={row.get('key')} type={row.get('type')} "
+              f"rows={row.get('rows')} extra={row.get('Extra') or ''!r}")
+    return 0 if all(ok for _, ok, _ in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
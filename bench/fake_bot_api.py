@@ -0,0 +1,134 @@
+"""Локальный фейковый Bot API для бенчмарков.
+
+Отвечает на любые методы вида POST /bot<token>/<method>, запоминает вызовы,
+умеет имитировать сетевую задержку и флуд-лимит Telegram (HTTP 429 с
+retry_after), чтобы проверять поведение бота без обращения к настоящему API.
+Обновления, добавленные через push_updates, отдаются боту через getUpdates.
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+FAKE_TOKEN = "123456:FAKE-TOKEN-FOR-BENCHMARKS"
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081,
+                 latency: float = 0.0, rate_limit: float = None, retry_after: int = 1):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.flood_errors = 0
+        self.log = []
+        self._recent = deque()
+        self._message_ids = itertools.count(1)
+        self._updates = deque()
+        self._updates_ready = asyncio.Event()
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def session(self) -> AiohttpSession:
+        """Сессия aiogram, направляющая все запросы на этот сервер."""
+        return AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+
+    def _flooded(self) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            return True
+        self._recent.append(now)
+        return False
+
+    def _result(self, method: str, params: dict):
+        if method in ("copyMessage",):
+            return {"message_id": next(self._message_ids)}
+        if method in ("sendMessage", "sendPhoto", "editMessageText", "editMessageCaption"):
+            chat_id = int(params.get("chat_id") or 0)
+            return {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text") or "",
+            }
+        if method == "sendMediaGroup":
+            chat_id = int(params.get("chat_id") or 0)
+            return [{
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }]
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        return True
+
+    def push_updates(self, updates):
+        """Ставит обновления в очередь для long polling."""
+        self._updates.extend(updates)
+        self._updates_ready.set()
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        # Как в настоящем API: offset подтверждает все обновления до него
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, limit))
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getUpdates":
+            self.calls[method] += 1
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if self._flooded():
+            self.flood_errors += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        self.calls[method] += 1
+        self.log.append((method, params))
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def reset(self):
+        self.calls.clear()
+        self.log.clear()
+        self.flood_errors = 0
+        self._updates.clear()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,256 @@
+"""Микробенчмарк хендлеров: настоящие роутеры из main.py, фейковый Bot API, локальная MySQL.
+
+Запуск из корня проекта против отдельной тестовой базы из DATABASE_URL:
+    python -m bench.handlers_bench --iterations 200
+    python -m bench.handlers_bench --save-baseline      # записать эталон
+    python -m bench.handlers_bench --compare            # сравнить с эталоном
+
+База наполняется данными реалистичного объёма (пользователи, события,
+обращения, промокоды) с tg_id из зарезервированного диапазона; повторный
+запуск досевает только недостающее, --cleanup удаляет всё засеянное.
+
+Для каждого сценария выводятся p50/p90/p99 времени обработки одного
+обновления, а также запросы к MySQL и вызовы Bot API на обновление.
+С --compare код выхода 1, если p50 какого-то сценария вырос больше чем
+на --tolerance процентов.
+
+Эталон лежит в bench/baselines/handlers.json (путь меняется --baseline).
+Он зависит от машины и версии MySQL, поэтому в репозиторий не кладётся:
+снимите его на той же машине и базе, где потом будете сравнивать, —
+на коде до изменения с --save-baseline, затем на новом коде с --compare.
+Без эталона --compare завершается с кодом 2, а не молча проходит.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Админские сценарии идут от одного пользователя: общий лимит троттлинга им не нужен.
+# Переменная читается при импорте middlewares.throttling, поэтому задаётся до main
+os.environ.setdefault("THROTTLE_RATE", "1000000")
+os.environ.setdefault("THROTTLE_BURST", "1000000")
+
+from aiogram import Bot
+
+from bench.fake_bot_api import FakeBotAPI, FAKE_TOKEN
+from database import acquire, add_query_observer
+from handlers.manage import ADMIN_ID
+from main import create_dispatcher
+from services.events_feed import invalidate_events
+from services.promo import invalidate_promo_codes
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "handlers.json"
+# Засеянные строки: tg_id от BENCH_BASE, события с creator_id = BENCH_BASE
+BENCH_BASE = 10 ** 12
+BENCH_PROMO = "BENCHPROMO"
+
+_queries = 0
+
+
+def _count_query(query, args, seconds, rowcount, error):
+    global _queries
+    _queries += 1
+
+
+add_query_observer(_count_query)
+
+_update_ids = itertools.count(1)
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"Bench {uid}", "username": f"bench{uid}"}
+
+
+def message(uid: int, text: str) -> dict:
+    update_id = next(_update_ids)
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()),
+        "chat": {"id": uid, "type": "private"}, "from": _user(uid), "text": text,
+    }}
+
+
+def callback(uid: int, data: str) -> dict:
+    update_id = next(_update_ids)
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": _user(uid), "chat_instance": "bench", "data": data,
+        "message": {"message_id": update_id, "date": int(time.time()),
+                    "chat": {"id": uid, "type": "private"}, "text": "…"},
+    }}
+
+
+# (название, подготовительные обновления, измеряемое обновление); uid — засеянный пользователь
+SCENARIOS = [
+    ("start", lambda uid: [], lambda uid: message(uid, "/start")),
+    ("account_info", lambda uid: [], lambda uid: message(uid, "👤 Аккаунт")),
+    ("show_events", lambda uid: [], lambda uid: message(uid, "🎯 События")),
+    ("events_feed_page", lambda uid: [], lambda uid: callback(uid, "events_feed:u:2")),
+    ("promo_invalid", lambda uid: [message(uid, "🎟️ Промокоды")], lambda uid: message(uid, "NOSUCHCODE")),
+    ("promo_valid", lambda uid: [message(uid, "🎟️ Промокоды")], lambda uid: message(uid, BENCH_PROMO)),
+    ("contact_message", lambda uid: [message(uid, "📩 Связь")], lambda uid: message(uid, "Вопрос из бенчмарка")),
+    ("incoming_contact", lambda uid: [], lambda uid: message(uid, "Просто сообщение")),
+    ("admin_contacts_list", lambda uid: [], lambda uid: callback(ADMIN_ID, "admin_contacts_list")),
+    ("admin_events_list", lambda uid: [], lambda uid: callback(ADMIN_ID, "admin_events_list")),
+    ("admin_users_list", lambda uid: [], lambda uid: callback(ADMIN_ID, "admin_users_list")),
+]
+
+
+async def _count(cur, sql: str, *args) -> int:
+    await cur.execute(sql, args)
+    return (await cur.fetchone())[0]
+
+
+async def seed(users: int, events: int, contacts: int):
+    now = datetime.now()
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            have = await _count(cur, "SELECT COUNT(*) FROM users WHERE tg_id >= %s", BENCH_BASE)
+            if have < users:
+                await cur.executemany(
+                    "INSERT IGNORE INTO users (tg_id, username, full_name, `rank`, balance) VALUES (%s, %s, %s, %s, %s)",
+                    [(BENCH_BASE + i, f"bench{i}", f"Bench {i}", "Участник", random.randint(0, 5000))
+                     for i in range(users)]
+                )
+            have = await _count(cur, "SELECT COUNT(*) FROM events WHERE creator_id = %s", BENCH_BASE)
+            if have < events:
+                rows = []
+                for i in range(have, events):
+                    starts_at = now + timedelta(days=random.randint(-180, 180), minutes=random.randint(0, 1440))
+                    rows.append((f"Событие {i}", "Описание события " * 10, "100 💎",
+                                 starts_at.strftime("%d.%m.%Y %H:%M"), starts_at, BENCH_BASE))
+                await cur.executemany(
+                    "INSERT INTO events (title, description, prize, datetime, starts_at, creator_id) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)", rows
+                )
+            have = await _count(cur, "SELECT COUNT(*) FROM contacts WHERE tg_id >= %s", BENCH_BASE)
+            if have < contacts:
+                await cur.executemany(
+                    "INSERT INTO contacts (tg_id, username, full_name, message, answered) VALUES (%s, %s, %s, %s, %s)",
+                    [(BENCH_BASE + random.randrange(users), "bench", "Bench", "Текст обращения " * 5, random.random() < 0.7)
+                     for _ in range(contacts - have)]
+                )
+            await cur.execute("INSERT IGNORE INTO promo_codes (code, reward) VALUES (%s, 1)", (BENCH_PROMO,))
+            # Чтобы promo_valid каждый раз шёл по пути успешной активации
+            await cur.execute("DELETE FROM promo_codes_usage WHERE code = %s", (BENCH_PROMO,))
+    await invalidate_events()
+    await invalidate_promo_codes()
+
+
+async def cleanup():
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM promo_codes_usage WHERE code = %s", (BENCH_PROMO,))
+            await cur.execute("DELETE FROM promo_codes WHERE code = %s", (BENCH_PROMO,))
+            await cur.execute("DELETE FROM contacts WHERE tg_id >= %s", (BENCH_BASE,))
+            await cur.execute("DELETE FROM events WHERE creator_id = %s", (BENCH_BASE,))
+            await cur.execute("DELETE FROM balance_ledger WHERE tg_id >= %s", (BENCH_BASE,))
+            await cur.execute("DELETE FROM users WHERE tg_id >= %s", (BENCH_BASE,))
+    await invalidate_events()
+    await invalidate_promo_codes()
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_scenario(dp, bot, api: FakeBotAPI, name, setup, measured, user_ids, args) -> dict:
+    latencies, queries, calls = [], [], []
+    for i in range(args.warmup + args.iterations):
+        # Каждый раз другой пользователь: как в жизни, и троттлинг не мешает
+        uid = next(user_ids)
+        for update in setup(uid):
+            await dp.feed_raw_update(bot, update)
+        update = measured(uid)
+        queries_before, calls_before = _queries, sum(api.calls.values())
+        started = time.perf_counter()
+        await dp.feed_raw_update(bot, update)
+        elapsed = time.perf_counter() - started
+        if i >= args.warmup:
+            latencies.append(elapsed * 1000)
+            queries.append(_queries - queries_before)
+            calls.append(sum(api.calls.values()) - calls_before)
+    return {
+        "p50": percentile(latencies, 0.5),
+        "p90": percentile(latencies, 0.9),
+        "p99": percentile(latencies, 0.99),
+        "db": statistics.mean(queries),
+        "api": statistics.mean(calls),
+    }
+
+
+def print_table(results: dict, baseline: dict = None):
+    print(f"{'scenario':22} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'db/upd':>7} {'api/upd':>7}")
+    for name, r in results.items():
+        line = f"{name:22} {r['p50']:8.2f} {r['p90']:8.2f} {r['p99']:8.2f} {r['db']:7.1f} {r['api']:7.1f}"
+        if baseline and name in baseline:
+            base = baseline[name]
+            line += f"   p50 {(r['p50'] / base['p50'] - 1) * 100:+.0f}%, db {r['db'] - base['db']:+.1f}"
+        print(line)
+
+
+async def main(args) -> int:
+    baseline = None
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"эталона нет: {args.baseline}; сначала запустите с --save-baseline")
+            return 2
+        baseline = json.loads(args.baseline.read_text())
+    api = FakeBotAPI(port=args.port, latency=args.api_latency)
+    await api.start()
+    bot = Bot(token=FAKE_TOKEN, session=api.session())
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot, dispatcher=dp, metrics_port=0)
+    try:
+        if args.cleanup:
+            await cleanup()
+            print("засеянные данные удалены")
+            return 0
+        await seed(args.users, args.events, args.contacts)
+        user_ids = itertools.cycle(range(BENCH_BASE, BENCH_BASE + args.users))
+        results = {}
+        for name, setup, measured in SCENARIOS:
+            if args.only and name not in args.only:
+                continue
+            results[name] = await run_scenario(dp, bot, api, name, setup, measured, user_ids, args)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+        await api.stop()
+
+    print_table(results, baseline)
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        print(f"эталон сохранён в {args.baseline}")
+    if baseline:
+        regressed = [name for name, r in results.items()
+                     if name in baseline and r["p50"] > baseline[name]["p50"] * (1 + args.tolerance / 100)]
+        if regressed:
+            print("регрессия p50:", ", ".join(regressed))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--contacts", type=int, default=5000)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка фейкового Bot API, сек.")
+    parser.add_argument("--only", nargs="*", help="запустить только эти сценарии")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=20, help="допустимый рост p50, %%")
+    parser.add_argument("--cleanup", action="store_true", help="удалить засеянные данные и выйти")
+    parser.add_argument("--port", type=int, default=8081)
+    sys.exit(asyncio.run(main(parser.parse_args())))
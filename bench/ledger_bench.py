@@ -0,0 +1,89 @@
+"""Нагрузочный тест журнала баланса против прямого UPDATE users.
+
+Запуск из корня проекта против локальной базы из DATABASE_URL:
+    python -m bench.ledger_bench --credits 5000 --concurrency 200 --users 1
+
+Сначала начисления делаются старым способом (UPDATE users SET balance =
+balance + 1), затем через services.ledger.credit. Для каждого режима выводятся
+время, число ожиданий блокировок строк (Innodb_row_lock_waits) и суммарное
+время ожидания. После свёртки проверяется, что баланс сошёлся.
+Тестовые пользователи создаются с отрицательными tg_id и удаляются в конце.
+"""
+import argparse
+import asyncio
+import time
+
+from database import init_db, acquire, close_pool
+from services.ledger import credit, current_balance, fold_balances
+from services.users import get_user, invalidate_user
+
+
+async def lock_stats():
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ('Innodb_row_lock_waits', 'Innodb_row_lock_time')")
+            return {name: int(value) for name, value in await cur.fetchall()}
+
+
+async def direct_update(tg_id: int):
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("UPDATE users SET balance = balance + 1 WHERE tg_id = %s", (tg_id,))
+
+
+async def run_mode(name: str, credit_one, user_ids, args):
+    queue = asyncio.Queue()
+    for i in range(args.credits):
+        queue.put_nowait(user_ids[i % len(user_ids)])
+
+    async def worker():
+        while not queue.empty():
+            await credit_one(queue.get_nowait())
+
+    before = await lock_stats()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    after = await lock_stats()
+    print(f"{name:7}: {args.credits} credits in {elapsed:.2f}s -> {args.credits / elapsed:.0f}/s, "
+          f"row lock waits {after['Innodb_row_lock_waits'] - before['Innodb_row_lock_waits']}, "
+          f"lock time {after['Innodb_row_lock_time'] - before['Innodb_row_lock_time']} ms")
+
+
+async def main(args):
+    await init_db()
+    user_ids = [-(i + 1) for i in range(args.users)]
+    try:
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(
+                    "INSERT IGNORE INTO users (tg_id, username, full_name) VALUES (%s, 'bench', 'bench')",
+                    [(tg_id,) for tg_id in user_ids]
+                )
+        await run_mode("update", direct_update, user_ids, args)
+        await run_mode("ledger", lambda tg_id: credit(tg_id, 1, "bench"), user_ids, args)
+
+        started = time.perf_counter()
+        folded = await fold_balances()
+        print(f"fold   : {folded} entries in {time.perf_counter() - started:.3f}s")
+        await invalidate_user(*user_ids)
+        for tg_id in user_ids:
+            balance = await current_balance(await get_user(tg_id))
+            expected = 2 * (args.credits // len(user_ids) + (1 if user_ids.index(tg_id) < args.credits % len(user_ids) else 0))
+            assert balance == expected, f"{tg_id}: баланс {balance}, ожидалось {expected}"
+        print("balances match")
+    finally:
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                placeholders = ", ".join(["%s"] * len(user_ids))
+                await cur.execute(f"DELETE FROM balance_ledger WHERE tg_id IN ({placeholders})", user_ids)
+                await cur.execute(f"DELETE FROM users WHERE tg_id IN ({placeholders})", user_ids)
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--credits", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1, help="сколько «горячих» пользователей")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""Сколько стоит один вызов логгера на event loop.
+
+Запуск из корня проекта:
+    python -m bench.logging_bench --calls 20000 --sink-delay 0.0002
+
+Сравниваются print(), синхронный logging.StreamHandler и очередь из logs.py
+на одном и том же «медленном» stdout: каждая запись в него спит sink-delay
+секунд, как pipe, который не успевает вычитывать лог-дренаж. Для очереди
+отдельно меряется вызов, отсечённый уровнем (logger.debug при INFO).
+Код выхода 1, если вызов через очередь дороже --budget-us микросекунд.
+"""
+import argparse
+import contextlib
+import logging
+import sys
+import time
+
+import logs
+
+
+class SlowSink:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str):
+        self.lines += text.count("\n")
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def per_call_us(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--sink-delay", type=float, default=0.0002, help="задержка записи в stdout, сек.")
+    parser.add_argument("--budget-us", type=float, default=20.0, help="допустимая цена вызова через очередь, мкс")
+    args = parser.parse_args()
+
+    sink = SlowSink(args.sink_delay)
+    # Синхронные варианты заметно медленнее, поэтому их прогоняем на меньшем числе вызовов
+    sync_calls = max(1, min(args.calls, int(1 / args.sink_delay) if args.sink_delay else args.calls))
+
+    with contextlib.redirect_stdout(sink):
+        print_us = per_call_us(lambda i: print(f"[Bench] Событие {i} обновлено"), sync_calls)
+
+    sync_logger = logging.getLogger("bench.sync")
+    sync_logger.propagate = False
+    sync_logger.setLevel(logging.INFO)
+    stream = logging.StreamHandler(sink)
+    stream.setFormatter(logs.JsonFormatter())
+    sync_logger.addHandler(stream)
+    sync_us = per_call_us(lambda i: sync_logger.info("Событие %s обновлено", i), sync_calls)
+
+    logs.setup_logging(stream=sink)
+    logger = logging.getLogger("bench.queue")
+    logs.update_id_var.set(1)
+    logs.user_id_var.set(42)
+    logs.handler_var.set("bench")
+    disabled_us = per_call_us(lambda i: logger.debug("Событие %s обновлено", i), args.calls)
+    written = sink.lines
+    queued_us = per_call_us(lambda i: logger.info("Событие %s обновлено", i, extra={"duration": 0.001}),
+                            args.calls)
+    started = time.perf_counter()
+    logs.stop_logging()
+    drain = time.perf_counter() - started
+
+    print(f"print():                  {print_us:8.2f} us/call ({sync_calls} calls)", file=sys.stderr)
+    print(f"logging, sync handler:    {sync_us:8.2f} us/call ({sync_calls} calls)", file=sys.stderr)
+    print(f"logging, queue:           {queued_us:8.2f} us/call ({args.calls} calls, "
+          f"{sink.lines - written} written, {logs.dropped()} dropped, drain {drain:.2f}s)", file=sys.stderr)
+    print(f"logging, below level:     {disabled_us:8.2f} us/call", file=sys.stderr)
+    if queued_us > args.budget_us:
+        print(f"вызов через очередь дороже бюджета {args.budget_us} us", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
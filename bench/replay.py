@@ -0,0 +1,168 @@
+"""Воспроизведение записанного трафика против бота из main.py.
+
+Запись: запустить бота с RECORD_UPDATES=updates.jsonl (см. middlewares/recorder.py),
+обновления сохраняются обезличенными вместе со временем получения.
+
+Воспроизведение из корня проекта против тестовой базы из DATABASE_URL:
+    python -m bench.replay updates.jsonl --speed 1 5 20
+    python -m bench.replay updates.jsonl --speed 0 --max-inflight 200
+
+Обновления подаются в dp.feed_raw_update с исходными интервалами, сжатыми
+в speed раз (0 — все сразу, не больше max-inflight одновременно), и
+обрабатываются параллельно, как при polling. Bot API — фейковый.
+Для каждой скорости выводятся пропускная способность, p50/p99 времени
+обработки обновления, задержка event loop и занятость пула MySQL.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from aiogram import Bot
+
+from bench.fake_bot_api import FakeBotAPI, FAKE_TOKEN
+from database import pool_stats
+from main import create_dispatcher
+
+
+def load(path: str):
+    """[(смещение от первого обновления, обновление)] по возрастанию времени."""
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record["t"])
+    start = records[0]["t"] if records else 0
+    return [(record["t"] - start, record["update"]) for record in records]
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Monitor:
+    """Раз в interval секунд меряет опоздание event loop и занятость пула."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lags = []
+        self.in_use = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - expected))
+            self.in_use.append(pool_stats()["in_use"])
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def replay(dp, bot, records, speed: float, args) -> dict:
+    latencies, errors = [], 0
+    inflight = asyncio.Semaphore(args.max_inflight)
+    monitor = Monitor(args.sample_interval)
+    before = pool_stats()
+
+    async def process(update):
+        nonlocal errors
+        async with inflight:
+            started = time.perf_counter()
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    monitor.start()
+    started = time.perf_counter()
+    for offset, update in records:
+        if speed:
+            delay = offset / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(process(update)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    after = pool_stats()
+    return {
+        "updates": len(records),
+        "elapsed": elapsed,
+        "errors": errors,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "lag_p99": percentile(monitor.lags, 0.99),
+        "lag_max": max(monitor.lags, default=0.0),
+        "pool_mean": statistics.mean(monitor.in_use) if monitor.in_use else 0.0,
+        "pool_peak": max(monitor.in_use, default=0),
+        "pool_waited": after["waited"] - before["waited"],
+        "pool_timeouts": after["timeouts"] - before["timeouts"],
+        "maxsize": after["maxsize"],
+    }
+
+
+def report(speed: float, r: dict):
+    label = f"x{speed:g}" if speed else "flood"
+    print(f"{label}: {r['updates']} updates in {r['elapsed']:.2f}s -> {r['updates'] / r['elapsed']:.0f} upd/s, "
+          f"errors {r['errors']}")
+    print(f"  latency p50 {r['p50'] * 1000:.1f} ms, p99 {r['p99'] * 1000:.1f} ms; "
+          f"loop lag p99 {r['lag_p99'] * 1000:.1f} ms, max {r['lag_max'] * 1000:.1f} ms")
+    print(f"  db pool in use mean {r['pool_mean']:.1f}, peak {r['pool_peak']}/{r['maxsize']}, "
+          f"waited {r['pool_waited']}, timeouts {r['pool_timeouts']}")
+
+
+async def run(args):
+    records = load(args.recording)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("запись пуста")
+        return
+    span = records[-1][0]
+    print(f"{len(records)} updates over {span:.1f}s of recorded traffic")
+
+    api = FakeBotAPI(port=args.port, latency=args.latency)
+    await api.start()
+    bot = Bot(token=FAKE_TOKEN, session=api.session())
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot, dispatcher=dp, metrics_port=0)
+    try:
+        for speed in args.speed:
+            report(speed, await replay(dp, bot, records, speed, args))
+            print(f"  bot api calls {sum(api.calls.values())}: "
+                  + ", ".join(f"{method} {count}" for method, count in api.calls.most_common(5)))
+            api.reset()
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording", help="JSONL, записанный с RECORD_UPDATES")
+    parser.add_argument("--speed", type=float, nargs="+", default=[1.0],
+                        help="во сколько раз быстрее записи; 0 — без пауз")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="обновлений в обработке одновременно")
+    parser.add_argument("--limit", type=int, default=0, help="взять только первые N обновлений")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка фейкового Bot API, сек.")
+    parser.add_argument("--sample-interval", type=float, default=0.01, help="шаг замера event loop и пула, сек.")
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Нагрузочный тест многопроцессного режима (workers.py).
+
+Запуск из корня проекта:
+    python -m bench.sharding_bench --updates 4000 --workers 1 2 4 --cpu-ms 5
+
+Для каждого числа воркеров поднимает супервизор с тестовым диспетчером,
+хендлер которого тратит cpu-ms миллисекунд процессорного времени и отвечает
+через фейковый Bot API, кладёт обновления в getUpdates и замеряет, за сколько
+все они обработаны. При достаточном числе ядер пропускная способность должна
+расти почти линейно. Заодно проверяется порядок: номера сообщений одного чата
+должны приходить в ответах строго по возрастанию.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+
+from bench.fake_bot_api import FakeBotAPI, FAKE_TOKEN
+from bench.webhook_bench import make_updates
+from workers import Supervisor, poll_updates
+
+FACTORY = "bench.sharding_bench:create_bench_bot,create_bench_dispatcher"
+
+
+def create_bench_bot() -> Bot:
+    api = TelegramAPIServer.from_base(os.environ["BENCH_API_URL"])
+    return Bot(token=FAKE_TOKEN, session=AiohttpSession(api=api))
+
+
+def create_bench_dispatcher() -> Dispatcher:
+    cpu = float(os.getenv("BENCH_CPU_MS", "5")) / 1000
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def burn(message: Message):
+        deadline = time.process_time() + cpu
+        while time.process_time() < deadline:
+            pass
+        await message.answer(str(message.message_id))
+
+    dp.include_router(router)
+    return dp
+
+
+def out_of_order(log) -> int:
+    last = {}
+    bad = 0
+    for method, params in log:
+        if method != "sendMessage":
+            continue
+        chat, number = params["chat_id"], int(params["text"])
+        bad += number < last.get(chat, 0)
+        last[chat] = number
+    return bad
+
+
+async def run_once(api: FakeBotAPI, workers: int, args) -> float:
+    api.reset()
+    supervisor = Supervisor(workers, factory=FACTORY)
+    supervisor.start()
+    # Время запуска процессов не считаем: ждём первый heartbeat каждого воркера
+    spawned = time.time()
+    while any(hb.value <= spawned for hb in supervisor.heartbeats):
+        await asyncio.sleep(0.05)
+    bot = create_bench_bot()
+    api.push_updates(make_updates(args.updates, args.chats))
+    started = time.perf_counter()
+    intake = asyncio.create_task(poll_updates(bot, supervisor, timeout=1))
+    try:
+        while api.calls["sendMessage"] < args.updates:
+            await asyncio.sleep(0.05)
+        return time.perf_counter() - started
+    finally:
+        intake.cancel()
+        await asyncio.get_running_loop().run_in_executor(None, supervisor.stop)
+        await bot.session.close()
+
+
+async def run(args):
+    os.environ["BENCH_API_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["BENCH_CPU_MS"] = str(args.cpu_ms)
+    api = FakeBotAPI(port=args.port)
+    await api.start()
+    base = None
+    try:
+        for workers in args.workers:
+            elapsed = await run_once(api, workers, args)
+            rate = args.updates / elapsed
+            base = base or rate / workers
+            print(f"{workers} worker(s): {rate:.0f} upd/s, x{rate / base:.2f} vs 1 worker, "
+                  f"out of order: {out_of_order(api.log)}")
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=4000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--cpu-ms", type=float, default=5, help="процессорное время хендлера, мс")
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
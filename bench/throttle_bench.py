@@ -0,0 +1,119 @@
+"""Нагрузочный тест ThrottlingMiddleware синтетическим флудером.
+
+Запуск из корня проекта:
+    python -m bench.throttle_bench --flooders 50 --flood-rate 50 --users 500 --duration 5
+
+Флудеры шлют сообщения с частотой flood-rate в секунду, обычные пользователи —
+раз в пару секунд. Обновления подаются прямо в dp.feed_raw_update, ответы уходят
+в фейковый Bot API. Проверяется, что до хендлера доходит не больше burst +
+rate * duration сообщений флудера, что каждое ведро флудера (общее и по флагу)
+предупредило его только один раз и что обычных пользователей лимит не задел.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import Message
+
+from bench.fake_bot_api import FakeBotAPI, FAKE_TOKEN
+from bench.webhook_bench import make_updates
+from middlewares.throttling import ThrottlingMiddleware, THROTTLED_TEXT
+
+FLAGGED = "🎟️ Промокоды"
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    update = make_updates(1, 1, first_id=update_id)[0]
+    update["message"]["chat"]["id"] = update["message"]["from"]["id"] = user_id
+    update["message"]["text"] = text
+    return update
+
+
+def make_dispatcher(handled: Counter, throttled: bool = True):
+    dp = Dispatcher()
+    if throttled:
+        outer = ThrottlingMiddleware()
+        dp.message.outer_middleware(outer)
+        dp.message.middleware(ThrottlingMiddleware(use_flags=True))
+    router = Router()
+
+    @router.message(F.text == FLAGGED, flags={"rate_limit": {"rate": 0.2, "burst": 5}})
+    async def flagged(message: Message):
+        handled[("flagged", message.from_user.id)] += 1
+
+    @router.message()
+    async def plain(message: Message):
+        handled[("plain", message.from_user.id)] += 1
+
+    dp.include_router(router)
+    return dp, (outer if throttled else None)
+
+
+async def user(dp, bot, user_id: int, rate: float, duration: float, text: str, ids):
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        await dp.feed_raw_update(bot, make_update(next(ids), user_id, text))
+        await asyncio.sleep(1 / rate)
+
+
+async def overhead(bot, count: int) -> float:
+    """Средняя добавка middleware на одно обновление, мкс."""
+    updates = [make_update(i, 1 + i % 1000, "hi") for i in range(count)]
+    results = []
+    for throttled in (False, True):
+        dp, _ = make_dispatcher(Counter(), throttled)
+        started = time.perf_counter()
+        for update in updates:
+            await dp.feed_raw_update(bot, update)
+        results.append((time.perf_counter() - started) / count)
+    return (results[1] - results[0]) * 1e6
+
+
+async def run(args):
+    api = FakeBotAPI(port=args.port)
+    await api.start()
+    bot = Bot(token=FAKE_TOKEN, session=api.session())
+    handled = Counter()
+    dp, outer = make_dispatcher(handled)
+    ids = iter(range(1, 10 ** 9))
+    flooders = range(1, args.flooders + 1)
+    users = range(10 ** 6, 10 ** 6 + args.users)
+    try:
+        await asyncio.gather(
+            *(user(dp, bot, uid, args.flood_rate, args.duration, "spam", ids) for uid in flooders),
+            *(user(dp, bot, uid, args.flood_rate, args.duration, FLAGGED, ids) for uid in flooders),
+            *(user(dp, bot, uid, 0.5, args.duration, "hello", ids) for uid in users),
+        )
+        budget = outer.burst + outer.rate * args.duration
+        worst = max(handled[("plain", uid)] + handled[("flagged", uid)] for uid in flooders)
+        worst_flagged = max(handled[("flagged", uid)] for uid in flooders)
+        warnings = Counter(int(p["chat_id"]) for m, p in api.log if m == "sendMessage" and p["text"] == THROTTLED_TEXT)
+        starved = sum(handled[("plain", uid)] < args.duration * 0.5 - 1 for uid in users)
+        print(f"flooders: sent {2 * args.flood_rate * args.duration:.0f} each, handled at most {worst} "
+              f"(budget {budget:.0f}), flagged at most {worst_flagged} (budget {5 + 0.2 * args.duration:.0f})")
+        print(f"warnings per flooder (2 buckets): max {max(warnings[uid] for uid in flooders)}, "
+              f"dropped total {outer.dropped}")
+        print(f"normal users throttled: {starved} of {args.users}")
+        outer.sweep(time.monotonic() + outer._refill)
+        print(f"buckets after idle sweep: {len(outer)}")
+        print(f"middleware overhead: {await overhead(bot, args.overhead_updates):.1f} us/update")
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flooders", type=int, default=20)
+    parser.add_argument("--flood-rate", type=float, default=30, help="сообщений в секунду от одного флудера")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--overhead-updates", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Бенчмарк приёма обновлений: вебхук против long polling.
+
+Запуск из корня проекта:
+    python -m bench.webhook_bench --updates 5000 --handler-latency 0.2
+
+Оба режима обрабатывают одинаковые синтетические сообщения хендлером,
+который «думает» handler-latency секунд и отвечает через фейковый Bot API.
+Для вебхука обновления отправляются POST-запросами на приложение из
+webhook.py с concurrency параллельными соединениями (как max_connections
+у Telegram), а заодно проверяется, что запрос без секрета получает 401.
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import ClientSession, web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from bench.fake_bot_api import FakeBotAPI, FAKE_TOKEN
+from webhook import create_webhook_app
+
+SECRET = "bench-secret"
+PATH = "/webhook"
+
+
+def make_updates(count: int, chats: int, first_id: int = 1):
+    now = int(time.time())
+    return [{
+        "update_id": first_id + i,
+        "message": {
+            "message_id": first_id + i,
+            "date": now,
+            "chat": {"id": 1 + i % chats, "type": "private"},
+            "from": {"id": 1 + i % chats, "is_bot": False, "first_name": "Bench"},
+            "text": "ping",
+        },
+    } for i in range(count)]
+
+
+def make_dispatcher(total: int, handler_latency: float):
+    dp = Dispatcher()
+    router = Router()
+    done = asyncio.Event()
+    handled = 0
+
+    @router.message()
+    async def echo(message: Message):
+        nonlocal handled
+        await asyncio.sleep(handler_latency)
+        await message.answer("pong")
+        handled += 1
+        if handled >= total:
+            done.set()
+
+    dp.include_router(router)
+    return dp, done
+
+
+async def bench_polling(api: FakeBotAPI, args) -> float:
+    dp, done = make_dispatcher(args.updates, args.handler_latency)
+    bot = Bot(token=FAKE_TOKEN, session=api.session())
+    api.push_updates(make_updates(args.updates, args.chats))
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, polling_timeout=1, handle_signals=False))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await dp.stop_polling()
+    await polling
+    return elapsed
+
+
+async def bench_webhook(api: FakeBotAPI, args):
+    dp, done = make_dispatcher(args.updates, args.handler_latency)
+    bot = Bot(token=FAKE_TOKEN, session=api.session())
+    runner = web.AppRunner(create_webhook_app(dp, bot, path=PATH, secret=SECRET))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.webhook_port).start()
+    url = f"http://127.0.0.1:{args.webhook_port}{PATH}"
+    updates = iter(make_updates(args.updates, args.chats))
+    try:
+        async with ClientSession() as client:
+            async with client.post(url, json=make_updates(1, 1, first_id=0)[0]) as resp:
+                assert resp.status == 401, f"запрос без секрета получил {resp.status}"
+
+            async def sender():
+                for update in updates:
+                    async with client.post(url, json=update,
+                                           headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as resp:
+                        assert resp.status == 200, resp.status
+
+            started = time.perf_counter()
+            await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+            accepted = time.perf_counter() - started
+            await done.wait()
+            elapsed = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+    return accepted, elapsed
+
+
+async def run(args):
+    api = FakeBotAPI(port=args.port, latency=args.latency)
+    await api.start()
+    try:
+        if not args.skip_polling:
+            elapsed = await bench_polling(api, args)
+            print(f"polling: {args.updates} updates in {elapsed:.2f}s -> {args.updates / elapsed:.0f} upd/s "
+                  f"({api.calls['getUpdates']} getUpdates)")
+            api.reset()
+        accepted, elapsed = await bench_webhook(api, args)
+        print(f"webhook: {args.updates} updates in {elapsed:.2f}s -> {args.updates / elapsed:.0f} upd/s "
+              f"(intake {args.updates / accepted:.0f} upd/s, {args.concurrency} connections)")
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--handler-latency", type=float, default=0.1, help="время работы хендлера, сек.")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка фейкового Bot API, сек.")
+    parser.add_argument("--concurrency", type=int, default=40, help="параллельных соединений вебхука")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8082)
+    parser.add_argument("--skip-polling", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
+import asyncio
 import aiomysql
+import importlib.util
+import logging
 import os
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+logger = logging.getLogger(__name__)
+
+# Параметры пула соединений
+DB_POOL_MINSIZE = int(os.getenv("DB_POOL_MINSIZE", "1"))
+DB_POOL_MAXSIZE = int(os.getenv("DB_POOL_MAXSIZE", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+
 def parse_mysql_url(url: str):
     url = url.replace("mysql://", "")
     user_pass, host_db = url.split("@")
@@ -22,71 +38,322 @@ def parse_mysql_url(url: str):
 
 DB_CONFIG = parse_mysql_url(DATABASE_URL)
 
-async def get_connection():
-    return await aiomysql.connect(**DB_CONFIG)
+_pool = None
+_pool_lock = asyncio.Lock()
+_pool_stats = {
+    "acquired": 0,   # сколько раз выдавалось соединение
+    "waited": 0,     # сколько раз пришлось ждать свободного соединения
+    "timeouts": 0,   # сколько раз ожидание превысило DB_ACQUIRE_TIMEOUT
+    "in_use": 0,     # занято прямо сейчас
+    "peak_in_use": 0,
+}
 
-async def safe_close(conn):
-    """Пытается корректно закрыть переданное соединение."""
-    if conn:
-        conn.close()
+# Наблюдатели запросов: fn(query, args, seconds, rowcount, error) после каждого execute
+_query_observers = []
 
-async def init_db():
-    conn = await get_connection()
+def add_query_observer(observer):
+    _query_observers.append(observer)
+
+class ObservedCursor(aiomysql.Cursor):
+    """Курсор, сообщающий наблюдателям о каждом запросе.
+
+    executemany и callproc тоже проходят через execute, поэтому отдельно не оборачиваются.
+    """
+
+    async def execute(self, query, args=None):
+        started = time.perf_counter()
+        error = None
+        try:
+            return await super().execute(query, args)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            for observer in _query_observers:
+                observer(query, args, elapsed, self.rowcount, error)
+
+_cursor_classes = {(): ObservedCursor}
+
+def _observed_cursor(cursors: tuple):
+    cls = _cursor_classes.get(cursors)
+    if cls is None:
+        name = "Observed" + "".join(c.__name__ for c in cursors)
+        cls = _cursor_classes[cursors] = type(name, (ObservedCursor, *cursors), {})
+    return cls
+
+class _Connection:
+    """Соединение из пула, у которого все курсоры — ObservedCursor."""
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *cursors):
+        return self._conn.cursor(_observed_cursor(cursors))
+
+async def create_pool():
+    """Создаёт общий для процесса пул соединений (повторный вызов возвращает существующий)."""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await aiomysql.create_pool(
+                minsize=DB_POOL_MINSIZE,
+                maxsize=DB_POOL_MAXSIZE,
+                pool_recycle=DB_POOL_RECYCLE,
+                **DB_CONFIG
+            )
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+@asynccontextmanager
+async def acquire():
+    """Берёт соединение из пула и гарантированно возвращает его обратно.
+
+    Использование:
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                ...
+    """
+    pool = _pool or await create_pool()
+    if pool.freesize == 0 and pool.size >= pool.maxsize:
+        _pool_stats["waited"] += 1
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), DB_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _pool_stats["timeouts"] += 1
+        raise
+    _pool_stats["acquired"] += 1
+    _pool_stats["in_use"] += 1
+    _pool_stats["peak_in_use"] = max(_pool_stats["peak_in_use"], _pool_stats["in_use"])
+    try:
+        yield _Connection(conn)
+    finally:
+        _pool_stats["in_use"] -= 1
+        pool.release(conn)
+
+def pool_stats() -> dict:
+    """Снимок загрузки пула: размер, свободные соединения и счётчики ожиданий."""
+    stats = dict(_pool_stats)
+    if _pool is not None:
+        stats.update(size=_pool.size, free=_pool.freesize, maxsize=_pool.maxsize)
+    else:
+        stats.update(size=0, free=0, maxsize=DB_POOL_MAXSIZE)
+    return stats
+
+# Журнал медленных запросов
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# Сколько разных отпечатков запросов хранить
+QUERY_STATS_SIZE = int(os.getenv("QUERY_STATS_SIZE", "500"))
+# Как часто (сек.) прогонять EXPLAIN по самым дорогим запросам и по скольким
+EXPLAIN_INTERVAL = float(os.getenv("EXPLAIN_INTERVAL", "300"))
+EXPLAIN_TOP = int(os.getenv("EXPLAIN_TOP", "5"))
+
+_FP_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_FP_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_FP_ROWS = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_FP_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_FP_SPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+
+# отпечаток -> {count, total, max, rows, errors, sample, plan}
+_query_stats = {}
+
+def _fingerprint(query: str) -> str:
+    q = _FP_STRING.sub("?", query)
+    q = _FP_NUMBER.sub("?", q).replace("%s", "?")
+    q = _FP_ROWS.sub(r"\1", q)        # VALUES (?, ?), (?, ?) ... -> VALUES (?, ?)
+    q = _FP_LIST.sub("IN (...)", q)    # IN (?, ?, ?) -> IN (...)
+    return _FP_SPACE.sub(" ", q).strip()
+
+_fingerprint_cached = lru_cache(maxsize=2048)(_fingerprint)
+
+def fingerprint(query: str) -> str:
+    """Текст запроса без значений: одинаковые запросы с разными параметрами совпадают."""
+    # Длинные строки — это развёрнутые executemany, их нет смысла держать в кэше
+    return _fingerprint_cached(query) if len(query) < 2000 else _fingerprint(query)
+
+def _record_query(query, args, seconds: float, rowcount: int, error):
+    if query.lstrip()[:7].upper() == "EXPLAIN":
+        return
+    fp = fingerprint(query)
+    stat = _query_stats.get(fp)
+    if stat is None:
+        if len(_query_stats) >= QUERY_STATS_SIZE:
+            del _query_stats[min(_query_stats, key=lambda k: _query_stats[k]["total"])]
+        stat = _query_stats[fp] = {"count": 0, "total": 0.0, "max": 0.0, "rows": 0, "errors": 0,
+                                   "sample": None, "plan": None}
+    stat["count"] += 1
+    stat["total"] += seconds
+    stat["rows"] += max(rowcount or 0, 0)
+    stat["errors"] += error is not None
+    if seconds >= stat["max"]:
+        stat["max"] = seconds
+        if fp.split(" ", 1)[0].upper() in _EXPLAINABLE:
+            stat["sample"] = (query, args)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Медленный запрос, строк %s: %s", rowcount, fp[:500], extra={"duration": seconds})
+
+add_query_observer(_record_query)
+
+def query_report(limit: int = 10):
+    """Самые дорогие по суммарному времени запросы: [(отпечаток, статистика)]."""
+    return sorted(_query_stats.items(), key=lambda item: item[1]["total"], reverse=True)[:limit]
+
+def _plan_line(row: dict) -> str:
+    extra = row.get("Extra") or ""
+    bad = row.get("type") == "ALL" or "filesort" in extra or "temporary" in extra
+    return (f"{'⚠️ ' if bad else ''}{row.get('table')}: type={row.get('type')} key={row.get('key')} "
+            f"rows={row.get('rows')}{' ' + extra if extra else ''}")
+
+async def explain_slowest(top: int = EXPLAIN_TOP):
+    """Прогоняет EXPLAIN по самому медленному экземпляру top самых дорогих запросов."""
+    candidates = [stat for _, stat in query_report(len(_query_stats)) if stat["sample"]][:top]
+    if not candidates:
+        return
+    async with acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            for stat in candidates:
+                query, args = stat["sample"]
+                try:
+                    await cur.execute("EXPLAIN " + query, args)
+                    stat["plan"] = [_plan_line(row) for row in await cur.fetchall()]
+                except aiomysql.MySQLError as e:
+                    stat["plan"] = [f"EXPLAIN не удался: {e}"]
+
+_explain_task = None
+
+async def _explain_loop():
+    while True:
+        await asyncio.sleep(EXPLAIN_INTERVAL)
+        try:
+            await explain_slowest()
+        except Exception:
+            logger.exception("EXPLAIN медленных запросов не удался")
+
+async def start_query_sampler():
+    global _explain_task
+    if _explain_task is None and EXPLAIN_INTERVAL > 0:
+        _explain_task = asyncio.create_task(_explain_loop())
+
+async def stop_query_sampler():
+    global _explain_task
+    if _explain_task is not None:
+        _explain_task.cancel()
+        _explain_task = None
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+MIGRATIONS_LOCK = "si_bot_schema_migrations"
+MIGRATIONS_LOCK_TIMEOUT = int(os.getenv("MIGRATIONS_LOCK_TIMEOUT", "60"))
+
+# Ошибки, означающие, что изменение уже есть в базе (базы, созданные до
+# появления миграций): 1050 — таблица, 1060 — столбец, 1061 — индекс уже существует
+_ALREADY_APPLIED = {1050, 1060, 1061}
+
+def _sql_migration(path: Path):
+    statements = []
+    for chunk in path.read_text(encoding="utf-8").split(";"):
+        code = "\n".join(line for line in chunk.splitlines() if not line.strip().startswith("--"))
+        if code.strip():
+            statements.append(code.strip())
+
+    async def apply(cur):
+        for statement in statements:
+            try:
+                await cur.execute(statement)
+            except aiomysql.MySQLError as e:
+                if e.args[0] not in _ALREADY_APPLIED:
+                    raise
+    return apply
+
+def _py_migration(path: Path):
+    # Для миграций данных: модуль с корутиной upgrade(cur)
+    spec = importlib.util.spec_from_file_location(f"migrations.{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.upgrade
+
+def load_migrations():
+    """Список (версия, имя файла, корутина apply(cur)) в порядке применения."""
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.iterdir()):
+        if path.suffix == ".sql":
+            apply = _sql_migration(path)
+        elif path.suffix == ".py":
+            apply = _py_migration(path)
+        else:
+            continue
+        migrations.append((int(path.name.split("_", 1)[0]), path.name, apply))
+    return sorted(migrations, key=lambda m: m[0])
+
+async def _schema_version(cur) -> int:
     try:
+        await cur.execute("SELECT MAX(version) FROM schema_version")
+    except aiomysql.ProgrammingError as e:
+        if e.args[0] == 1146:  # таблицы ещё нет
+            return 0
+        raise
+    row = await cur.fetchone()
+    return row[0] or 0
+
+async def run_migrations():
+    """Применяет недостающие миграции. Если схема актуальна, DDL не выполняется."""
+    migrations = load_migrations()
+    latest = migrations[-1][0] if migrations else 0
+    async with acquire() as conn:
         async with conn.cursor() as cur:
-            # Таблица пользователей
-            await cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    tg_id BIGINT PRIMARY KEY,
-                    username VARCHAR(255),
-                    full_name VARCHAR(255),
-                    `rank` VARCHAR(50) DEFAULT 'Гость',
-                    balance INT DEFAULT 0,
-                    blocked BOOLEAN DEFAULT FALSE
-                )
-            """)
-            # Таблица событий
-            await cur.execute("""
-                CREATE TABLE IF NOT EXISTS events (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    title TEXT,
-                    description TEXT,
-                    prize TEXT,
-                    datetime TEXT,
-                    media TEXT,
-                    creator_id BIGINT
-                )
-            """)
-            # Таблица обращений
-            await cur.execute("""
-                CREATE TABLE IF NOT EXISTS contacts (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tg_id BIGINT,
-                    username VARCHAR(255),
-                    full_name VARCHAR(255),
-                    message TEXT,
-                    answered BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            if await _schema_version(cur) >= latest:
+                return
 
-            # Новая таблица промокодов
-            await cur.execute("""
-                CREATE TABLE IF NOT EXISTS promo_codes (
-                    code VARCHAR(50) PRIMARY KEY,
-                    reward INT NOT NULL
-                )
-            """)
-
-            # Таблица использования промокодов
-            await cur.execute("""
-                CREATE TABLE IF NOT EXISTS promo_codes_usage (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    tg_id BIGINT,
-                    code VARCHAR(50),
-                    used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE KEY (tg_id, code)
+            # Несколько процессов могут стартовать одновременно — мигрирует один
+            await cur.execute("SELECT GET_LOCK(%s, %s)", (MIGRATIONS_LOCK, MIGRATIONS_LOCK_TIMEOUT))
+            if (await cur.fetchone())[0] != 1:
+                raise RuntimeError("Не удалось получить блокировку для миграций схемы")
+            try:
+                await cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INT PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                current = await _schema_version(cur)
+                for version, name, apply in migrations:
+                    if version <= current:
+                        continue
+                    logger.info("Применяется миграция %s", name)
+                    await apply(cur)
+                    await cur.execute(
+                        "INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+            finally:
+                await cur.execute("SELECT RELEASE_LOCK(%s)", (MIGRATIONS_LOCK,))
+                await cur.fetchone()
+
+async def init_db():
+    await create_pool()
+    await run_migrations()
+
+async def mark_users_unreachable(tg_ids, chunk_size: int = 500):
+    """Пакетно помечает пользователей, до которых невозможно доставить сообщение."""
+    tg_ids = list(tg_ids)
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            for i in range(0, len(tg_ids), chunk_size):
+                chunk = tg_ids[i:i + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                await cur.execute(
+                    f"UPDATE users SET unreachable = TRUE WHERE tg_id IN ({placeholders})",
+                    chunk
                 )
-            """)
-    finally:
-        conn.close()
+        await conn.commit()
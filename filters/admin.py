@@ -0,0 +1,18 @@
+from typing import Optional
+
+from aiogram.filters import Filter
+from aiogram.types import Message
+
+ADMIN_ID = 1016554091
+# Кроме ADMIN_ID, админские команды доступны этому рангу
+ADMIN_RANK = "Генеральный директор"
+
+
+class IsAdmin(Filter):
+    """Отправитель — администрация: ADMIN_ID или ранг ADMIN_RANK.
+
+    Ранг берётся из строки, подставленной UserRegistrationMiddleware (data["user"]).
+    """
+
+    async def __call__(self, message: Message, user: Optional[dict] = None) -> bool:
+        return message.from_user.id == ADMIN_ID or (user is not None and user["rank"] == ADMIN_RANK)
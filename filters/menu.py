@@ -0,0 +1,14 @@
+from typing import Optional
+
+from keyboards import MENU_TEXTS
+
+_BUTTONS = frozenset(MENU_TEXTS)
+
+
+def menu_button(text: Optional[str]) -> Optional[str]:
+    """Кнопка главного меню, которой соответствует текст, или None.
+
+    Только точное совпадение: набранное вручную «аккаунт» кнопкой не считается.
+    """
+    return text if text in _BUTTONS else None
+
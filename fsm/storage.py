@@ -0,0 +1,179 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DEFAULT_DESTINY, StorageKey, StateType
+from aiogram.fsm.storage.memory import DisabledEventIsolation, MemoryStorage
+
+from database import acquire
+from services.cache import TTLCache
+
+# memory | mysql | redis
+FSM_STORAGE = os.getenv("FSM_STORAGE", "mysql").lower()
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+# Ограничивает устаревание кэша, если один чат обслуживают несколько процессов
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "300"))
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+def _key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+class MySQLStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_storage; переживает перезапуск и общее для всех процессов.
+
+    Строка живёт, только пока у пользователя есть состояние или данные:
+    пустая удаляется, иначе таблица росла бы на строку на каждого, кто
+    хоть раз открывал форму.
+    """
+
+    async def _reset(self, key: StorageKey, column: str, empty: str) -> None:
+        # Второе поле тоже пустое — удаляем строку; иначе обнуляем только своё.
+        # UPDATE, а не upsert: для отсутствующей строки сбрасывать нечего
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"DELETE FROM fsm_storage WHERE storage_key = %s AND ({empty})", (_key(key),))
+                if cur.rowcount == 0:
+                    await cur.execute(f"UPDATE fsm_storage SET {column} = NULL WHERE storage_key = %s", (_key(key),))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if state is None:
+            await self._reset(key, "state", "data IS NULL OR data = '{}'")
+            return
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    INSERT INTO fsm_storage (storage_key, state) VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE state = VALUES(state)
+                """, (_key(key), _state_name(state)))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT state FROM fsm_storage WHERE storage_key = %s", (_key(key),))
+                row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not data:
+            await self._reset(key, "data", "state IS NULL")
+            return
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    INSERT INTO fsm_storage (storage_key, data) VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE data = VALUES(data)
+                """, (_key(key), json.dumps(data, ensure_ascii=False)))
+
+    async def clear(self, key: StorageKey) -> None:
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM fsm_storage WHERE storage_key = %s", (_key(key),))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT data FROM fsm_storage WHERE storage_key = %s", (_key(key),))
+                row = await cur.fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    async def close(self) -> None:
+        # Пулом соединений владеет database.py
+        pass
+
+
+class CachedStorage(BaseStorage):
+    """Write-through LRU-кэш поверх любого хранилища: чтения обслуживаются из памяти,
+    записи сразу уходят во внутреннее хранилище."""
+
+    def __init__(self, inner: BaseStorage, maxsize: int = FSM_CACHE_SIZE, ttl: float = FSM_CACHE_TTL):
+        self.inner = inner
+        self._states = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._data = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.inner.set_state(key, state)
+        self._states.set(key, _state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        # None — тоже валидное значение, поэтому отсутствие отличаем через default
+        state = self._states.get(key, default=self)
+        if state is self:
+            state = await self.inner.get_state(key)
+            self._states.set(key, state)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.inner.set_data(key, data)
+        self._data.set(key, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = self._data.get(key)
+        if data is None:
+            data = await self.inner.get_data(key)
+            self._data.set(key, data)
+        return data.copy()
+
+    async def clear(self, key: StorageKey) -> None:
+        clear = getattr(self.inner, "clear", None)
+        if clear is not None:
+            await clear(key)
+        else:
+            await self.inner.set_state(key, None)
+            await self.inner.set_data(key, {})
+        self._states.set(key, None)
+        self._data.set(key, {})
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+class ClearableFSMContext(FSMContext):
+    """FSMContext, у которого clear() — одна операция хранилища, если оно её умеет.
+
+    Штатный clear() — это set_state(None) и затем set_data({}), то есть две записи.
+    """
+
+    async def clear(self) -> None:
+        clear = getattr(self.storage, "clear", None)
+        if clear is None:
+            await super().clear()
+        else:
+            await clear(self.key)
+
+
+class FSMMiddleware(FSMContextMiddleware):
+    """FSMContextMiddleware, раздающий ClearableFSMContext."""
+
+    def __init__(self, storage: BaseStorage, **kwargs):
+        kwargs.setdefault("events_isolation", DisabledEventIsolation())
+        super().__init__(storage=storage, **kwargs)
+
+    def get_context(self, bot: Bot, chat_id: int, user_id: int, thread_id: Optional[int] = None,
+                    destiny: str = DEFAULT_DESTINY) -> FSMContext:
+        return ClearableFSMContext(
+            storage=self.storage,
+            key=StorageKey(user_id=user_id, chat_id=chat_id, bot_id=bot.id, thread_id=thread_id, destiny=destiny),
+        )
+
+
+def create_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """Хранилище FSM по переменной окружения FSM_STORAGE."""
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "mysql":
+        return CachedStorage(MySQLStorage())
+    if kind == "redis":
+        # Необязательная зависимость: pip install redis
+        from aiogram.fsm.storage.redis import RedisStorage
+        return CachedStorage(RedisStorage.from_url(FSM_REDIS_URL))
+    raise ValueError(f"Неизвестный FSM_STORAGE: {kind!r} (ожидается memory, mysql или redis)")
@@ -1,18 +1,23 @@
+import logging
 import os
-from aiogram import Router, F, types
+from aiogram import Router, types
+from aiogram.filters import StateFilter
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import get_connection
+from database import acquire
+from handlers import menu
+from keyboards import BTN_CONTACT
 
 router = Router()
 ADMIN_ID = 1016554091  # ID администрации
+logger = logging.getLogger(__name__)
 
 # Группа состояний для обращения
 class ContactState(StatesGroup):
     waiting_for_message = State()
 
-@router.message(F.text == "📩 Связь")
+@menu.router.message.button(BTN_CONTACT)
 async def contact_intro(message: Message, state: FSMContext):
     # Администратор не может отправлять обращения
     if message.from_user.id == ADMIN_ID:
@@ -20,23 +25,11 @@ async def contact_intro(message: Message, state: FSMContext):
         return
     await state.set_state(ContactState.waiting_for_message)
     await message.answer("✉️ Напиши сообщение, которое ты хочешь отправить администрации.")
-    print(f"[CONTACT] Пользователь {message.from_user.id} перешёл в режим отправки сообщения.")
+    logger.debug("Пользователь перешёл в режим отправки сообщения")
 
-@router.message(ContactState.waiting_for_message)
+@router.message(StateFilter(ContactState.waiting_for_message))
 async def receive_contact_message(message: Message, state: FSMContext):
-    conn = await get_connection()
     try:
-        # Регистрируем пользователя, если его нет в базе
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT * FROM users WHERE tg_id = %s", (message.from_user.id,))
-            user = await cur.fetchone()
-            if not user:
-                await cur.execute(
-                    "INSERT INTO users (tg_id, username, full_name, `rank`, balance) VALUES (%s, %s, %s, 'Гость', 0)",
-                    (message.from_user.id,
-                     message.from_user.username or "-",
-                     message.from_user.full_name or "-")
-                )
         # Определяем, что именно отправил пользователь
         if message.content_type == 'text':
             content = message.text
@@ -56,16 +49,17 @@ async def receive_contact_message(message: Message, state: FSMContext):
                 f"{content}\n\n"
                 f"<code>UID:{message.from_user.id}</code>")
 
-        # Сохраняем обращение в таблицу contacts
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "INSERT INTO contacts (tg_id, username, full_name, message, answered) VALUES (%s, %s, %s, %s, FALSE)",
-                (message.from_user.id,
-                 message.from_user.username or "-",
-                 message.from_user.full_name or "-",
-                 content)
-            )
-        await conn.commit()
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                # Сохраняем обращение в таблицу contacts
+                await cur.execute(
+                    "INSERT INTO contacts (tg_id, username, full_name, message, answered) VALUES (%s, %s, %s, %s, FALSE)",
+                    (message.from_user.id,
+                     message.from_user.username or "-",
+                     message.from_user.full_name or "-",
+                     content)
+                )
+            await conn.commit()
 
         # Отправляем обращение администрации:
         # Если сообщение содержит медиа – пересылаем оригинальное сообщение,
@@ -79,11 +73,9 @@ async def receive_contact_message(message: Message, state: FSMContext):
         else:
             forwarded = await message.bot.send_message(ADMIN_ID, text, parse_mode="HTML")
         await message.answer("📨 Сообщение отправлено администрации.")
-        print(f"[CONTACT] Сообщение от {message.from_user.id} отправлено администрации (msg id: {forwarded.message_id}).")
-    except Exception as e:
-        print("[CONTACT ERROR]", e)
+        logger.info("Обращение отправлено администрации (msg id: %s)", forwarded.message_id)
+    except Exception:
+        logger.exception("Не удалось отправить обращение")
         await message.answer("❗ Не удалось отправить сообщение администрации.")
     finally:
         await state.clear()
-        if conn:
-            await conn.close()
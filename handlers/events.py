@@ -1,53 +1,98 @@
-import aiomysql
+import logging
 from aiogram import Router, types, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
-from database import get_connection
+from handlers import menu
+from keyboards import BTN_EVENTS
+from services.cache import TTLCache
+from services.events_feed import get_event_cards, UPCOMING, PAST, EVENTS_PAGE_SIZE, CARD_SEPARATOR
 
 router = Router()
 
-async def safe_close(conn):
-    if conn:
-        try:
-            ret = conn.close()
-            if ret is not None and hasattr(ret, '__await__'):
-                await ret
-        except Exception as ex:
-            print("safe_close error:", ex)
-
-async def ensure_published_column(conn):
-    async with conn.cursor() as cur:
-        await cur.execute("SHOW COLUMNS FROM events LIKE 'published'")
-        col = await cur.fetchone()
-        if not col:
-            print("[DB] Столбец 'published' не найден. Добавляем его ...")
-            await cur.execute("ALTER TABLE events ADD COLUMN published TEXT DEFAULT '{}'")
-            await conn.commit()
-            print("[DB] Столбец 'published' успешно добавлен.")
-
-@router.message(F.text == "🎯 События")
+logger = logging.getLogger(__name__)
+
+# Альбом над навигационным сообщением: (chat_id, message_id навигации) -> [message_id фото].
+# Обновления одного чата обрабатывает один процесс, поэтому хватает памяти процесса
+_albums = TTLCache(maxsize=10000, ttl=2 * 24 * 3600)
+
+def build_page(cards, page: int, kind: str = UPCOMING):
+    """Разбивает страницу ленты на альбом фото-событий и текст с навигацией."""
+    pages = max(1, (len(cards) + EVENTS_PAGE_SIZE - 1) // EVENTS_PAGE_SIZE)
+    page = min(max(page, 1), pages)
+    chunk = cards[(page - 1) * EVENTS_PAGE_SIZE:page * EVENTS_PAGE_SIZE]
+
+    # Карточки уже укладываются в лимиты Telegram (services/events_feed.render_event)
+    album = [InputMediaPhoto(media=photo, caption=text) for text, photo in chunk if photo]
+    texts = [text for text, photo in chunk if not photo]
+    title = "Предстоящие события" if kind == UPCOMING else "Прошедшие события"
+    header = f"🎯 <b>{title}</b> — страница {page}/{pages}"
+    if not cards:
+        header = f"🎯 <b>{title}</b>\n\nПока ничего нет."
+    body = CARD_SEPARATOR.join([header] + texts)
+
+    nav = []
+    if page > 1:
+        nav.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"events_feed:{kind}:{page - 1}"))
+    if page < pages:
+        nav.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"events_feed:{kind}:{page + 1}"))
+    switch = (InlineKeyboardButton(text="🕘 Прошедшие", callback_data=f"events_feed:{PAST}:1") if kind == UPCOMING
+              else InlineKeyboardButton(text="🎯 Предстоящие", callback_data=f"events_feed:{UPCOMING}:1"))
+    kb = InlineKeyboardMarkup(inline_keyboard=[row for row in (nav, [switch]) if row])
+    return album, body, kb
+
+async def send_page(message: Message, album, body: str, kb):
+    """Альбом страницы и под ним навигационное сообщение; запоминает, какие фото к нему относятся."""
+    # Одно фото альбомом не отправить — для него обычный send_photo
+    if len(album) == 1:
+        photos = [await message.answer_photo(photo=album[0].media, caption=album[0].caption)]
+    elif album:
+        photos = await message.answer_media_group(media=album)
+    else:
+        photos = []
+    nav = await message.answer(body, reply_markup=kb)
+    if photos:
+        _albums.set((nav.chat.id, nav.message_id), [photo.message_id for photo in photos])
+
+@menu.router.message.button(BTN_EVENTS, flags={"rate_limit": {"rate": 0.5, "burst": 3}})
 async def show_events(message: Message):
-    conn = await get_connection()
+    cards = await get_event_cards(UPCOMING)
+    album, body, kb = build_page(cards, 1, UPCOMING)
+    await send_page(message, album, body, kb)
+
+@router.callback_query(F.data.startswith("events_feed:"), flags={"rate_limit": {"rate": 1, "burst": 5}})
+async def events_feed_page(query: types.CallbackQuery):
     try:
-        await ensure_published_column(conn)
-        
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute("SELECT * FROM events ORDER BY id DESC")
-            events = await cur.fetchall()
-
-            if not events:
-                await message.answer("❗ Нет активных событий.")
-                return
-
-            for event in events:
-                text = (
-                    f"📢 <b>{event['title']}</b>\n\n"
-                    f"{event['description']}\n\n"
-                    f"🏆 Приз: {event['prize']}\n"
-                    f"📅 Дата: {event['datetime']}"
-                )
-                if event.get('media'):
-                    await message.answer_photo(photo=event['media'], caption=text)
-                else:
-                    await message.answer(text)
+        _, kind, page = query.data.split(":", 2)
+        page = int(page)
+    except ValueError:
+        await query.answer("Неверные данные.", show_alert=True)
+        return
+    if kind not in (UPCOMING, PAST):
+        await query.answer("Неверные данные.", show_alert=True)
+        return
+
+    cards = await get_event_cards(kind)
+    album, body, kb = build_page(cards, page, kind)
+    nav = query.message
+    shown = _albums.get((nav.chat.id, nav.message_id))
+    try:
+        if not album and not shown:
+            # Без фото навигационное сообщение просто редактируется на месте
+            try:
+                await nav.edit_text(body, reply_markup=kb)
+            except TelegramBadRequest as e:
+                # Повторное нажатие на ту же страницу
+                if "message is not modified" not in str(e):
+                    raise
+            return
+        # Альбом не отредактировать — старая страница удаляется целиком,
+        # чтобы альбомы не копились над навигацией
+        _albums.invalidate((nav.chat.id, nav.message_id))
+        try:
+            await query.bot.delete_messages(nav.chat.id, (shown or []) + [nav.message_id])
+        except TelegramBadRequest as e:
+            # Например, сообщения старше 48 часов: новая страница всё равно нужна
+            logger.warning("Не удалось удалить прошлую страницу ленты: %s", e)
+        await send_page(nav, album, body, kb)
     finally:
-        conn.close()
+        await query.answer()
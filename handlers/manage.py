@@ -1,25 +1,34 @@
+import asyncio
 import os
-import json
+import html
+import logging
+from datetime import datetime, timedelta
 from aiogram import Router, types, F
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+from aiogram.filters import Command, Filter, StateFilter
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiomysql import DictCursor
-from database import get_connection, safe_close
+from database import acquire, mark_users_unreachable, query_report
+from filters.admin import ADMIN_ID, IsAdmin
+from handlers import menu
+from keyboards import BTN_MANAGE
+from services.broadcast import broadcast_copy
+from services.contacts import parse_query, search_contacts, snippet
+from services.users import invalidate_user
+from services.ledger import credit, current_balance, debit_up_to
+from services.publishing import PostGone, load_published, publish_event, update_published, delete_published
+from services.promo import get_catalog, invalidate_promo_codes, generate_batch, normalize_code, PROMO_BATCH_MAX
+from services.events_feed import (
+    invalidate_events, parse_event_datetime, file_id_type, DATETIME_HINT, MEDIA_PHOTO, MEDIA_VOICE,
+)
+from services.pagination import NEXT, PREV, encode_cursor, dt_to_int, int_to_dt, parse_nav, fetch_keyset_page
 
 router = Router()
 
-ADMIN_ID = 1016554091
-PUBLISH_CHANNEL_ID = -1002292957980
+PER_PAGE = 9
 
-async def safe_close(conn):
-    if conn:
-        try:
-            ret = conn.close()
-            if ret is not None and hasattr(ret, '__await__'):
-                await ret
-        except Exception as ex:
-            print("safe_close error:", ex)
+logger = logging.getLogger(__name__)
 
 class BroadcastState(StatesGroup):
     waiting_for_broadcast_message = State()
@@ -27,6 +36,9 @@ class BroadcastState(StatesGroup):
 class ContactReplyState(StatesGroup):
     waiting_for_reply = State()
 
+class ContactSearchState(StatesGroup):
+    waiting_for_query = State()
+
 class EventCreation(StatesGroup):
     waiting_for_title = State()
     waiting_for_datetime = State()
@@ -45,67 +57,99 @@ class DiamondsState(StatesGroup):
 
 class PromoCreationState(StatesGroup):
     waiting_for_promo_data = State()
-
-async def is_user_blocked(user_id: int) -> bool:
-    conn = await get_connection()
-    try:
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT blocked FROM users WHERE tg_id = %s", (user_id,))
-            result = await cur.fetchone()
-            return bool(result[0]) if result is not None else False
-    except Exception as e:
-        print("Error in is_user_blocked:", e)
-        return False
-    finally:
-        await safe_close(conn)
-
-@router.message(lambda m: m.chat.type == "private" and m.from_user.id != ADMIN_ID 
-                           and m.text not in ["🎟️ Промокоды", "⚙️ Управление"])
-async def handle_incoming_contact(m: Message, state: FSMContext):
-    if await state.get_state() is not None:
+    waiting_for_batch_params = State()
+
+# Диагностика. Стоит выше handle_incoming_contact, иначе команду перехватит приём обращений
+SLOW_REPORT_MAX = 20
+
+@router.message(Command("slow"), IsAdmin())
+async def slow_queries_report(message: Message):
+    parts = message.text.split()
+    limit = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 10
+    report = query_report(min(limit, SLOW_REPORT_MAX))
+    if not report:
+        await message.answer("Статистики запросов пока нет.")
         return
-    if await is_user_blocked(m.from_user.id):
-        await m.answer("🚫 Отказано в доступе.")
+    text = "🐢 <b>Самые дорогие запросы</b>"
+    for i, (fp, stat) in enumerate(report, 1):
+        avg_ms = stat["total"] / stat["count"] * 1000
+        block = (f"<b>{i}.</b> {stat['count']} раз, всего {stat['total']:.2f} с, "
+                 f"сред. {avg_ms:.1f} мс, макс. {stat['max'] * 1000:.1f} мс, "
+                 f"строк {stat['rows'] / stat['count']:.1f}/запрос"
+                 f"{', ошибок ' + str(stat['errors']) if stat['errors'] else ''}\n"
+                 f"<code>{html.escape(fp[:300])}</code>")
+        if stat["plan"]:
+            block += "\n" + "\n".join(html.escape(line) for line in stat["plan"])
+        # Обрезать HTML посередине нельзя — лишние блоки просто не выводим
+        if len(text) + len(block) + 2 > 4096:
+            break
+        text += "\n\n" + block
+    await message.answer(text)
+
+# Поиск по обращениям — тоже команда, поэтому тоже выше handle_incoming_contact
+SEARCH_HINT = ("Поиск по всем обращениям, включая отвеченные:\n"
+               "<code>/find текст</code> — по словам в тексте\n"
+               "<code>/find @username</code> — по автору\n"
+               "<code>/find 123456789</code> — по tg_id автора")
+
+@router.message(Command("find"), IsAdmin())
+async def find_contacts_command(message: Message, state: FSMContext):
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer(SEARCH_HINT)
         return
-    conn = await get_connection()
+    await send_contacts_search(message, state, parts[1])
+
+# Команды администрации от остальных: отказ, а не приём обращения
+@router.message(Command("slow", "find"))
+async def admin_command_denied(message: Message):
+    await message.answer("🚫 Отказано в доступе.")
+
+class IncomingContact(Filter):
+    """Личное сообщение не от администрации, вне FSM-диалога и не кнопка меню.
+
+    Только дешёвые проверки без I/O: состояние уже прочитано FSM-middleware
+    (raw_state), кнопка — MenuButtonMiddleware (menu_button). Сообщения
+    в состоянии не перехватываются и доходят до хендлеров состояний ниже
+    по роутеру.
+    """
+
+    async def __call__(self, message: Message, raw_state: str = None, menu_button: str = None) -> bool:
+        return (raw_state is None
+                and menu_button is None
+                and message.chat.type == "private"
+                and message.from_user.id != ADMIN_ID)
+
+@router.message(IncomingContact(), flags={"rate_limit": {"rate": 0.1, "burst": 3}})
+async def handle_incoming_contact(m: Message, user: dict):
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT `rank` FROM users WHERE tg_id = %s", (m.from_user.id,))
-            result = await cur.fetchone()
-        if result is None or result[0] == "Гость":
+        # Блокировка и ранг берутся из строки, подставленной UserRegistrationMiddleware
+        if user["blocked"] or user["rank"] == "Гость":
             await m.answer("🚫 Отказано в доступе.")
             return
 
         sender_info = f"{m.from_user.full_name} (@{m.from_user.username})" if m.from_user.username else m.from_user.full_name
         content = m.text if m.content_type == "text" else f"[Медиа: {m.content_type}]\nОтправитель: {sender_info}"
 
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "INSERT INTO contacts (tg_id, full_name, username, message, answered) VALUES (%s, %s, %s, %s, %s)",
-                (m.from_user.id, m.from_user.full_name, m.from_user.username, content, False)
-            )
-            await conn.commit()
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "INSERT INTO contacts (tg_id, full_name, username, message, answered) VALUES (%s, %s, %s, %s, %s)",
+                    (m.from_user.id, m.from_user.full_name, m.from_user.username, content, False)
+                )
+                await conn.commit()
 
         await m.answer("Ваше обращение принято.")
 
     except Exception as e:
         await m.answer(f"Ошибка при отправке обращения: <code>{e}</code>")
-    finally:
-        await safe_close(conn)
 
-@router.message(lambda message: message.text and message.text.strip().lower() == "⚙️ управление")
-async def admin_panel(message: Message, state: FSMContext):
+@menu.router.message.button(BTN_MANAGE)
+async def admin_panel(message: Message, state: FSMContext, user: dict):
     await state.clear()
-    print("[Admin] Запуск панели для", message.from_user.id)
-    conn = await get_connection()
-    try:
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT `rank` FROM users WHERE tg_id = %s", (message.from_user.id,))
-            result = await cur.fetchone()
-            if not result:
-                await message.answer("❗ Пользователь не найден. Используйте /start для регистрации.")
-                return
-            user_rank = result[0]
+    logger.debug("Запуск панели управления")
+    try:
+        user_rank = user["rank"]
         current_state = await state.get_state()
         if current_state is None and user_rank != "Генеральный директор":
             await message.answer("🚫 Отказано в доступе.")
@@ -118,32 +162,40 @@ async def admin_panel(message: Message, state: FSMContext):
             [InlineKeyboardButton(text="📢 Объявления", callback_data="admin_broadcast")]
         ])
         await message.answer("Панель управления. Выберите раздел:", reply_markup=kb)
-        print("[Admin] Меню выведено")
+        logger.debug("Меню выведено")
     except Exception as e:
         await message.answer(f"Ошибка в админ-панели:\n<code>{e}</code>")
-        print("[Admin ERROR]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка в админ-панели")
+
+def page_nav_row(prefix: str, rows, has_prev: bool, has_next: bool, cursor_of):
+    """Кнопки листания; курсор граничной строки зашит прямо в callback_data."""
+    row = []
+    if rows and has_prev:
+        row.append(InlineKeyboardButton(text="⬅️ Предыдущая страница", callback_data=f"{prefix}:{PREV}:{cursor_of(rows[0])}"))
+    if rows and has_next:
+        row.append(InlineKeyboardButton(text="➡️ Следующая страница", callback_data=f"{prefix}:{NEXT}:{cursor_of(rows[-1])}"))
+    return row
 
 # Обращения
-async def send_contacts_list_to_admin(dest_message: Message, state: FSMContext):
-    print("[Contacts] Запрос списка обращений")
-    conn = await get_connection()
-    try:
-        data = await state.get_data()
-        page = data.get("contacts_page", 1)
-        per_page = 9
-        offset = (page - 1) * per_page
-
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute(
-                "SELECT * FROM contacts WHERE answered = FALSE ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (per_page, offset)
-            )
-            contacts = await cur.fetchall()
+def contact_cursor(contact) -> str:
+    return encode_cursor(dt_to_int(contact["created_at"]), contact["id"])
 
+async def send_contacts_list_to_admin(dest_message: Message, cursor=None, direction=NEXT):
+    logger.debug("Запрос списка обращений")
+    try:
+        if cursor is not None:
+            cursor = (int_to_dt(cursor[0]), cursor[1])
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                contacts, has_prev, has_next = await fetch_keyset_page(
+                    cur, "contacts", ("created_at", "id"), PER_PAGE, cursor, direction,
+                    where="answered = FALSE"
+                )
+
+        search_row = [InlineKeyboardButton(text="🔎 Поиск", callback_data="contacts_search")]
         if not contacts:
-            await dest_message.answer("Нет новых обращений.")
+            await dest_message.answer("Нет новых обращений.",
+                                      reply_markup=InlineKeyboardMarkup(inline_keyboard=[search_row]))
             return
 
         buttons = []
@@ -157,32 +209,92 @@ async def send_contacts_list_to_admin(dest_message: Message, state: FSMContext):
             btn_text = f"{full_name} (@{username} | {cid}) {date_str}"
             buttons.append([InlineKeyboardButton(text=btn_text, callback_data=f"contact_reply:{cid}")])
 
-        if len(contacts) == per_page:
-            buttons.append([InlineKeyboardButton(text="➡️ Следующая страница", callback_data="contacts_page:next")])
+        nav = page_nav_row("contacts_page", contacts, has_prev, has_next, contact_cursor)
+        if nav:
+            buttons.append(nav)
+        buttons.append(search_row)
 
         kb = InlineKeyboardMarkup(inline_keyboard=buttons)
         await dest_message.answer("Обращения:", reply_markup=kb)
-        print("[Contacts] Список обращений отправлен")
+        logger.debug("Список обращений отправлен")
 
     except Exception as e:
         await dest_message.answer(f"Ошибка при получении обращений: {e}")
-        print("[Contacts ERROR]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при получении обращений")
 
 @router.callback_query(lambda q: q.data == "admin_contacts_list")
 async def admin_contacts_list_callback(query: types.CallbackQuery, state: FSMContext):
-    await send_contacts_list_to_admin(query.message, state)
+    await send_contacts_list_to_admin(query.message)
     await query.answer()
 
 @router.callback_query(lambda q: q.data and q.data.startswith("contacts_page:"))
 async def contacts_page_nav(query: types.CallbackQuery, state: FSMContext):
-    direction = query.data.split(":", 1)[1]
-    data = await state.get_data()
-    page = data.get("contacts_page", 1)
-    page = page + 1 if direction == "next" else max(1, page - 1)
-    await state.update_data(contacts_page=page)
-    await send_contacts_list_to_admin(query.message, state)
+    nav = parse_nav(query.data)
+    if nav is None:
+        await query.answer("Неверные данные.", show_alert=True)
+        return
+    direction, cursor = nav
+    await send_contacts_list_to_admin(query.message, cursor, direction)
+    await query.answer()
+
+def format_dt(dt) -> str:
+    return dt.strftime("%d.%m.%Y %H:%M") if dt else ""
+
+async def send_contacts_search(dest_message: Message, state: FSMContext, query: str, cursor=None, direction=NEXT):
+    parsed = parse_query(query)
+    if parsed is None:
+        await dest_message.answer("Слишком короткий запрос: нужны слова от 3 букв, @username или tg_id.")
+        return
+    where, params, terms = parsed
+    # Строка поиска остаётся в данных FSM: в callback_data листания помещается только курсор
+    await state.update_data(contacts_search=query)
+    try:
+        rows, has_prev, has_next = await search_contacts(where, params, PER_PAGE, cursor, direction)
+    except Exception as e:
+        await dest_message.answer(f"Ошибка при поиске обращений: {e}")
+        logger.exception("Ошибка при поиске обращений")
+        return
+
+    title = html.escape(query.strip())
+    if not rows:
+        await dest_message.answer(f"По запросу «{title}» ничего не найдено.")
+        return
+    lines = [f"🔎 <b>Обращения по запросу «{title}»</b>"]
+    buttons = []
+    for row in rows:
+        mark = "✅" if row["answered"] else "🕓"
+        author = html.escape(row["full_name"] or "-")
+        if row["username"] and row["username"] != "-":
+            author += f" (@{html.escape(row['username'])})"
+        lines.append(f"{mark} <b>#{row['id']}</b> {author}, {format_dt(row['created_at'])}\n"
+                     f"{snippet(row['message'], terms)}")
+        buttons.append([InlineKeyboardButton(text=f"{mark} #{row['id']} {row['full_name'] or '-'}",
+                                             callback_data=f"contact_reply:{row['id']}")])
+    nav = page_nav_row("contacts_find", rows, has_prev, has_next, lambda row: encode_cursor(row["id"]))
+    if nav:
+        buttons.append(nav)
+    await dest_message.answer("\n\n".join(lines), reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
+@router.callback_query(lambda q: q.data == "contacts_search")
+async def contacts_search_callback(query: types.CallbackQuery, state: FSMContext):
+    await state.set_state(ContactSearchState.waiting_for_query)
+    await query.message.answer(SEARCH_HINT.replace("/find ", "") + "\n\nВведите запрос:")
+    await query.answer()
+
+@router.message(StateFilter(ContactSearchState.waiting_for_query))
+async def process_contacts_search(message: Message, state: FSMContext):
+    await state.set_state(None)
+    await send_contacts_search(message, state, message.text or "")
+
+@router.callback_query(lambda q: q.data and q.data.startswith("contacts_find:"))
+async def contacts_find_nav(query: types.CallbackQuery, state: FSMContext):
+    nav = parse_nav(query.data)
+    search = (await state.get_data()).get("contacts_search")
+    if nav is None or not search:
+        await query.answer("Поиск устарел, повторите /find.", show_alert=True)
+        return
+    direction, cursor = nav
+    await send_contacts_search(query.message, state, search, cursor, direction)
     await query.answer()
 
 @router.callback_query(lambda q: q.data and q.data.startswith("contact_reply:"))
@@ -195,11 +307,11 @@ async def contact_reply_select(query: types.CallbackQuery, state: FSMContext):
         return
 
     await state.update_data(contact_reply_id=cid)
-    conn = await get_connection()
     try:
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM contacts WHERE id = %s", (cid,))
-            contact = await cur.fetchone()
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                await cur.execute("SELECT * FROM contacts WHERE id = %s", (cid,))
+                contact = await cur.fetchone()
 
         if contact:
             full_name = contact.get("full_name", "-")
@@ -235,9 +347,7 @@ async def contact_reply_select(query: types.CallbackQuery, state: FSMContext):
 
     except Exception as e:
         await query.message.answer(f"Ошибка при получении обращения: {e}")
-        print("[Contacts ERROR]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при получении обращения")
 
     await state.set_state(ContactReplyState.waiting_for_reply)
     await query.answer("Ожидается ваш ответ.")
@@ -257,24 +367,22 @@ async def delete_contact(query: types.CallbackQuery, state: FSMContext):
         await query.answer("Ошибка: Неверный ID.", show_alert=True)
         return
 
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("DELETE FROM contacts WHERE id = %s", (cid,))
-            await conn.commit()
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM contacts WHERE id = %s", (cid,))
+                await conn.commit()
 
         await query.message.answer("🗑 Обращение удалено.")
-        await send_contacts_list_to_admin(query.message, state)
+        await send_contacts_list_to_admin(query.message)
 
     except Exception as e:
         await query.message.answer(f"Ошибка при удалении обращения: {e}")
-        print("[Contacts ERROR при удалении]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при удалении обращения")
 
     await query.answer()
 
-@router.message(ContactReplyState.waiting_for_reply)
+@router.message(StateFilter(ContactReplyState.waiting_for_reply))
 async def process_contact_reply(message: Message, state: FSMContext):
     data = await state.get_data()
     cid = data.get("contact_reply_id")
@@ -283,15 +391,15 @@ async def process_contact_reply(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("UPDATE contacts SET answered = TRUE WHERE id = %s", (cid,))
-            await conn.commit()
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("UPDATE contacts SET answered = TRUE WHERE id = %s", (cid,))
+                await conn.commit()
 
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM contacts WHERE id = %s", (cid,))
-            contact = await cur.fetchone()
+            async with conn.cursor(DictCursor) as cur:
+                await cur.execute("SELECT * FROM contacts WHERE id = %s", (cid,))
+                contact = await cur.fetchone()
 
         if not contact:
             await message.answer("Обращение не найдено.")
@@ -318,38 +426,71 @@ async def process_contact_reply(message: Message, state: FSMContext):
 
     except Exception as e:
         await message.answer(f"Ошибка при отправке ответа: <code>{e}</code>")
-        print("[Contacts ERROR при ответе]", e)
+        logger.exception("Ошибка при ответе на обращение")
     finally:
         await state.clear()
-        await safe_close(conn)
-        await send_contacts_list_to_admin(message, state)
+        await send_contacts_list_to_admin(message)
 
 # Промокоды
+PROMO_LIST_LIMIT = 30
+PROMO_LIMITS_HINT = "Необязательно: <b>| Макс. активаций | Дней действия</b> (0 — без ограничения)."
+
+def parse_promo_limits(fields):
+    """[макс. активаций, дней действия] -> (max_uses, expires_at); 0 или '-' — без ограничения."""
+    values = []
+    for field in fields:
+        value = 0 if field in ("", "-") else int(field)
+        if value < 0:
+            raise ValueError(field)
+        values.append(value or None)
+    max_uses, days = (values + [None, None])[:2]
+    expires_at = datetime.now() + timedelta(days=days) if days else None
+    return max_uses, expires_at
+
+def describe_limits(max_uses, expires_at) -> str:
+    parts = []
+    if max_uses:
+        parts.append(f"до {max_uses} акт.")
+    if expires_at:
+        parts.append(f"до {expires_at:%d.%m.%Y}")
+    return f" ({', '.join(parts)})" if parts else ""
+
 @router.callback_query(lambda q: q.data == "admin_promo_codes")
 async def admin_promo_codes_callback(query: types.CallbackQuery, state: FSMContext):
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT code, reward FROM promo_codes ORDER BY code ASC")
-            promo_codes = await cur.fetchall()
-        
-        if not promo_codes:
+        catalog = await get_catalog()
+        single = sorted((code, promo) for code, promo in catalog.items() if promo.batch is None)
+        batches = {}
+        for promo in catalog.values():
+            if promo.batch is not None:
+                batches.setdefault(promo.batch, []).append(promo)
+
+        if not catalog:
             promo_list_text = "Нет активных промокодов."
         else:
             promo_list_text = "<b>Активные промокоды:</b>\n\n"
-            for code, reward in promo_codes:
-                promo_list_text += f"🔹 {code} — {reward} 💎\n"
+            for code, promo in single[:PROMO_LIST_LIMIT]:
+                promo_list_text += f"🔹 {code} — {promo.reward} 💎{describe_limits(promo.max_uses, promo.expires_at)}\n"
+            if len(single) > PROMO_LIST_LIMIT:
+                promo_list_text += f"…и ещё {len(single) - PROMO_LIST_LIMIT}\n"
+            for batch, promos in sorted(batches.items(), reverse=True)[:PROMO_LIST_LIMIT]:
+                first = promos[0]
+                promo_list_text += (f"📦 Пачка {batch}: {len(promos)} шт. по {first.reward} 💎"
+                                    f"{describe_limits(first.max_uses, first.expires_at)}\n")
 
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🎲 Сгенерировать пачку", callback_data="promo_batch")]
+        ])
         await query.message.answer(
-            f"{promo_list_text}\n\nВведите новый промокод в формате:\n\n<b>Название | Количество алмазов</b>"
+            f"{promo_list_text}\n\nВведите новый промокод в формате:\n\n<b>Название | Количество алмазов</b>\n\n"
+            f"{PROMO_LIMITS_HINT}",
+            reply_markup=kb
         )
         await state.set_state(PromoCreationState.waiting_for_promo_data)
     except Exception as e:
         await query.message.answer(f"Ошибка при загрузке промокодов: {e}")
-    finally:
-        await safe_close(conn)
 
-@router.message(PromoCreationState.waiting_for_promo_data)
+@router.message(StateFilter(PromoCreationState.waiting_for_promo_data))
 async def process_promo_creation(message: Message, state: FSMContext):
     if message.text.strip().lower() == "отмена":
         await state.clear()
@@ -357,41 +498,97 @@ async def process_promo_creation(message: Message, state: FSMContext):
         return
     
     parts = [s.strip() for s in message.text.split("|")]
-    if len(parts) != 2:
+    if len(parts) not in (2, 3, 4):
         await message.answer("Ошибка! Используйте формат:\n\n<b>Название | Количество алмазиков</b>\n\nИли напишите 'Отмена' для выхода.")
         return
     
-    code, reward_str = parts
+    # Как у пачек и при активации: код в верхнем регистре
+    code, reward_str = normalize_code(parts[0]), parts[1]
+    if not code:
+        await message.answer("Ошибка! Название промокода не может быть пустым.\n\nИли напишите 'Отмена' для выхода.")
+        return
     try:
         reward = int(reward_str)
     except ValueError:
         await message.answer("Ошибка! Количество алмазиков должно быть числом.\n\nИли напишите 'Отмена' для выхода.")
         return
+    try:
+        max_uses, expires_at = parse_promo_limits(parts[2:])
+    except ValueError:
+        await message.answer(f"Ошибка! Лимит и срок — целые неотрицательные числа.\n\n{PROMO_LIMITS_HINT}")
+        return
 
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("INSERT INTO promo_codes (code, reward) VALUES (%s, %s)", (code, reward))
-            await conn.commit()
-        await message.answer(f"✅ Промокод {code} на {reward} 💎 успешно добавлен!")
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "INSERT INTO promo_codes (code, reward, max_uses, expires_at) VALUES (%s, %s, %s, %s)",
+                    (code, reward, max_uses, expires_at)
+                )
+                await conn.commit()
+        await invalidate_promo_codes()
+        await message.answer(f"✅ Промокод {code} на {reward} 💎{describe_limits(max_uses, expires_at)} успешно добавлен!")
     except Exception as e:
         await message.answer(f"Ошибка при добавлении промокода: {e}")
     finally:
         await state.clear()
-        await safe_close(conn)
+
+@router.callback_query(lambda q: q.data == "promo_batch")
+async def promo_batch_callback(query: types.CallbackQuery, state: FSMContext):
+    await query.message.answer(
+        "Введите параметры пачки в формате:\n\n<b>Количество кодов | Количество алмазов</b>\n\n"
+        f"{PROMO_LIMITS_HINT}\n\nНапример: <code>1000 | 50 | 1 | 30</code> — тысяча одноразовых кодов на 30 дней."
+    )
+    await state.set_state(PromoCreationState.waiting_for_batch_params)
+    await query.answer()
+
+@router.message(StateFilter(PromoCreationState.waiting_for_batch_params))
+async def process_promo_batch(message: Message, state: FSMContext):
+    if message.text.strip().lower() == "отмена":
+        await state.clear()
+        await message.answer("🚫 Генерация промокодов отменена.")
+        return
+
+    parts = [s.strip() for s in message.text.split("|")]
+    try:
+        if len(parts) not in (2, 3, 4):
+            raise ValueError(message.text)
+        count, reward = int(parts[0]), int(parts[1])
+        max_uses, expires_at = parse_promo_limits(parts[2:])
+        if not 0 < count <= PROMO_BATCH_MAX:
+            raise ValueError(count)
+    except ValueError:
+        await message.answer(
+            f"Ошибка! Используйте формат:\n\n<b>Количество кодов | Количество алмазов</b>\n\n{PROMO_LIMITS_HINT}\n"
+            f"Кодов в пачке — от 1 до {PROMO_BATCH_MAX}. Или напишите 'Отмена' для выхода."
+        )
+        return
+
+    await state.clear()
+    try:
+        batch, codes = await generate_batch(count, reward, max_uses, expires_at)
+        logger.info("Пачка промокодов %s: %d кодов", batch, len(codes))
+        await message.answer_document(
+            BufferedInputFile("\n".join(codes).encode(), filename=f"promo_{batch}.txt"),
+            caption=f"✅ Пачка {batch}: {len(codes)} кодов по {reward} 💎{describe_limits(max_uses, expires_at)}"
+        )
+    except Exception as e:
+        await message.answer(f"Ошибка при генерации промокодов: {e}")
 
 # События
-async def send_events_list_to_admin(dest_message: Message, state: FSMContext):
-    print("[Events] Запрос списка событий")
-    conn = await get_connection()
-    try:
-        data = await state.get_data()
-        page = data.get("events_page", 1)
-        per_page = 9
-        offset = (page - 1) * per_page
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM events ORDER BY datetime DESC LIMIT %s OFFSET %s", (per_page, offset))
-            events = await cur.fetchall()
+def event_cursor(event) -> str:
+    return encode_cursor(dt_to_int(event["starts_at"]), event["id"])
+
+async def send_events_list_to_admin(dest_message: Message, cursor=None, direction=NEXT):
+    logger.debug("Запрос списка событий")
+    try:
+        if cursor is not None:
+            cursor = (int_to_dt(cursor[0]), cursor[1])
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                events, has_prev, has_next = await fetch_keyset_page(
+                    cur, "events", ("starts_at", "id"), PER_PAGE, cursor, direction
+                )
         buttons = []
         buttons.append([InlineKeyboardButton(text="➕ Создать событие", callback_data="event_create")])
         if events:
@@ -401,91 +598,96 @@ async def send_events_list_to_admin(dest_message: Message, state: FSMContext):
                 eid = event.get("id")
                 btn_text = f"{title} | {datetime_str}"
                 buttons.append([InlineKeyboardButton(text=btn_text, callback_data=f"event_edit:{eid}")])
-            if len(events) == per_page:
-                buttons.append([InlineKeyboardButton(text="➡️ Следующая страница", callback_data="events_page:next")])
+            nav = page_nav_row("events_page", events, has_prev, has_next, event_cursor)
+            if nav:
+                buttons.append(nav)
         else:
             buttons.append([InlineKeyboardButton(text="Нет событий", callback_data="none")])
         kb = InlineKeyboardMarkup(inline_keyboard=buttons)
         await dest_message.answer("События:", reply_markup=kb)
-        print("[Events] Список событий отправлен")
+        logger.debug("Список событий отправлен")
     except Exception as e:
         await dest_message.answer(f"Ошибка при получении событий: <code>{e}</code>")
-        print("[Events ERROR при получении]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при получении событий")
 
 @router.callback_query(lambda q: q.data == "admin_events_list")
 async def admin_events_list_callback(query: types.CallbackQuery, state: FSMContext):
-    await send_events_list_to_admin(query.message, state)
+    await send_events_list_to_admin(query.message)
     await query.answer()
 
 @router.callback_query(lambda q: q.data and q.data.startswith("events_page:"))
 async def events_page_nav(query: types.CallbackQuery, state: FSMContext):
-    direction = query.data.split(":", 1)[1]
-    data = await state.get_data()
-    page = data.get("events_page", 1)
-    page = page + 1 if direction == "next" else max(1, page - 1)
-    await state.update_data(events_page=page)
-    await send_events_list_to_admin(query.message, state)
+    nav = parse_nav(query.data)
+    if nav is None:
+        await query.answer("Неверные данные.", show_alert=True)
+        return
+    direction, cursor = nav
+    await send_events_list_to_admin(query.message, cursor, direction)
     await query.answer()
 
 @router.callback_query(lambda q: q.data == "event_create")
 async def event_create_callback(query: types.CallbackQuery, state: FSMContext):
-    print("[Events] Начало создания события")
+    logger.debug("Начало создания события")
     await query.message.answer("Введите название события:")
     await state.set_state(EventCreation.waiting_for_title)
     await query.answer()
 
-@router.message(EventCreation.waiting_for_title)
+@router.message(StateFilter(EventCreation.waiting_for_title))
 async def process_event_title(message: Message, state: FSMContext):
     await state.update_data(event_title=message.text)
-    await message.answer("Введите дату и время события:")
+    await message.answer(f"Введите дату и время события:\n{DATETIME_HINT}")
     await state.set_state(EventCreation.waiting_for_datetime)
-    print("[Events] Название:", message.text)
+    logger.debug("Название события: %s", message.text)
 
-@router.message(EventCreation.waiting_for_datetime)
+@router.message(StateFilter(EventCreation.waiting_for_datetime))
 async def process_event_datetime(message: Message, state: FSMContext):
-    await state.update_data(event_datetime=message.text)
+    starts_at = parse_event_datetime(message.text)
+    if starts_at is None:
+        await message.answer(f"Не удалось разобрать дату.\n{DATETIME_HINT}")
+        return
+    await state.update_data(event_datetime=message.text, event_starts_at=starts_at.strftime("%Y-%m-%d %H:%M:%S"))
     await message.answer("Введите описание события:")
     await state.set_state(EventCreation.waiting_for_description)
-    print("[Events] Дата и время:", message.text)
+    logger.debug("Дата и время события: %s", message.text)
 
-@router.message(EventCreation.waiting_for_description)
+@router.message(StateFilter(EventCreation.waiting_for_description))
 async def process_event_description(message: Message, state: FSMContext):
     await state.update_data(event_description=message.text)
     await message.answer("Введите приз (или оставьте пустым):")
     await state.set_state(EventCreation.waiting_for_prize)
-    print("[Events] Описание:", message.text)
+    logger.debug("Описание события: %s", message.text)
 
-@router.message(EventCreation.waiting_for_prize)
+@router.message(StateFilter(EventCreation.waiting_for_prize))
 async def process_event_prize(message: Message, state: FSMContext):
     await state.update_data(event_prize=message.text)
     await message.answer("Отправьте изображение или голосовое сообщение для события или введите 'skip':")
     await state.set_state(EventCreation.waiting_for_media)
-    print("[Events] Приз:", message.text)
+    logger.debug("Приз события: %s", message.text)
 
-@router.message(EventCreation.waiting_for_media)
+@router.message(StateFilter(EventCreation.waiting_for_media))
 async def process_event_media(message: Message, state: FSMContext):
-    media = ""
+    media, media_type = "", None
     if message.text and message.text.lower() == "skip":
         media = ""
     else:
         if message.photo:
-            media = message.photo[-1].file_id
+            media, media_type = message.photo[-1].file_id, MEDIA_PHOTO
         elif message.voice:
-            media = message.voice.file_id
+            media, media_type = message.voice.file_id, MEDIA_VOICE
     data = await state.get_data()
     title = data.get("event_title")
     datetime_str = data.get("event_datetime")
     description = data.get("event_description")
     prize = data.get("event_prize")
-    conn = await get_connection()
+    starts_at = data.get("event_starts_at")
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("INSERT INTO events (title, description, prize, datetime, media, creator_id, published) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                (title, description, prize, datetime_str, media, message.from_user.id, "{}"))
-            await conn.commit()
-            event_id = cur.lastrowid
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("INSERT INTO events (title, description, prize, datetime, starts_at, media, media_type, creator_id, published) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    (title, description, prize, datetime_str, starts_at, media, media_type, message.from_user.id, "{}"))
+                await conn.commit()
+                event_id = cur.lastrowid
+        await invalidate_events()
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="📣 Опубликовать", callback_data=f"event_publish:{event_id}"),
              InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"event_delete:{event_id}")],
@@ -493,13 +695,24 @@ async def process_event_media(message: Message, state: FSMContext):
             [InlineKeyboardButton(text="↩️ Назад", callback_data="admin_events_list")]
         ])
         await message.answer(f"Событие создано с ID: {event_id}. Теперь выберите действие:", reply_markup=kb)
-        print("[Events] Событие создано, ID:", event_id)
+        logger.info("Событие создано, ID: %s", event_id)
     except Exception as e:
         await message.answer(f"Ошибка при создании события: <code>{e}</code>")
-        print("[Events ERROR при создании]", e)
+        logger.exception("Ошибка при создании события")
     finally:
         await state.clear()
-        await safe_close(conn)
+
+def channels_report(results: dict, done: str) -> str:
+    """Строки «канал: результат» по ответу services.publishing."""
+    lines = []
+    for channel, result in results.items():
+        if isinstance(result, PostGone):
+            lines.append(f"⚠️ {channel}: пост уже удалён из канала")
+        elif isinstance(result, Exception):
+            lines.append(f"❌ {channel}: <code>{html.escape(str(result))}</code>")
+        else:
+            lines.append(f"✅ {channel}: {done}")
+    return "\n".join(lines)
 
 @router.callback_query(lambda q: q.data and q.data.startswith("event_edit:"))
 async def event_edit_callback(query: types.CallbackQuery, state: FSMContext):
@@ -509,11 +722,11 @@ async def event_edit_callback(query: types.CallbackQuery, state: FSMContext):
     except ValueError:
         await query.answer("Неверные данные.", show_alert=True)
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM events WHERE id = %s", (eid,))
-            event = await cur.fetchone()
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                await cur.execute("SELECT * FROM events WHERE id = %s", (eid,))
+                event = await cur.fetchone()
         if not event:
             await query.message.answer("Событие не найдено.")
             return
@@ -524,11 +737,9 @@ async def event_edit_callback(query: types.CallbackQuery, state: FSMContext):
         await query.answer("Редактирование события начато.")
     except Exception as e:
         await query.message.answer(f"Ошибка при получении события: <code>{e}</code>")
-        print("[Events ERROR при загрузке для редактирования]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при загрузке события для редактирования")
 
-@router.message(EventEditState.waiting_for_edit_details)
+@router.message(StateFilter(EventEditState.waiting_for_edit_details))
 async def process_event_edit(message: Message, state: FSMContext):
     parts = [s.strip() for s in message.text.split("|")]
     if len(parts) < 5:
@@ -537,30 +748,41 @@ async def process_event_edit(message: Message, state: FSMContext):
     title, datetime_str, description, prize, media = parts
     if media.lower() == "skip":
         media = ""
+    starts_at = parse_event_datetime(datetime_str)
+    if starts_at is None:
+        await message.answer(f"Не удалось разобрать дату «{datetime_str}».\n{DATETIME_HINT}")
+        return
     data = await state.get_data()
     eid = data.get("edit_event_id")
     if not eid:
         await message.answer("Ошибка: ID события не найден.")
         await state.clear()
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("UPDATE events SET title=%s, datetime=%s, description=%s, prize=%s, media=%s WHERE id = %s",
-                (title, datetime_str, description, prize, media, eid))
-            await conn.commit()
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                # Медиа здесь приходит текстом (file_id), поэтому тип берётся из самого file_id
+                await cur.execute("UPDATE events SET title=%s, datetime=%s, starts_at=%s, description=%s, prize=%s, media=%s, media_type=%s WHERE id = %s",
+                    (title, datetime_str, starts_at, description, prize, media, file_id_type(media) if media else None, eid))
+                await conn.commit()
+                await cur.execute("SELECT * FROM events WHERE id = %s", (eid,))
+                event = await cur.fetchone()
+        await invalidate_events()
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="📣 Опубликовать", callback_data=f"event_publish:{eid}"),
              InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"event_delete:{eid}")]
         ])
-        await message.answer("Событие обновлено успешно.", reply_markup=kb)
-        print(f"[Events] Событие {eid} обновлено")
+        text = "Событие обновлено успешно."
+        if event and load_published(event.get("published")):
+            results = await update_published(message.bot, event)
+            text += "\n\nПосты в каналах:\n" + channels_report(results, "обновлён")
+        await message.answer(text, reply_markup=kb)
+        logger.info("Событие %s обновлено", eid)
     except Exception as e:
         await message.answer(f"Ошибка при обновлении события: <code>{e}</code>")
-        print("[Events ERROR при редактировании]", e)
+        logger.exception("Ошибка при редактировании события")
     finally:
         await state.clear()
-        await safe_close(conn)
 
 @router.callback_query(lambda q: q.data and q.data.startswith("event_publish:"))
 async def event_publish_callback(query: types.CallbackQuery, state: FSMContext):
@@ -570,44 +792,23 @@ async def event_publish_callback(query: types.CallbackQuery, state: FSMContext):
     except ValueError:
         await query.answer("Неверные данные.", show_alert=True)
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM events WHERE id = %s", (eid,))
-            event = await cur.fetchone()
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                await cur.execute("SELECT * FROM events WHERE id = %s", (eid,))
+                event = await cur.fetchone()
         if not event:
             await query.message.answer("Событие не найдено.")
             return
-        publish_text = f"📢 <b>Событие!</b>\n\n<b>Название:</b> {event.get('title')}\n<b>Дата и время:</b> {event.get('datetime')}\n<b>Описание:</b> {event.get('description')}\n<b>Приз:</b> {event.get('prize')}"
-        if event.get("media"):
-            try:
-                sent = await query.bot.send_photo(PUBLISH_CHANNEL_ID, photo=event.get("media"), caption=publish_text, parse_mode="HTML")
-                published = {str(PUBLISH_CHANNEL_ID): sent.message_id}
-                print(f"[Events] Публикация прошла успешно в канал {PUBLISH_CHANNEL_ID} как фото")
-            except Exception as pub_e:
-                print(f"[Events] Ошибка публикации фото: {pub_e}")
-                try:
-                    sent = await query.bot.send_message(PUBLISH_CHANNEL_ID, publish_text, parse_mode="HTML")
-                    published = {str(PUBLISH_CHANNEL_ID): sent.message_id}
-                    print(f"[Events] Публикация прошла успешно в канал {PUBLISH_CHANNEL_ID} как текст")
-                except Exception as pub_e2:
-                    print(f"[Events] Ошибка публикации текста: {pub_e2}")
-                    await query.message.answer(f"Ошибка публикации в канале: <code>{pub_e2}</code>")
-                    return
-        else:
-            sent = await query.bot.send_message(PUBLISH_CHANNEL_ID, publish_text, parse_mode="HTML")
-            published = {str(PUBLISH_CHANNEL_ID): sent.message_id}
-            print(f"[Events] Публикация прошла успешно в канал {PUBLISH_CHANNEL_ID} как текст")
-        async with conn.cursor() as cur:
-            await cur.execute("UPDATE events SET published = %s WHERE id = %s", (json.dumps(published), eid))
-            await conn.commit()
-        await query.message.answer("Событие опубликовано в канале.")
-        print(f"[Events] Событие {eid} опубликовано:", published)
+        results = await publish_event(query.bot, event)
+        if not results:
+            await query.message.answer("Событие уже опубликовано во всех каналах.")
+            return
+        await query.message.answer("Публикация события:\n" + channels_report(results, "опубликовано"))
     except Exception as e:
         await query.message.answer(f"Ошибка при публикации события: <code>{e}</code>")
-        print("[Events ERROR при публикации]", e)
+        logger.exception("Ошибка при публикации события")
     finally:
-        await safe_close(conn)
         await query.answer()
 
 @router.callback_query(lambda q: q.data and q.data.startswith("event_delete:"))
@@ -618,32 +819,41 @@ async def event_delete_callback(query: types.CallbackQuery, state: FSMContext):
     except ValueError:
         await query.answer("Неверные данные.", show_alert=True)
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("DELETE FROM events WHERE id = %s", (eid,))
-            await conn.commit()
-        await query.message.answer("Событие удалено.")
-        print(f"[Events] Событие {eid} удалено")
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT published FROM events WHERE id = %s", (eid,))
+                row = await cur.fetchone()
+                await cur.execute("DELETE FROM events WHERE id = %s", (eid,))
+                await conn.commit()
+        await invalidate_events()
+        published = load_published(row[0]) if row else {}
+        text = "Событие удалено."
+        if published:
+            # Строка события уже удалена, поэтому при ошибке называем пост явно — его придётся убрать вручную
+            results = await delete_published(query.bot, published)
+            results = {f"{channel} (пост {published[channel]})": result for channel, result in results.items()}
+            text += "\n\nПосты в каналах:\n" + channels_report(results, "удалён")
+        await query.message.answer(text)
+        logger.info("Событие %s удалено", eid)
     except Exception as e:
         await query.message.answer(f"Ошибка при удалении события: <code>{e}</code>")
-        print("[Events ERROR при удалении]", e)
+        logger.exception("Ошибка при удалении события")
     finally:
-        await safe_close(conn)
         await query.answer()
 
 # Пользователи
-async def send_users_list_to_admin(dest_message: Message, state: FSMContext):
-    print("[Users] Запрос списка пользователей")
-    conn = await get_connection()
-    try:
-        data = await state.get_data()
-        page = data.get("users_page", 1)
-        per_page = 9
-        offset = (page - 1) * per_page
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM users ORDER BY tg_id DESC LIMIT %s OFFSET %s", (per_page, offset))
-            users = await cur.fetchall()
+def user_cursor(user) -> str:
+    return encode_cursor(user["tg_id"])
+
+async def send_users_list_to_admin(dest_message: Message, cursor=None, direction=NEXT):
+    logger.debug("Запрос списка пользователей")
+    try:
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                users, has_prev, has_next = await fetch_keyset_page(
+                    cur, "users", ("tg_id",), PER_PAGE, cursor, direction
+                )
         buttons = []
         if users:
             for user in users:
@@ -656,32 +866,31 @@ async def send_users_list_to_admin(dest_message: Message, state: FSMContext):
                     internal_id = tg_id
                 btn_text = f"{tg_id} • {full_name} (@{username}) | {rank}"
                 buttons.append([InlineKeyboardButton(text=btn_text, callback_data=f"user_manage:{tg_id}")])
-            if len(users) == per_page:
-                buttons.append([InlineKeyboardButton(text="➡️ Следующая страница", callback_data="users_page:next")])
+            nav = page_nav_row("users_page", users, has_prev, has_next, user_cursor)
+            if nav:
+                buttons.append(nav)
         else:
             buttons.append([InlineKeyboardButton(text="Нет пользователей", callback_data="none")])
         kb = InlineKeyboardMarkup(inline_keyboard=buttons)
         await dest_message.answer("Пользователи:", reply_markup=kb)
-        print("[Users] Список пользователей отправлен")
+        logger.debug("Список пользователей отправлен")
     except Exception as e:
         await dest_message.answer(f"Ошибка при получении пользователей: <code>{e}</code>")
-        print("[Users ERROR при получении]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при получении пользователей")
 
 @router.callback_query(lambda q: q.data == "admin_users_list")
 async def admin_users_list_callback(query: types.CallbackQuery, state: FSMContext):
-    await send_users_list_to_admin(query.message, state)
+    await send_users_list_to_admin(query.message)
     await query.answer()
 
 @router.callback_query(lambda q: q.data and q.data.startswith("users_page:"))
 async def users_page_nav(query: types.CallbackQuery, state: FSMContext):
-    direction = query.data.split(":", 1)[1]
-    data = await state.get_data()
-    page = data.get("users_page", 1)
-    page = page + 1 if direction == "next" else max(1, page - 1)
-    await state.update_data(users_page=page)
-    await send_users_list_to_admin(query.message, state)
+    nav = parse_nav(query.data)
+    if nav is None:
+        await query.answer("Неверные данные.", show_alert=True)
+        return
+    direction, cursor = nav
+    await send_users_list_to_admin(query.message, cursor, direction)
     await query.answer()
 
 @router.callback_query(lambda q: q.data and q.data.startswith("user_manage:"))
@@ -692,11 +901,11 @@ async def user_manage_callback(query: types.CallbackQuery, state: FSMContext):
     except ValueError:
         await query.answer("Неверные данные.", show_alert=True)
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM users WHERE tg_id = %s", (tg_id,))
-            user = await cur.fetchone()
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                await cur.execute("SELECT * FROM users WHERE tg_id = %s", (tg_id,))
+                user = await cur.fetchone()
         if not user:
             await query.message.answer("Пользователь не найден.")
             return
@@ -714,15 +923,13 @@ async def user_manage_callback(query: types.CallbackQuery, state: FSMContext):
         details = (f"ID: {user.get('tg_id', 'N/A')}\n"
                    f"Пользователь: {user.get('full_name')} (@{user.get('username')})\n"
                    f"Ранг: {user.get('rank')}\n"
-                   f"Алмазы: {user.get('balance', 0)}\n"
+                   f"Алмазы: {await current_balance(user)}\n"
                    f"Статус: {'Заблокирован' if user.get('blocked') else 'Активен'}")
         await query.message.answer(details, reply_markup=kb)
         await query.answer("Менеджер пользователя открыт.")
     except Exception as e:
         await query.message.answer(f"Ошибка при получении пользователя: {e}")
-        print("[Users ERROR при менеджере]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при открытии менеджера пользователя")
 
 @router.callback_query(lambda q: q.data and (q.data.startswith("user_give:") or q.data.startswith("user_take:")))
 async def user_diamonds_callback(query: types.CallbackQuery, state: FSMContext):
@@ -739,7 +946,7 @@ async def user_diamonds_callback(query: types.CallbackQuery, state: FSMContext):
     await state.set_state(DiamondsState.waiting_for_amount)
     await query.answer()
 
-@router.message(DiamondsState.waiting_for_amount)
+@router.message(StateFilter(DiamondsState.waiting_for_amount))
 async def process_diamond_amount(message: Message, state: FSMContext):
     try:
         amount = int(message.text)
@@ -753,26 +960,25 @@ async def process_diamond_amount(message: Message, state: FSMContext):
         await message.answer("Ошибка: отсутствуют данные для операции.")
         await state.clear()
         return
-    conn = await get_connection()
     try:
         if action == "give":
-            query_str = "UPDATE users SET balance = balance + %s WHERE tg_id = %s"
-        else:
-            query_str = "UPDATE users SET balance = GREATEST(balance - %s, 0) WHERE tg_id = %s"
-        async with conn.cursor() as cur:
-            await cur.execute(query_str, (amount, tg_id))
-            await conn.commit()
-        await message.answer("Операция выполнена успешно!")
-        if action == "give":
+            await credit(tg_id, amount, f"admin:{message.from_user.id}")
+            await message.answer("Операция выполнена успешно!")
             await message.bot.send_message(tg_id, f"➕{amount} 💎.")
         else:
-            await message.bot.send_message(tg_id, f"➖{amount} 💎.")
+            # Как и раньше, баланс не уходит в минус: списывается не больше, чем есть
+            taken = await debit_up_to(tg_id, amount, f"admin:{message.from_user.id}")
+            if taken < amount:
+                await message.answer(f"Операция выполнена: списано {taken} из {amount} 💎 — больше на балансе не было.")
+            else:
+                await message.answer("Операция выполнена успешно!")
+            if taken > 0:
+                await message.bot.send_message(tg_id, f"➖{taken} 💎.")
     except Exception as e:
         await message.answer(f"Ошибка при обновлении алмазов: {e}")
-        print("[Users ERROR при обновлении алмазов]", e)
+        logger.exception("Ошибка при обновлении алмазов")
     finally:
         await state.clear()
-        await safe_close(conn)
 
 @router.callback_query(lambda q: q.data and q.data.startswith("user_change_rank:"))
 async def user_change_rank_callback(query: types.CallbackQuery, state: FSMContext):
@@ -782,11 +988,11 @@ async def user_change_rank_callback(query: types.CallbackQuery, state: FSMContex
     except ValueError:
         await query.answer("Неверные данные.", show_alert=True)
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT * FROM users WHERE tg_id = %s", (tg_id,))
-            user = await cur.fetchone()
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                await cur.execute("SELECT * FROM users WHERE tg_id = %s", (tg_id,))
+                user = await cur.fetchone()
         if not user:
             await query.message.answer("Пользователь не найден.")
             return
@@ -797,11 +1003,9 @@ async def user_change_rank_callback(query: types.CallbackQuery, state: FSMContex
         await query.answer("Введите новый ранг.")
     except Exception as e:
         await query.message.answer(f"Ошибка при получении пользователя: {e}")
-        print("[Users ERROR при смене ранга]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при смене ранга")
 
-@router.message(UserEditState.waiting_for_new_rank)
+@router.message(StateFilter(UserEditState.waiting_for_new_rank))
 async def process_user_edit(message: Message, state: FSMContext):
     new_rank = message.text.strip()
     data = await state.get_data()
@@ -810,19 +1014,19 @@ async def process_user_edit(message: Message, state: FSMContext):
         await message.answer("Ошибка: пользователь не найден.")
         await state.clear()
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            await cur.execute("UPDATE users SET `rank` = %s WHERE tg_id = %s", (new_rank, tg_id))
-            await conn.commit()
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("UPDATE users SET `rank` = %s WHERE tg_id = %s", (new_rank, tg_id))
+                await conn.commit()
+        await invalidate_user(tg_id)
         await message.answer("Ранг пользователя обновлён.")
-        print(f"[Users] Ранг пользователя {tg_id} обновлён на: {new_rank}")
+        logger.info("Ранг пользователя %s обновлён на: %s", tg_id, new_rank)
     except Exception as e:
         await message.answer(f"Ошибка при обновлении пользователя: {e}")
-        print("[Users ERROR при обновлении]", e)
+        logger.exception("Ошибка при обновлении пользователя")
     finally:
         await state.clear()
-        await safe_close(conn)
 
 @router.callback_query(lambda q: q.data and q.data.startswith("user_toggle_block:"))
 async def user_toggle_block_callback(query: types.CallbackQuery, state: FSMContext):
@@ -832,30 +1036,32 @@ async def user_toggle_block_callback(query: types.CallbackQuery, state: FSMConte
     except ValueError:
         await query.answer("Неверные данные.", show_alert=True)
         return
-    conn = await get_connection()
     try:
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT blocked FROM users WHERE tg_id = %s", (tg_id,))
-            result = await cur.fetchone()
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT blocked FROM users WHERE tg_id = %s", (tg_id,))
+                result = await cur.fetchone()
+                if result is not None:
+                    new_status = not result[0]
+                    await cur.execute("UPDATE users SET blocked = %s WHERE tg_id = %s", (new_status, tg_id))
+                    await conn.commit()
+        await invalidate_user(tg_id)
         if result is None:
             await query.message.answer("Пользователь не найден.")
             return
-        current_status = result[0]
-        new_status = not current_status
-        async with conn.cursor() as cur:
-            await cur.execute("UPDATE users SET blocked = %s WHERE tg_id = %s", (new_status, tg_id))
-            await conn.commit()
         status_text = "Заблокирован" if new_status else "Разблокирован"
         await query.message.answer(f"Пользователь теперь {status_text}.")
-        print(f"[Users] Пользователь {tg_id} теперь {status_text}.")
+        logger.info("Пользователь %s теперь %s", tg_id, status_text)
         await query.answer()
     except Exception as e:
         await query.message.answer(f"Ошибка при изменении статуса: {e}")
-        print("[Users ERROR при блокировке]", e)
-    finally:
-        await safe_close(conn)
+        logger.exception("Ошибка при изменении статуса пользователя")
 
 # Объявления
+async def prune_unreachable(tg_ids):
+    await mark_users_unreachable(tg_ids)
+    await invalidate_user(*tg_ids)
+
 @router.callback_query(lambda q: q.data == "admin_broadcast")
 async def broadcast_init(query: types.CallbackQuery, state: FSMContext):
     await query.message.answer(
@@ -864,26 +1070,63 @@ async def broadcast_init(query: types.CallbackQuery, state: FSMContext):
     await state.set_state(BroadcastState.waiting_for_broadcast_message)
     await query.answer("Ожидается объявление.")
 
-@router.message(BroadcastState.waiting_for_broadcast_message)
+# Идущие рассылки: ссылка держит задачу, пока она не завершится
+_broadcasts = set()
+# Сколько (сек.) при остановке бота ждать идущие рассылки, прежде чем прервать их
+BROADCAST_SHUTDOWN_TIMEOUT = float(os.getenv("BROADCAST_SHUTDOWN_TIMEOUT", "30"))
+
+def _broadcast_done(task):
+    _broadcasts.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Рассылка завершилась ошибкой", exc_info=task.exception())
+
+async def stop_broadcasts():
+    """Вызывается из dp.shutdown до закрытия пула: рассылкам нужны БД и Bot API."""
+    if not _broadcasts:
+        return
+    logger.info("Ждём окончания рассылок: %d", len(_broadcasts))
+    _, pending = await asyncio.wait(set(_broadcasts), timeout=BROADCAST_SHUTDOWN_TIMEOUT)
+    if pending:
+        logger.warning("Рассылки прерваны остановкой бота: %d", len(pending))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def run_broadcast(message: Message, status: Message, chat_ids):
+    try:
+        stats = await broadcast_copy(
+            message.bot,
+            from_chat_id=message.chat.id,
+            message_id=message.message_id,
+            chat_ids=chat_ids,
+            status=status,
+            on_unreachable=prune_unreachable
+        )
+        logger.info("Рассылка завершена: %d доставлено, %d ошибок (%d недоступны)",
+                    stats.sent, stats.failed, stats.unreachable, extra={"duration": stats.elapsed})
+    except Exception as e:
+        await message.answer(f"Ошибка при рассылке объявления: {e}")
+        logger.exception("Ошибка при рассылке объявления")
+
+@router.message(StateFilter(BroadcastState.waiting_for_broadcast_message))
 async def process_broadcast(message: Message, state: FSMContext):
-    conn = await get_connection()
-    try:
-        async with conn.cursor(DictCursor) as cur:
-            await cur.execute("SELECT tg_id FROM users")
-            users = await cur.fetchall()
-            
-        for user in users:
-            try:
-                await message.bot.copy_message(
-                    chat_id=user["tg_id"],
-                    from_chat_id=message.chat.id,
-                    message_id=message.message_id
-                )
-            except Exception as e:
-                print(f"Ошибка отправки объявления пользователю {user['tg_id']}: {e}")
-        await message.answer("Объявление отправлено всем пользователям.")
+    # Сбрасываем состояние сразу: рассылка идёт долго, а следующие сообщения
+    # администратора не должны восприниматься как новое объявление
+    await state.clear()
+    try:
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                # Пользователи, заблокировавшие бота или удалившие аккаунт, пропускаются
+                await cur.execute("SELECT tg_id FROM users WHERE unreachable = FALSE")
+                users = await cur.fetchall()
+
+        status = await message.answer(f"📢 Рассылка запущена: {len(users)} получателей.")
     except Exception as e:
         await message.answer(f"Ошибка при рассылке объявления: {e}")
-    finally:
-        await state.clear()
-        await safe_close(conn)
+        logger.exception("Ошибка при рассылке объявления")
+        return
+    # Рассылка идёт в фоне: обновления одного чата обрабатываются по очереди,
+    # и иначе все следующие сообщения администратора ждали бы её окончания
+    task = asyncio.create_task(run_broadcast(message, status, [row[0] for row in users]))
+    _broadcasts.add(task)
+    task.add_done_callback(_broadcast_done)
@@ -0,0 +1,63 @@
+from typing import Any, Dict, Optional
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.types import TelegramObject
+
+from keyboards import MENU_TEXTS
+
+
+class MenuObserver(TelegramEventObserver):
+    """Сообщения роутера кнопок: хендлер выбирается по data["menu_button"]
+    одним поиском в словаре, без обхода фильтров хендлеров.
+
+    Кнопку заранее находит MenuButtonMiddleware; сообщения, которые не
+    кнопка, уходят дальше по роутерам сразу. Флаги хендлеров (rate_limit)
+    и inner-middleware работают как у обычных хендлеров.
+    """
+
+    def __init__(self, router: Router, event_name: str):
+        super().__init__(router=router, event_name=event_name)
+        self.buttons: Dict[str, HandlerObject] = {}
+
+    def button(self, text: str, flags: Optional[Dict[str, Any]] = None):
+        """Декоратор хендлера кнопки главного меню text."""
+        if text not in MENU_TEXTS:
+            raise ValueError(f"{text!r} нет в главном меню")
+        if text in self.buttons:
+            raise ValueError(f"у кнопки {text!r} уже есть хендлер")
+
+        def wrapper(callback):
+            handler = HandlerObject(callback=callback, filters=[], flags=flags or {})
+            self.buttons[text] = handler
+            # Список handlers — для aiogram (resolve_used_update_types и т. п.), выбор идёт по словарю
+            self.handlers.append(handler)
+            return callback
+        return wrapper
+
+    def resolve(self, menu_button: Optional[str]) -> Optional[HandlerObject]:
+        return self.buttons.get(menu_button) if menu_button is not None else None
+
+    async def trigger(self, event: TelegramObject, **kwargs: Any) -> Any:
+        handler = self.resolve(kwargs.get("menu_button"))
+        if handler is None:
+            return UNHANDLED
+        kwargs["handler"] = handler
+        wrapped_inner = self.outer_middleware.wrap_middlewares(self._resolve_middlewares(), handler.call)
+        try:
+            return await wrapped_inner(event, kwargs)
+        except SkipHandler:
+            return UNHANDLED
+
+
+class MenuRouter(Router):
+    def __init__(self, *, name: Optional[str] = None):
+        super().__init__(name=name)
+        self.message = self.observers["message"] = MenuObserver(self, "message")
+
+
+# Хендлеры кнопок главного меню из всех модулей handlers: @menu.router.message.button(BTN_...).
+# Роутер подключается первым, поэтому кнопка работает из любого FSM-состояния
+router = MenuRouter(name="menu")
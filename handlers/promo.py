@@ -1,71 +1,45 @@
-from aiogram import Router, F
+import logging
+
+from aiogram import Router
+from aiogram.filters import StateFilter
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import get_connection, safe_close
+from handlers import menu
+from keyboards import BTN_PROMO
+from services.promo import normalize_code, redeem, INVALID, ALREADY_USED, EXPIRED, EXHAUSTED
 
 router = Router()
+logger = logging.getLogger(__name__)
 
 class PromoState(StatesGroup):
     waiting_for_code = State()
 
-@router.message(F.text == "🎟️ Промокоды", flags={"skip_state": True})
+@menu.router.message.button(BTN_PROMO)
 async def promo_entry(message: Message, state: FSMContext):
-    # Этот обработчик срабатывает независимо от текущего FSM-состояния
+    # Роутер кнопок меню проверяется первым, поэтому вход работает из любого FSM-состояния
     await state.set_state(PromoState.waiting_for_code)
     await message.answer("🔑 Введите промокод:")
 
-@router.message(PromoState.waiting_for_code)
+# Перебор кодов: не больше 5 попыток подряд, дальше одна в 5 секунд
+@router.message(StateFilter(PromoState.waiting_for_code), flags={"rate_limit": {"rate": 0.2, "burst": 5}})
 async def promo_process(message: Message, state: FSMContext):
-    code = message.text.strip().upper()  # Приводим промокод к верхнему регистру
+    code = normalize_code(message.text)
     user_id = message.from_user.id
-    conn = await get_connection()
     try:
-        async with conn.cursor() as cur:
-            # Проверка наличия промокода в базе
-            await cur.execute("SELECT reward FROM promo_codes WHERE code = %s", (code,))
-            promo = await cur.fetchone()
-            if not promo:
-                await message.answer("❌ Неверный или несуществующий промокод.")
-                return
-            reward = promo[0]
-
-            # Проверяем, использовал ли уже пользователь этот промокод
-            await cur.execute(
-                "SELECT 1 FROM promo_codes_usage WHERE tg_id = %s AND code = %s",
-                (user_id, code)
-            )
-            used = await cur.fetchone()
-            if used:
-                await message.answer("⚠️ Этот промокод уже был использован вами.")
-                return
-
-            # Если пользователя нет в таблице users, регистрируем его
-            await cur.execute("SELECT 1 FROM users WHERE tg_id = %s", (user_id,))
-            exists = await cur.fetchone()
-            if not exists:
-                await cur.execute(
-                    "INSERT INTO users (tg_id, username, full_name, rank, balance) VALUES (%s, %s, %s, %s, %s)",
-                    (
-                        user_id,
-                        message.from_user.username or "-",
-                        message.from_user.full_name or "-",
-                        "Гость",
-                        0,
-                    )
-                )
-
-            # Фиксируем использование промокода и обновляем баланс пользователя
-            await cur.execute("INSERT INTO promo_codes_usage (tg_id, code) VALUES (%s, %s)", (user_id, code))
-            await cur.execute("UPDATE users SET balance = balance + %s WHERE tg_id = %s", (reward, user_id))
-            await conn.commit()
-
+        result, reward = await redeem(user_id, code)
+        if result == INVALID:
+            await message.answer("❌ Неверный или несуществующий промокод.")
+        elif result == ALREADY_USED:
+            await message.answer("⚠️ Этот промокод уже был использован вами.")
+        elif result == EXPIRED:
+            await message.answer("⌛ Срок действия этого промокода истёк.")
+        elif result == EXHAUSTED:
+            await message.answer("⚠️ Лимит активаций этого промокода исчерпан.")
+        else:
             await message.answer(f"🎉 Промокод успешно активирован! Вы получили {reward} 💎.")
-    except Exception as e:
-        print(f"[PROMO ERROR] {e}")
+    except Exception:
+        logger.exception("Ошибка активации промокода")
         await message.answer("🚫 Ошибка при активации промокода.")
     finally:
         await state.clear()
-        res = safe_close(conn)
-        if res is not None and hasattr(res, '__await__'):
-            await res
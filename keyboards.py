@@ -1,16 +1,26 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
+# Тексты кнопок главного меню; кнопку находит MenuButtonMiddleware, хендлер по ней выбирает handlers/menu.py
+BTN_ACCOUNT = "👤 Аккаунт"
+BTN_EVENTS = "🎯 События"
+BTN_CONTACT = "📩 Связь"
+BTN_PROMO = "🎟️ Промокоды"
+BTN_MANAGE = "⚙️ Управление"
+BTN_BACK = "◀️ Назад"
+
+MENU_TEXTS = (BTN_ACCOUNT, BTN_EVENTS, BTN_CONTACT, BTN_PROMO, BTN_MANAGE)
+
 main_menu = ReplyKeyboardMarkup(
     keyboard=[
-        [KeyboardButton(text="👤 Аккаунт"), KeyboardButton(text="🎯 События")],
-        [KeyboardButton(text="📩 Связь"), KeyboardButton(text="🎟️ Промокоды"), KeyboardButton(text="⚙️ Управление")]
+        [KeyboardButton(text=BTN_ACCOUNT), KeyboardButton(text=BTN_EVENTS)],
+        [KeyboardButton(text=BTN_CONTACT), KeyboardButton(text=BTN_PROMO), KeyboardButton(text=BTN_MANAGE)]
     ],
     resize_keyboard=True
 )
 
 back_menu = ReplyKeyboardMarkup(
     keyboard=[
-        [KeyboardButton(text="◀️ Назад")]
+        [KeyboardButton(text=BTN_BACK)]
     ],
     resize_keyboard=True
 )
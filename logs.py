@@ -0,0 +1,151 @@
+"""Логирование бота: запись в очередь на event loop, вывод — в фоновом потоке.
+
+logger.info(...) в хендлере только кладёт LogRecord в очередь; форматирование
+и запись в stdout (который под лог-дренажом Procfile может блокироваться)
+выполняет QueueListener в отдельном потоке. Если очередь переполнена, запись
+отбрасывается и учитывается в dropped — event loop не ждёт никогда.
+
+К каждой записи добавляются update_id, user_id и handler из contextvars,
+которые выставляют middlewares.log_context, и duration_ms, если передан
+extra={"duration": секунды}.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextvars import ContextVar
+
+# json — по строке JSON на запись, text — для чтения глазами при локальном запуске
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Уровни отдельных модулей: "database=WARNING,handlers.manage=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+update_id_var = ContextVar("update_id", default=None)
+user_id_var = ContextVar("user_id", default=None)
+handler_var = ContextVar("handler", default=None)
+
+_listener = None
+
+
+class _ContextFilter(logging.Filter):
+    """Снимает contextvars в потоке, который пишет лог: в потоке слушателя их уже нет."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.update_id = update_id_var.get()
+        record.user_id = user_id_var.get()
+        record.handler = handler_var.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, queue_, maxsize: int):
+        super().__init__(queue_)
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Стандартный prepare форматирует сообщение и traceback прямо здесь, на event loop;
+        # слушатель в том же процессе, так что форматирование откладывается до него
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # SimpleQueue заметно дешевле queue.Queue (нет Condition), но без maxsize —
+        # границу проверяем сами; небольшое превышение при гонке с потоком не страшно
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("update_id", "user_id", "handler"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        duration = getattr(record, "duration", None)
+        if duration is not None:
+            entry["duration_ms"] = round(duration * 1000, 2)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        # formatMessage, а не format: контекст встаёт до traceback
+        line = super().formatMessage(record)
+        context = [f"{key}={getattr(record, key)}" for key in ("update_id", "user_id", "handler")
+                   if getattr(record, key, None) is not None]
+        duration = getattr(record, "duration", None)
+        if duration is not None:
+            context.append(f"{duration * 1000:.1f}ms")
+        return f"{line} ({', '.join(context)})" if context else line
+
+
+def parse_levels(spec: str) -> dict:
+    """"database=WARNING,handlers.manage=DEBUG" -> {"database": 30, "handlers.manage": 10}."""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.strip().partition("=")
+        if not sep:
+            continue
+        value = logging.getLevelName(level.strip().upper())
+        if not isinstance(value, int):
+            raise ValueError(f"LOG_LEVELS: неизвестный уровень {level!r} для {name!r}")
+        levels[name.strip()] = value
+    return levels
+
+
+def setup_logging(stream=None):
+    """Настраивает корневой логгер; повторный вызов ничего не делает."""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records, LOG_QUEUE_SIZE)
+    handler.addFilter(_ContextFilter())
+
+    # Поток, процесс и имя процесса в записи не выводятся, а LogRecord выясняет их на каждый вызов
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    # aiogram на INFO пишет о каждом обработанном обновлении
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает всё, что осталось в очереди, и останавливает поток."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped() -> int:
+    """Сколько записей отброшено из-за переполненной очереди."""
+    return sum(getattr(handler, "dropped", 0) for handler in logging.getLogger().handlers)
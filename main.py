@@ -1,32 +1,102 @@
 import asyncio
 import os
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
-from database import init_db
-from handlers import start, account, events, contact, manage, promo
+from database import init_db, close_pool, start_query_sampler, stop_query_sampler
+from fsm.storage import FSMMiddleware, create_storage
+from logs import setup_logging
+from services.ledger import start_folding, stop_folding
+from services.metrics import start_metrics_server, stop_metrics_server
+from handlers import menu, start, account, events, contact, manage, promo
+from middlewares.menu import MenuButtonMiddleware
+from middlewares.registration import UserRegistrationMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.metrics import MetricsMiddleware, ApiMetricsMiddleware
+from middlewares.recorder import UpdateRecorder, RECORD_UPDATES
+from middlewares.log_context import UpdateLogContextMiddleware, HandlerLogContextMiddleware
+from webhook import create_webhook_app, set_webhook, WEBHOOK_HOST, WEBHOOK_PORT
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# polling | webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Больше 1 — обновления распределяются по процессам-воркерам (см. workers.py)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
 
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
+def create_bot() -> Bot:
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(ApiMetricsMiddleware())
+    return bot
 
-dp.include_routers(
-    start.router,
-    account.router,
-    events.router,
-    contact.router,
-    promo.router,
-    manage.router
-)
+def create_dispatcher() -> Dispatcher:
+    # Роутеры — синглтоны модулей handlers, поэтому диспетчер один на процесс
+    storage = create_storage()
+    # Штатный FSM-middleware заменён своим: state.clear() — одна запись в хранилище
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    dp.fsm = FSMMiddleware(storage)
+    dp.update.outer_middleware(dp.fsm)
+    dp.startup.register(init_db)
+    dp.startup.register(start_folding)
+    dp.startup.register(start_metrics_server)
+    dp.startup.register(start_query_sampler)
+    # Обработчики shutdown идут по порядку: рассылки дорабатывают, пока пул ещё открыт
+    dp.shutdown.register(manage.stop_broadcasts)
+    dp.shutdown.register(stop_query_sampler)
+    dp.shutdown.register(stop_metrics_server)
+    dp.shutdown.register(stop_folding)
+    dp.shutdown.register(close_pool)
+    if RECORD_UPDATES:
+        # Запись трафика для bench/replay.py; первой, чтобы попадали и отброшенные троттлингом
+        recorder = UpdateRecorder(RECORD_UPDATES, keep_ids=(manage.ADMIN_ID,))
+        dp.update.outer_middleware(recorder)
+        dp.shutdown.register(recorder.close)
+    dp.update.outer_middleware(UpdateLogContextMiddleware())
+    # Общий лимит стоит первым, чтобы флуд отсекался до регистрации и запросов к БД
+    throttling = ThrottlingMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    dp.message.outer_middleware(UserRegistrationMiddleware())
+    # Кнопка меню определяется один раз, роутер меню по ней выбирает хендлер из словаря
+    dp.message.outer_middleware(MenuButtonMiddleware())
+    # Более строгие лимиты отдельных хендлеров — по флагу rate_limit
+    dp.message.middleware(ThrottlingMiddleware(use_flags=True))
+    dp.callback_query.middleware(ThrottlingMiddleware(use_flags=True))
+    # Замер идёт после троттлинга: отброшенные обновления хендлерами не считаются
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    dp.message.middleware(HandlerLogContextMiddleware())
+    dp.callback_query.middleware(HandlerLogContextMiddleware())
 
-async def main():
-    await init_db()
+    dp.include_routers(
+        menu.router,
+        start.router,
+        account.router,
+        events.router,
+        contact.router,
+        promo.router,
+        manage.router
+    )
+    return dp
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    # Если раньше был включён вебхук, getUpdates вернёт конфликт
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
+def run_webhook(bot: Bot, dp: Dispatcher):
+    dp.startup.register(set_webhook)
+    web.run_app(create_webhook_app(dp, bot), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    setup_logging()
+    if BOT_WORKERS > 1:
+        from workers import run_sharded
+        run_sharded(BOT_WORKERS, BOT_MODE)
+    elif BOT_MODE == "webhook":
+        run_webhook(create_bot(), create_dispatcher())
+    else:
+        asyncio.run(run_polling(create_bot(), create_dispatcher()))
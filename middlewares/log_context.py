@@ -0,0 +1,53 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from logs import update_id_var, user_id_var, handler_var
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateLogContextMiddleware(BaseMiddleware):
+    """Выставляет update_id и user_id для всех записей лога, сделанных при обработке
+    обновления, и пишет на DEBUG итоговую запись с хендлером и длительностью.
+
+    Регистрируется как outer-middleware на dp.update.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        tokens = (
+            update_id_var.set(event.update_id),
+            user_id_var.set(from_user.id if from_user else None),
+            handler_var.set(None),
+        )
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Обновление обработано", extra={"duration": time.perf_counter() - started})
+            for var, token in zip((update_id_var, user_id_var, handler_var), tokens):
+                var.reset(token)
+
+
+class HandlerLogContextMiddleware(BaseMiddleware):
+    """Добавляет в контекст лога имя выбранного хендлера; регистрируется как inner."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Без reset: значение нужно итоговой записи UpdateLogContextMiddleware, она же его и сбросит
+        handler_var.set(data["handler"].callback.__name__)
+        return await handler(event, data)
@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from filters.menu import menu_button
+
+
+class MenuButtonMiddleware(BaseMiddleware):
+    """Один раз на сообщение определяет нажатую кнопку главного меню и кладёт
+    её в data["menu_button"] (None — не кнопка). По этому значению роутер
+    handlers/menu.py выбирает хендлер, а фильтр IncomingContact пропускает кнопки."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["menu_button"] = menu_button(getattr(event, "text", None))
+        return await handler(event, data)
@@ -0,0 +1,47 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from services.metrics import handler_seconds, handler_errors, api_seconds, api_errors
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время и исключения каждого хендлера с метками router (модуль handlers) и handler.
+
+    Регистрируется как обычная (inner) middleware: только там уже известен хендлер.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        labels = (callback.__module__.rsplit(".", 1)[-1], callback.__name__)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_errors.inc(*labels, type(e).__name__)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, *labels)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Время каждого запроса к Bot API по методам; подключается к bot.session."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - started, name)
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from keyboards import main_menu, back_menu
+from services.pagination import decode_cursor, encode_cursor
+
+# Файл JSONL, куда писать входящие обновления; пусто — запись выключена
+RECORD_UPDATES = os.getenv("RECORD_UPDATES", "")
+# Ключ псевдонимов; без него — случайный на процесс (воркерам workers.py стоит задать общий)
+RECORD_SALT = os.getenv("RECORD_SALT", "")
+
+# Тексты кнопок и команды нужны для воспроизведения, остальной текст заменяется
+_KNOWN_TEXTS = frozenset(
+    button.text for keyboard in (main_menu, back_menu) for row in keyboard.keyboard for button in row
+)
+_PERSONAL = ("last_name", "username", "title", "bio", "vcard", "author_signature")
+# Обязательные поля: значение заменяется заглушкой, иначе запись не пройдёт проверку Update при воспроизведении
+_PLACEHOLDERS = {"first_name": "User", "sender_user_name": "User", "phone_number": "+70000000000"}
+_CHAT_TYPES = ("private", "group", "supergroup", "channel")
+# callback_data с id пользователя Telegram после двоеточия: user_manage:<tg_id> и т. п.
+_USER_CALLBACKS = ("user_manage", "user_give", "user_take", "user_toggle_block", "user_change_rank")
+# Листание списка пользователей: курсор — tg_id в base36 (handlers/manage.py:user_cursor)
+_USER_CURSOR_CALLBACKS = ("users_page",)
+_INT = re.compile(r"-?\d+")
+# Id после замены: выше любых настоящих id пользователей Telegram
+_PSEUDO_BASE = 10 ** 14
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Пишет входящие обновления в JSONL для bench/replay.py, предварительно обезличив.
+
+    Id пользователей и чатов заменяются псевдонимами (один и тот же пользователь
+    остаётся одним и тем же в пределах записи) — где бы ни встретился объект
+    User или Chat, а также в callback_data админских кнопок. Имена и телефоны
+    удаляются или, где поле обязательно, заменяются заглушкой, свободный текст заменяется строкой той же длины. Команды, тексты
+    кнопок и остальная callback_data сохраняются — по ним выбираются хендлеры.
+    Исключения —
+    keep_ids (например, ADMIN_ID), иначе админские ветки при воспроизведении
+    не сработают.
+
+    Каждая строка: {"t": unix-время получения, "update": {...}}. В файл пишет
+    отдельный поток, чтобы медленный диск не останавливал event loop.
+    Регистрируется как outer-middleware на dp.update.
+    """
+
+    def __init__(self, path: str, keep_ids=()):
+        # Построчная буферизация: каждая строка — одна запись в O_APPEND-файл,
+        # так что воркеры workers.py могут писать в один файл
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._salt = RECORD_SALT.encode() or secrets.token_bytes(16)
+        self._keep_ids = frozenset(keep_ids)
+        # Один поток — строки ложатся в файл в порядке получения
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="update-recorder")
+        self.recorded = 0
+
+    def pseudonym(self, value: int) -> int:
+        if value in self._keep_ids:
+            return value
+        digest = hmac.new(self._salt, str(value).encode(), hashlib.sha256).digest()
+        pseudo = _PSEUDO_BASE + int.from_bytes(digest[:6], "big")
+        # Каналы и группы в Telegram с отрицательными id — знак сохраняется
+        return -pseudo if value < 0 else pseudo
+
+    def _scrub_text(self, text: str) -> str:
+        if text in _KNOWN_TEXTS:
+            return text
+        if text.startswith("/"):
+            # Команда остаётся, аргументы (payload /start и т. п.) — нет
+            command, sep, rest = text.partition(" ")
+            return command + sep + "x" * len(rest)
+        return "x" * len(text)
+
+    def _scrub_callback(self, data: str) -> str:
+        prefix, sep, rest = data.partition(":")
+        if prefix in _USER_CALLBACKS and _INT.fullmatch(rest):
+            return f"{prefix}:{self.pseudonym(int(rest))}"
+        if prefix in _USER_CURSOR_CALLBACKS:
+            direction, _, cursor = rest.partition(":")
+            try:
+                return f"{prefix}:{direction}:{encode_cursor(*map(self.pseudonym, decode_cursor(cursor)))}"
+            except ValueError:
+                return prefix + sep + "x" * len(rest)
+        return data
+
+    @staticmethod
+    def _is_person(obj: dict) -> bool:
+        """User (есть is_bot) или Chat (type — тип чата): у обоих id — настоящий id Telegram."""
+        return isinstance(obj.get("id"), int) and ("is_bot" in obj or obj.get("type") in _CHAT_TYPES)
+
+    def anonymize(self, obj):
+        if isinstance(obj, list):
+            return [self.anonymize(item) for item in obj]
+        if not isinstance(obj, dict):
+            return obj
+        if self._is_person(obj):
+            # Объекты ищутся по форме, а не по имени поля: from, chat, via_bot,
+            # new_chat_members, forward_origin.sender_user, text_mention.user ...
+            obj = dict(obj, id=self.pseudonym(obj["id"]))
+        result = {}
+        for key, value in obj.items():
+            if key in _PERSONAL:
+                continue
+            if key in _PLACEHOLDERS:
+                # first_name — User и Contact, phone_number — Contact, sender_user_name — MessageOriginHiddenUser
+                result[key] = _PLACEHOLDERS[key]
+            elif key in ("user_id", "chat_id") and isinstance(value, int):
+                result[key] = self.pseudonym(value)
+            elif key in ("text", "caption") and isinstance(value, str):
+                result[key] = self._scrub_text(value)
+            elif key in ("data", "callback_data") and isinstance(value, str):
+                result[key] = self._scrub_callback(value)
+            else:
+                result[key] = self.anonymize(value)
+        return result
+
+    def record(self, update: Update):
+        payload = self.anonymize(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+        line = json.dumps({"t": round(time.time(), 4), "update": payload}, ensure_ascii=False)
+        self._writer.submit(self._write, line + "\n")
+        self.recorded += 1
+
+    def _write(self, line: str):
+        try:
+            self._file.write(line)
+        except Exception:
+            logger.exception("Не удалось записать обновление")
+
+    async def close(self):
+        # Дописываем очередь строк, не блокируя event loop
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.shutdown)
+        self._file.close()
+        logger.info("Записано обновлений: %d", self.recorded)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            self.record(event)
+        except Exception:
+            # Запись — вспомогательная, обработку обновления она не должна ломать
+            logger.exception("Не удалось записать обновление")
+        return await handler(event, data)
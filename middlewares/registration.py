@@ -0,0 +1,22 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.users import ensure_user
+
+
+class UserRegistrationMiddleware(BaseMiddleware):
+    """Регистрирует автора сообщения и передаёт его строку users в хендлеры
+    как аргумент user."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is not None and not from_user.is_bot:
+            data["user"] = await ensure_user(from_user)
+        return await handler(event, data)
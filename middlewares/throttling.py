@@ -0,0 +1,95 @@
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+# Общий лимит на пользователя: обновлений в секунду и запас на всплеск
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "10"))
+# Как часто (сек.) выбрасывать вёдра неактивных пользователей
+THROTTLE_SWEEP_INTERVAL = float(os.getenv("THROTTLE_SWEEP_INTERVAL", "60"))
+
+THROTTLED_TEXT = "⏳ Слишком часто. Подождите немного и попробуйте снова."
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Token bucket на пользователя; лишние обновления отбрасываются до хендлера и БД.
+
+    Как outer-middleware ограничивает всё, что присылает пользователь. Как обычная
+    (inner) middleware с use_flags=True действует только на хендлеры с флагом
+    rate_limit — в outer-middleware хендлер ещё не выбран, и флаги недоступны:
+
+        @router.message(..., flags={"rate_limit": {"rate": 0.2, "burst": 3}})
+
+    В первый раз после превышения пользователь получает один ответ, дальше
+    обновления отбрасываются молча, пока ведро не наполнится.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST, use_flags: bool = False):
+        self.rate = rate
+        self.burst = burst
+        self.use_flags = use_flags
+        # (user_id, ведро) -> (токены, время последнего обновления, предупреждён ли)
+        self._buckets = {}
+        self._swept_at = time.monotonic()
+        # За сколько наполняется самое медленное ведро
+        self._refill = burst / rate
+        self.dropped = 0
+
+    def allow(self, key, rate: float, burst: float, now: float):
+        """Возвращает (пропустить ли обновление, нужно ли предупредить пользователя)."""
+        tokens, stamp, warned = self._buckets.get(key, (burst, now, False))
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        # Предупреждение повторяется только после того, как пользователь успокоился
+        warned = warned and tokens < burst
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now, warned)
+            return True, False
+        self._buckets[key] = (tokens, now, True)
+        return False, not warned
+
+    def sweep(self, now: float):
+        # Ведро, которое успело наполниться, ничем не отличается от отсутствующего
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < self._refill
+        }
+        self._swept_at = now
+
+    def __len__(self):
+        return len(self._buckets)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+
+        rate, burst, name = self.rate, self.burst, None
+        if self.use_flags:
+            limit = get_flag(data, "rate_limit")
+            if not limit:
+                return await handler(event, data)
+            rate = limit.get("rate", rate)
+            burst = limit.get("burst", burst)
+            name = limit.get("key") or data["handler"].callback.__name__
+            self._refill = max(self._refill, burst / rate)
+
+        now = time.monotonic()
+        if now - self._swept_at >= THROTTLE_SWEEP_INTERVAL:
+            self.sweep(now)
+        allowed, warn = self.allow((from_user.id, name), rate, burst, now)
+        if allowed:
+            return await handler(event, data)
+
+        self.dropped += 1
+        if warn and isinstance(event, (Message, CallbackQuery)):
+            await event.answer(THROTTLED_TEXT)
+        return None
@@ -0,0 +1,42 @@
+-- Базовая схема (то, что раньше создавал init_db)
+CREATE TABLE IF NOT EXISTS users (
+    tg_id BIGINT PRIMARY KEY,
+    username VARCHAR(255),
+    full_name VARCHAR(255),
+    `rank` VARCHAR(50) DEFAULT 'Гость',
+    balance INT DEFAULT 0,
+    blocked BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    title TEXT,
+    description TEXT,
+    prize TEXT,
+    datetime TEXT,
+    media TEXT,
+    creator_id BIGINT
+);
+
+CREATE TABLE IF NOT EXISTS contacts (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    tg_id BIGINT,
+    username VARCHAR(255),
+    full_name VARCHAR(255),
+    message TEXT,
+    answered BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS promo_codes (
+    code VARCHAR(50) PRIMARY KEY,
+    reward INT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS promo_codes_usage (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    tg_id BIGINT,
+    code VARCHAR(50),
+    used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY (tg_id, code)
+);
@@ -0,0 +1,2 @@
+-- Раньше добавлялся на лету из handlers/events.py
+ALTER TABLE events ADD COLUMN published TEXT;
@@ -0,0 +1,2 @@
+-- Флаг получателей, до которых рассылка не доходит (бот заблокирован, аккаунт удалён)
+ALTER TABLE users ADD COLUMN unreachable BOOLEAN DEFAULT FALSE;
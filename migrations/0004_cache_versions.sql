@@ -0,0 +1,5 @@
+-- Версии кэшей, чтобы процессы бота замечали изменения друг друга
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
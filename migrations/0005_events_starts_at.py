@@ -0,0 +1,76 @@
+"""Типизированная дата события: events.starts_at DATETIME + индексы под выборки ленты."""
+import logging
+import re
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Копия services.events_feed.parse_event_datetime на момент этой миграции.
+# Миграция не импортирует код приложения: иначе правка разборщика задним
+# числом меняла бы то, что она делает на свежей базе.
+_MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12,
+}
+_FORMATS = (
+    "%d.%m.%Y %H:%M", "%d.%m.%Y", "%d.%m.%y %H:%M", "%d.%m.%y",
+    "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d",
+    "%d/%m/%Y %H:%M", "%d/%m/%Y",
+)
+_TEXT_DATE = re.compile(r"^(\d{1,2})\s+([а-яё]+)(?:\s+(\d{4}))?(?:\s*(?:г\.?|года)?)?(?:[\s,в]+(\d{1,2})[:.](\d{2}))?$")
+
+
+def parse_event_datetime(text: str, now: datetime = None):
+    text = " ".join((text or "").strip().lower().split())
+    for fmt in _FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    for fmt in ("%d.%m %H:%M", "%d.%m"):
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed.replace(year=(now or datetime.now()).year)
+    match = _TEXT_DATE.match(text)
+    if match and match.group(2) in _MONTHS:
+        day, month_name, year, hour, minute = match.groups()
+        try:
+            return datetime(
+                int(year) if year else (now or datetime.now()).year,
+                _MONTHS[month_name], int(day),
+                int(hour or 0), int(minute or 0)
+            )
+        except ValueError:
+            return None
+    return None
+
+
+async def upgrade(cur):
+    await cur.execute("SHOW COLUMNS FROM events LIKE 'starts_at'")
+    if not await cur.fetchone():
+        await cur.execute("ALTER TABLE events ADD COLUMN starts_at DATETIME NULL AFTER datetime")
+
+    # Переносим существующие текстовые даты разборщиком выше (копия того, что в хендлерах).
+    # Нераспознанные считаем прошедшими (время миграции) — админ может их поправить.
+    await cur.execute("SELECT id, datetime FROM events WHERE starts_at IS NULL")
+    rows = await cur.fetchall()
+    now = datetime.now().replace(microsecond=0)
+    updates = []
+    for event_id, text in rows:
+        parsed = parse_event_datetime(text)
+        if parsed is None:
+            logger.warning("Событие %s: не удалось разобрать дату %r, ставим %s", event_id, text, now)
+        updates.append((parsed or now, event_id))
+    if updates:
+        await cur.executemany("UPDATE events SET starts_at = %s WHERE id = %s", updates)
+
+    await cur.execute("ALTER TABLE events MODIFY starts_at DATETIME NOT NULL")
+
+    await cur.execute("SHOW INDEX FROM events WHERE Key_name = 'idx_events_starts_at'")
+    if not await cur.fetchone():
+        await cur.execute("CREATE INDEX idx_events_starts_at ON events (starts_at, id)")
+    await cur.execute("SHOW INDEX FROM contacts WHERE Key_name = 'idx_contacts_answered_created'")
+    if not await cur.fetchone():
+        await cur.execute("CREATE INDEX idx_contacts_answered_created ON contacts (answered, created_at, id)")
@@ -0,0 +1,7 @@
+-- Состояния FSM, чтобы незавершённые диалоги переживали перезапуск и были общими для процессов
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    storage_key VARCHAR(255) PRIMARY KEY,
+    state VARCHAR(255) NULL,
+    data MEDIUMTEXT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
@@ -0,0 +1,6 @@
+-- Лимит активаций, срок действия и пачка для массово сгенерированных промокодов
+ALTER TABLE promo_codes ADD COLUMN max_uses INT NULL;
+ALTER TABLE promo_codes ADD COLUMN uses INT NOT NULL DEFAULT 0;
+ALTER TABLE promo_codes ADD COLUMN expires_at DATETIME NULL;
+ALTER TABLE promo_codes ADD COLUMN batch VARCHAR(32) NULL;
+CREATE INDEX idx_promo_codes_batch ON promo_codes (batch);
@@ -0,0 +1,20 @@
+-- Журнал изменений баланса: начисления только дописываются, строку users не блокируют.
+-- users.balance хранит свёрнутую сумму журнала до ledger_folded_id включительно.
+CREATE TABLE IF NOT EXISTS balance_ledger (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    tg_id BIGINT NOT NULL,
+    delta INT NOT NULL,
+    reason VARCHAR(64),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_balance_ledger_user (tg_id, id)
+);
+
+ALTER TABLE users ADD COLUMN ledger_folded_id BIGINT NOT NULL DEFAULT 0;
+
+-- До какого id журнал уже свёрнут в users.balance (одна строка)
+CREATE TABLE IF NOT EXISTS ledger_state (
+    id TINYINT PRIMARY KEY,
+    folded_id BIGINT NOT NULL
+);
+
+INSERT IGNORE INTO ledger_state (id, folded_id) VALUES (1, 0);
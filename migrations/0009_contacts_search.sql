@@ -0,0 +1,5 @@
+-- Поиск по обращениям: полнотекстовый по тексту, по автору — tg_id и username.
+-- id в ключах авторов — чтобы страница выдачи (ORDER BY id DESC) читалась по индексу без сортировки.
+ALTER TABLE contacts ADD FULLTEXT INDEX ft_contacts_message (message);
+CREATE INDEX idx_contacts_tg_id ON contacts (tg_id, id);
+CREATE INDEX idx_contacts_username ON contacts (username, id);
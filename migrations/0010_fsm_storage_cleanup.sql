@@ -0,0 +1,2 @@
+-- Пустые строки FSM: раньше сброс состояния записывал NULL вместо удаления строки
+DELETE FROM fsm_storage WHERE state IS NULL AND (data IS NULL OR data = '{}');
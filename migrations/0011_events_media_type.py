@@ -0,0 +1,48 @@
+"""Тип медиа события: events.media_type (photo, voice, ...) рядом с file_id."""
+import base64
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+# Копия services.events_feed.file_id_type на момент этой миграции — см. 0005
+_FILE_TYPES = {2: "photo", 3: "voice", 4: "video", 5: "document", 8: "sticker", 9: "audio", 10: "animation"}
+_TYPE_FLAGS = (1 << 24) | (1 << 25)
+
+
+def file_id_type(file_id: str):
+    try:
+        raw = base64.urlsafe_b64decode(file_id + "=" * (-len(file_id) % 4))
+        decoded, zeros = bytearray(), False
+        for byte in raw:
+            if zeros:
+                decoded += bytes(byte)
+                zeros = False
+            elif byte == 0:
+                zeros = True
+            else:
+                decoded.append(byte)
+        type_id, = struct.unpack_from("<i", decoded)
+    except (ValueError, struct.error):
+        return None
+    return _FILE_TYPES.get(type_id & ~_TYPE_FLAGS)
+
+
+async def upgrade(cur):
+    await cur.execute("SHOW COLUMNS FROM events LIKE 'media_type'")
+    if not await cur.fetchone():
+        await cur.execute("ALTER TABLE events ADD COLUMN media_type VARCHAR(16) NULL AFTER media")
+
+    # Раньше тип не хранился: голосовые и фото лежали в media одинаково.
+    # Тип зашит в сам file_id; нераспознанные остаются NULL и показываются текстом
+    await cur.execute("SELECT id, media FROM events WHERE media IS NOT NULL AND media <> '' AND media_type IS NULL")
+    rows = await cur.fetchall()
+    updates = []
+    for event_id, media in rows:
+        media_type = file_id_type(media)
+        if media_type is None:
+            logger.warning("Событие %s: не удалось определить тип медиа %r", event_id, media)
+            continue
+        updates.append((media_type, event_id))
+    if updates:
+        await cur.executemany("UPDATE events SET media_type = %s WHERE id = %s", updates)
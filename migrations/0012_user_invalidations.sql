@@ -0,0 +1,7 @@
+-- Журнал изменённых строк users: остальные процессы сбрасывают из кэша только эти tg_id
+CREATE TABLE IF NOT EXISTS user_invalidations (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    tg_id BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_user_invalidations_created (created_at)
+);
@@ -0,0 +1,14 @@
+-- Свёртка помечает каждую запись журнала номером свёртки (folded_in) вместо общей отметки по id:
+-- с отметкой запись, закоммиченная позже соседних с большим id, могла оказаться ниже неё и выпасть из баланса.
+-- users.ledger_folded_id и ledger_state.folded_id теперь хранят номер последней свёртки. Старые
+-- отметки по id не больше ledger_state.folded_id, а новые номера идут после него — перенумеровывать не нужно.
+ALTER TABLE balance_ledger ADD COLUMN folded_in BIGINT NULL;
+
+UPDATE balance_ledger l JOIN users u ON u.tg_id = l.tg_id
+SET l.folded_in = u.ledger_folded_id
+WHERE l.id <= u.ledger_folded_id AND l.folded_in IS NULL;
+
+-- Баланс: несвёрнутые записи пользователя и свёрнутые позже его строки users
+CREATE INDEX idx_balance_ledger_folded ON balance_ledger (tg_id, folded_in);
+-- Свёртка: все несвёрнутые записи
+CREATE INDEX idx_balance_ledger_unfolded ON balance_ledger (folded_in);
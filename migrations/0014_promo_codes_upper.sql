@@ -0,0 +1,4 @@
+-- Одиночные промокоды раньше сохранялись как введены; теперь все коды в верхнем регистре.
+-- Сравнение регистронезависимое, поэтому первичный и уникальный ключи не конфликтуют
+UPDATE promo_codes SET code = UPPER(code) WHERE BINARY code <> UPPER(code);
+UPDATE promo_codes_usage SET code = UPPER(code) WHERE BINARY code <> UPPER(code);
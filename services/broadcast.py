@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramServerError,
+)
+from aiogram.types import Message
+
+# Bot API допускает ~30 сообщений в секунду на бота в разные чаты
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "16"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+# Сколько недоступных получателей копить перед пакетной записью в БД
+BROADCAST_PRUNE_BATCH = int(os.getenv("BROADCAST_PRUNE_BATCH", "200"))
+
+logger = logging.getLogger(__name__)
+
+# Классы ошибок доставки
+FAIL_FORBIDDEN = "forbidden"            # пользователь заблокировал бота
+FAIL_DEACTIVATED = "deactivated"        # аккаунт удалён
+FAIL_CHAT_NOT_FOUND = "chat_not_found"  # чата не существует
+FAIL_TRANSIENT = "transient"            # сеть / 5xx — имеет смысл повторить
+FAIL_OTHER = "other"
+
+UNREACHABLE = {FAIL_FORBIDDEN, FAIL_DEACTIVATED, FAIL_CHAT_NOT_FOUND}
+
+
+def classify_error(error: Exception) -> str:
+    """Определяет, почему не удалось доставить сообщение."""
+    description = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        return FAIL_DEACTIVATED if "deactivated" in description else FAIL_FORBIDDEN
+    if isinstance(error, TelegramBadRequest):
+        if "chat not found" in description or "user not found" in description:
+            return FAIL_CHAT_NOT_FOUND
+        if "deactivated" in description:
+            return FAIL_DEACTIVATED
+        return FAIL_OTHER
+    if isinstance(error, (TelegramNetworkError, TelegramServerError)):
+        return FAIL_TRANSIENT
+    return FAIL_OTHER
+
+
+class TokenBucket:
+    """Глобальный ограничитель скорости: не более rate операций в секунду,
+    всплеск — не больше capacity."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов (например, после TelegramRetryAfter)."""
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0
+            self._updated = until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Один на процесс: лимит Bot API — на бота, а не на рассылку, поэтому две
+# одновременные рассылки и публикация событий делят одно ведро
+global_limiter = TokenBucket(BROADCAST_RATE)
+
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    unreachable: int = 0
+    failures: dict = field(default_factory=dict)
+    started_at: float = field(default_factory=time.monotonic)
+
+    def fail(self, kind: str):
+        self.failed += 1
+        self.failures[kind] = self.failures.get(kind, 0) + 1
+        if kind in UNREACHABLE:
+            self.unreachable += 1
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def render(self, finished: bool = False) -> str:
+        speed = self.done / self.elapsed if self.elapsed > 0 else 0.0
+        header = "✅ Рассылка завершена" if finished else "📢 Идёт рассылка..."
+        return (
+            f"{header}\n\n"
+            f"Обработано: {self.done}/{self.total}\n"
+            f"Доставлено: {self.sent}\n"
+            f"Ошибок: {self.failed} (недоступны: {self.unreachable})\n"
+            f"Скорость: {speed:.1f} сообщ./сек."
+        )
+
+
+async def _copy_with_retry(bot: Bot, limiter: TokenBucket, stats: BroadcastStats,
+                           chat_id: int, from_chat_id: int, message_id: int) -> str:
+    """Возвращает None при успешной доставке, иначе класс ошибки.
+
+    BROADCAST_MAX_RETRIES ограничивает только повторы после сетевых ошибок:
+    TelegramRetryAfter — не сбой доставки, а просьба подождать, и получатель
+    из-за неё не должен выпадать из рассылки.
+    """
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        try:
+            await bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+            stats.sent += 1
+            return None
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать — тормозим всех отправителей сразу
+            stats.retries += 1
+            limiter.pause(e.retry_after)
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            kind = classify_error(e)
+            if kind != FAIL_TRANSIENT:
+                stats.fail(kind)
+                if kind not in UNREACHABLE:
+                    logger.warning("Ошибка отправки пользователю %s: %s", chat_id, e)
+                return kind
+            if attempt >= BROADCAST_MAX_RETRIES:
+                break
+            stats.retries += 1
+            attempt += 1
+            await asyncio.sleep(attempt)
+    stats.fail(FAIL_TRANSIENT)
+    logger.warning("Пользователь %s: превышено число повторов", chat_id)
+    return FAIL_TRANSIENT
+
+
+async def _report_progress(limiter: TokenBucket, stats: BroadcastStats, status: Message, finished: bool = False):
+    await limiter.acquire()
+    try:
+        await status.edit_text(stats.render(finished))
+    except TelegramBadRequest:
+        # "message is not modified" и т.п. — для статуса не критично
+        pass
+    except TelegramRetryAfter as e:
+        limiter.pause(e.retry_after)
+
+
+async def broadcast_copy(bot: Bot, from_chat_id: int, message_id: int, chat_ids,
+                         status: Message = None, on_unreachable=None,
+                         limiter: TokenBucket = None, workers: int = BROADCAST_WORKERS) -> BroadcastStats:
+    """Копирует сообщение всем chat_ids пулом из workers отправителей под общим
+    ограничителем скорости (по умолчанию — global_limiter, один на процесс).
+    Если передан status, прогресс периодически выводится редактированием
+    этого сообщения. on_unreachable — корутина, получающая пачки chat_id,
+    до которых доставка больше невозможна."""
+    chat_ids = list(chat_ids)
+    stats = BroadcastStats(total=len(chat_ids))
+    limiter = limiter or global_limiter
+    pending = iter(chat_ids)
+    dead = []
+
+    async def flush_dead(force: bool = False):
+        if on_unreachable is None or not dead or (len(dead) < BROADCAST_PRUNE_BATCH and not force):
+            return
+        batch = dead[:]
+        dead.clear()
+        try:
+            await on_unreachable(batch)
+        except Exception:
+            logger.exception("Не удалось пометить недоступных получателей")
+
+    async def worker():
+        # Общий итератор раздаёт получателей между отправителями
+        for chat_id in pending:
+            kind = await _copy_with_retry(bot, limiter, stats, chat_id, from_chat_id, message_id)
+            if kind in UNREACHABLE:
+                dead.append(chat_id)
+                await flush_dead()
+
+    async def progress():
+        last_done = -1
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            if stats.done != last_done:
+                last_done = stats.done
+                await _report_progress(limiter, stats, status)
+
+    reporter = asyncio.create_task(progress()) if status is not None else None
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(chat_ids))))))
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        await flush_dead(force=True)
+    if status is not None:
+        await _report_progress(limiter, stats, status, finished=True)
+    return stats
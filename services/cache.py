@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from database import acquire
+
+# Как часто (сек.) сверять локальные кэши с БД — нужно, только если бот запущен в нескольких процессах
+CACHE_VERSION_CHECK_INTERVAL = float(os.getenv("CACHE_VERSION_CHECK_INTERVAL", "5"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Простой LRU-кэш с ограничением времени жизни записей.
+
+    Не потокобезопасен — рассчитан на использование из одного event loop.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class PeriodicCheck:
+    """Сверка локального кэша с БД не чаще раза в interval секунд.
+
+    value — до какой версии (или позиции в журнале) кэш уже сверен.
+    Использование:
+        if check.due():
+            async with check.lock:
+                if check.due():
+                    ...сверка...
+                    check.mark(version)
+    """
+
+    def __init__(self, interval: float = CACHE_VERSION_CHECK_INTERVAL):
+        self.interval = interval
+        self.value = None
+        self.lock = asyncio.Lock()
+        self._checked_at = 0.0
+
+    def due(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.interval
+
+    def expire(self):
+        """Следующая due() вернёт True."""
+        self._checked_at = 0.0
+
+    def mark(self, value):
+        self.value = value
+        self._checked_at = time.monotonic()
+
+
+class SharedVersion(PeriodicCheck):
+    """Версия данных в cache_versions: процесс, изменивший данные, вызывает bump(),
+    остальные при сверке видят новую версию и перечитывают свой кэш."""
+
+    def __init__(self, name: str, interval: float = CACHE_VERSION_CHECK_INTERVAL):
+        super().__init__(interval)
+        self.name = name
+
+    async def read(self, cur) -> int:
+        await cur.execute("SELECT version FROM cache_versions WHERE name = %s", (self.name,))
+        row = await cur.fetchone()
+        if not row:
+            return 0
+        return row["version"] if isinstance(row, dict) else row[0]
+
+    async def bump(self):
+        self.expire()
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+                    ON DUPLICATE KEY UPDATE version = version + 1
+                """, (self.name,))
@@ -0,0 +1,84 @@
+import html
+import os
+import re
+
+from aiomysql import DictCursor
+
+from database import acquire
+from services.pagination import NEXT, fetch_keyset_page
+
+# Слова короче innodb_ft_min_token_size полнотекстовый индекс не хранит
+CONTACTS_SEARCH_MIN_TOKEN = int(os.getenv("CONTACTS_SEARCH_MIN_TOKEN", "3"))
+CONTACTS_SEARCH_MAX_TERMS = 8
+SNIPPET_WIDTH = 160
+
+_WORD = re.compile(r"\w+")
+_USERNAME = re.compile(r"^@?([A-Za-z0-9_]{1,32})$")
+
+
+def parse_query(query: str):
+    """Разбирает строку поиска в (условие WHERE, параметры, слова для подсветки).
+
+    Число — tg_id автора, @username — автор по username, иначе полнотекстовый
+    поиск по тексту обращения: все слова обязательны, каждое — как префикс
+    («жалоб» найдёт «жалоба» и «жалобы»). None, если искать нечего.
+    """
+    query = query.strip()
+    if query.isdigit():
+        return "tg_id = %s", (int(query),), ()
+    if query.startswith("@"):
+        match = _USERNAME.match(query)
+        return ("username = %s", (match.group(1),), ()) if match else None
+    terms = [word.lower() for word in _WORD.findall(query) if len(word) >= CONTACTS_SEARCH_MIN_TOKEN]
+    terms = list(dict.fromkeys(terms))[:CONTACTS_SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    # Из запроса берутся только \w+, поэтому операторы BOOLEAN MODE в него не попадут
+    against = " ".join(f"+{term}*" for term in terms)
+    return "MATCH(message) AGAINST (%s IN BOOLEAN MODE)", (against,), tuple(terms)
+
+
+def snippet(text: str, terms=(), width: int = SNIPPET_WIDTH) -> str:
+    """Фрагмент text вокруг первого совпадения с найденными словами в <b>, готовый HTML."""
+    text = " ".join((text or "").split())
+    pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + r")\w*", re.IGNORECASE) if terms else None
+    first = pattern.search(text) if pattern else None
+    start = max(0, first.start() - width // 3) if first else 0
+    end = min(len(text), start + width)
+    fragment = text[start:end]
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    if pattern is None:
+        return prefix + html.escape(fragment) + suffix
+    # Экранируем по кускам, чтобы теги подсветки не попали под html.escape
+    parts, last = [], 0
+    for match in pattern.finditer(fragment):
+        parts.append(html.escape(fragment[last:match.start()]))
+        parts.append(f"<b>{html.escape(match.group())}</b>")
+        last = match.end()
+    parts.append(html.escape(fragment[last:]))
+    return prefix + "".join(parts) + suffix
+
+
+async def search_contacts(where: str, params, per_page: int, cursor=None, direction: str = NEXT):
+    """Страница найденных обращений (отвеченных и нет), новые первыми.
+
+    Сначала по индексу выбираются только id страницы, потом — сами строки:
+    совпадений по частому слову могут быть сотни тысяч, и сортировать их
+    вместе с текстом обращений незачем. Возвращает (rows, has_prev, has_next).
+    """
+    async with acquire() as conn:
+        async with conn.cursor(DictCursor) as cur:
+            ids, has_prev, has_next = await fetch_keyset_page(
+                cur, "contacts", ("id",), per_page, cursor, direction,
+                where=where, params=params, select="id"
+            )
+            if not ids:
+                return [], has_prev, has_next
+            ids = [row["id"] for row in ids]
+            await cur.execute(
+                "SELECT id, tg_id, username, full_name, message, answered, created_at FROM contacts "
+                f"WHERE id IN ({', '.join(['%s'] * len(ids))})", ids
+            )
+            by_id = {row["id"]: row for row in await cur.fetchall()}
+    return [by_id[cid] for cid in ids if cid in by_id], has_prev, has_next
@@ -0,0 +1,206 @@
+import base64
+import html
+import os
+import re
+import struct
+from datetime import datetime
+
+from aiomysql import DictCursor
+
+from database import acquire
+from services.cache import SharedVersion
+
+# Сколько прошедших событий показывать в ленте
+EVENTS_PAST_LIMIT = int(os.getenv("EVENTS_PAST_LIMIT", "50"))
+# Событий на странице ленты; не больше 10 — лимит альбома Telegram
+EVENTS_PAGE_SIZE = min(int(os.getenv("EVENTS_PAGE_SIZE", "5")), 10)
+
+# Лимиты Telegram на видимый текст (после разбора HTML), в UTF-16
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+CARD_SEPARATOR = "\n\n➖➖➖\n\n"
+# Текстовые карточки страницы делят одно сообщение с заголовком
+_HEADER_RESERVE = 100
+TEXT_CARD_LIMIT = (MESSAGE_LIMIT - _HEADER_RESERVE) // EVENTS_PAGE_SIZE - len(CARD_SEPARATOR) * 2
+
+UPCOMING = "u"
+PAST = "p"
+
+# events.media_type: в альбом ленты попадают только фото
+MEDIA_PHOTO = "photo"
+MEDIA_VOICE = "voice"
+
+_cards = None        # {UPCOMING: [(text, file_id фото или None)], PAST: [...]}
+_version = SharedVersion("events")
+_expires_at = None   # время начала ближайшего события: тогда оно станет прошедшим
+
+_MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12,
+}
+_FORMATS = (
+    "%d.%m.%Y %H:%M", "%d.%m.%Y", "%d.%m.%y %H:%M", "%d.%m.%y",
+    "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d",
+    "%d/%m/%Y %H:%M", "%d/%m/%Y",
+)
+_TEXT_DATE = re.compile(r"^(\d{1,2})\s+([а-яё]+)(?:\s+(\d{4}))?(?:\s*(?:г\.?|года)?)?(?:[\s,в]+(\d{1,2})[:.](\d{2}))?$")
+
+DATETIME_HINT = "Формат даты: ДД.ММ.ГГГГ ЧЧ:ММ (например, 25.12.2025 18:00) или «25 декабря 18:00»."
+
+
+def parse_event_datetime(text: str, now: datetime = None):
+    """Разбирает дату события, введённую администратором; None — если не удалось."""
+    text = " ".join((text or "").strip().lower().split())
+    for fmt in _FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    for fmt in ("%d.%m %H:%M", "%d.%m"):
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed.replace(year=(now or datetime.now()).year)
+    match = _TEXT_DATE.match(text)
+    if match and match.group(2) in _MONTHS:
+        day, month_name, year, hour, minute = match.groups()
+        try:
+            return datetime(
+                int(year) if year else (now or datetime.now()).year,
+                _MONTHS[month_name], int(day),
+                int(hour or 0), int(minute or 0)
+            )
+        except ValueError:
+            return None
+    return None
+
+
+# Тип файла зашит в начало file_id: urlsafe base64, нули сжаты RLE, дальше int32 (LE) с флагами
+_FILE_TYPES = {2: MEDIA_PHOTO, 3: MEDIA_VOICE, 4: "video", 5: "document", 8: "sticker", 9: "audio", 10: "animation"}
+_TYPE_FLAGS = (1 << 24) | (1 << 25)
+
+
+def file_id_type(file_id: str):
+    """Тип файла по его file_id ("photo", "voice", ...); None — если не удалось разобрать.
+
+    Нужен, когда file_id приходит текстом (правка события), а не сообщением с медиа.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(file_id + "=" * (-len(file_id) % 4))
+        decoded, zeros = bytearray(), False
+        for byte in raw:
+            if zeros:
+                decoded += bytes(byte)
+                zeros = False
+            elif byte == 0:
+                zeros = True
+            else:
+                decoded.append(byte)
+        type_id, = struct.unpack_from("<i", decoded)
+    except (ValueError, struct.error):
+        return None
+    return _FILE_TYPES.get(type_id & ~_TYPE_FLAGS)
+
+
+def event_photo(event: dict):
+    """file_id фото события или None, если медиа нет или это не фото (например, голосовое)."""
+    return (event.get("media") or None) if event.get("media_type") == MEDIA_PHOTO else None
+
+
+def _tg_len(text: str) -> int:
+    """Длина так, как её считает Telegram — в единицах UTF-16."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:max(limit - 1, 0)] + "…"
+
+
+_CARD = "📢 {title}\n\n{description}\n\n🏆 Приз: {prize}\n📅 Дата: {datetime}"
+
+
+def render_event(event: dict, limit: int = MESSAGE_LIMIT) -> str:
+    """Карточка события, видимый текст которой не длиннее limit.
+
+    Режется исходный текст полей — сначала описание, потом название, — и только
+    затем экранируется и оборачивается в теги: обрезка готового HTML могла
+    разрезать тег или сущность, и Telegram отказался бы разбирать сообщение.
+    """
+    fields = {name: str(event[name]) for name in ("title", "description", "prize", "datetime")}
+    overflow = _tg_len(_CARD.format(**fields)) - limit
+    for name in ("description", "title", "prize", "datetime"):
+        if overflow <= 0:
+            break
+        value = fields[name]
+        # Символ — не меньше одной единицы UTF-16, так что отрезанного хватит
+        fields[name] = clip(value, len(value) - overflow - 1)
+        overflow -= len(value) - len(fields[name])
+    fields = {name: html.escape(value) for name, value in fields.items()}
+    return (
+        f"📢 <b>{fields['title']}</b>\n\n"
+        f"{fields['description']}\n\n"
+        f"🏆 Приз: {fields['prize']}\n"
+        f"📅 Дата: {fields['datetime']}"
+    )
+
+
+def _card(event: dict):
+    photo = event_photo(event)
+    # Фото уходит в альбом с подписью, остальное — текстом в общее сообщение страницы:
+    # голосовое в альбом фото не вложить, Telegram отклонил бы всю страницу
+    return render_event(event, CAPTION_LIMIT if photo else TEXT_CARD_LIMIT), photo
+
+
+async def _load_cards(cur, now: datetime):
+    columns = "id, title, description, prize, datetime, media, media_type, starts_at"
+    await cur.execute(
+        f"SELECT {columns} FROM events WHERE starts_at >= %s ORDER BY starts_at, id",
+        (now,)
+    )
+    upcoming = await cur.fetchall()
+    await cur.execute(
+        f"SELECT {columns} FROM events WHERE starts_at < %s ORDER BY starts_at DESC, id DESC LIMIT %s",
+        (now, EVENTS_PAST_LIMIT)
+    )
+    past = await cur.fetchall()
+    cards = {
+        UPCOMING: [_card(e) for e in upcoming],
+        PAST: [_card(e) for e in past],
+    }
+    return cards, (upcoming[0]["starts_at"] if upcoming else None)
+
+
+def _fresh() -> bool:
+    if _cards is None or _version.due():
+        return False
+    return _expires_at is None or datetime.now() < _expires_at
+
+
+async def get_event_cards(kind: str = UPCOMING):
+    """Отрендеренные карточки предстоящих (UPCOMING) или прошедших (PAST) событий.
+
+    В установившемся режиме не ходит в БД.
+    """
+    global _cards, _expires_at
+    if _fresh():
+        return _cards[kind]
+    async with _version.lock:
+        if _fresh():
+            return _cards[kind]
+        now = datetime.now()
+        async with acquire() as conn:
+            async with conn.cursor(DictCursor) as cur:
+                version = await _version.read(cur)
+                expired = _expires_at is not None and now >= _expires_at
+                if _cards is None or version != _version.value or expired:
+                    _cards, _expires_at = await _load_cards(cur, now)
+        _version.mark(version)
+    return _cards[kind]
+
+
+async def invalidate_events():
+    """Вызывается после создания, изменения или удаления события."""
+    global _cards
+    _cards = None
+    await _version.bump()
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+
+from database import acquire
+
+# Сколько (сек.) копить начисления перед одной пачкой INSERT
+LEDGER_FLUSH_DELAY = float(os.getenv("LEDGER_FLUSH_DELAY", "0.02"))
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", "500"))
+LEDGER_FOLD_INTERVAL = float(os.getenv("LEDGER_FOLD_INTERVAL", "60"))
+# После стольких новых записей свёртка запускается, не дожидаясь интервала
+LEDGER_FOLD_THRESHOLD = int(os.getenv("LEDGER_FOLD_THRESHOLD", "10000"))
+
+logger = logging.getLogger(__name__)
+
+_pending = []        # [(tg_id, delta, reason, future)]
+_flush_task = None
+_fold_task = None
+_fold_lock = asyncio.Lock()
+_unfolded = 0        # записей, добавленных этим процессом после последней свёртки
+
+# Записи, ещё не вошедшие в users.balance: несвёрнутые и свёрнутые после той свёртки,
+# из которой взята строка users (её ledger_folded_id) — строка может быть из кэша
+_UNFOLDED_SUM = (
+    "SELECT COALESCE(SUM(delta), 0) FROM balance_ledger "
+    "WHERE tg_id = %s AND (folded_in IS NULL OR folded_in > %s)"
+)
+
+
+def _count_entries(count: int):
+    """Учитывает новые записи; после LEDGER_FOLD_THRESHOLD запускает свёртку, не дожидаясь интервала."""
+    global _unfolded
+    _unfolded += count
+    if _unfolded >= LEDGER_FOLD_THRESHOLD and not _fold_lock.locked():
+        _unfolded = 0
+        asyncio.create_task(fold_balances())
+
+
+async def insert_entry(cur, tg_id: int, delta: int, reason: str):
+    """Запись в журнал внутри уже открытой транзакции вызывающего."""
+    await cur.execute(
+        "INSERT INTO balance_ledger (tg_id, delta, reason) VALUES (%s, %s, %s)",
+        (tg_id, delta, reason)
+    )
+    _count_entries(1)
+
+
+async def _flush():
+    await asyncio.sleep(LEDGER_FLUSH_DELAY)
+    while _pending:
+        batch = _pending[:LEDGER_BATCH_SIZE]
+        del _pending[:len(batch)]
+        try:
+            async with acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.executemany(
+                        "INSERT INTO balance_ledger (tg_id, delta, reason) VALUES (%s, %s, %s)",
+                        [(tg_id, delta, reason) for tg_id, delta, reason, _ in batch]
+                    )
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        for *_, future in batch:
+            if not future.done():
+                future.set_result(None)
+        _count_entries(len(batch))
+
+
+async def credit(tg_id: int, delta: int, reason: str):
+    """Добавляет запись в журнал; возвращается, когда пачка с ней записана в БД.
+
+    Параллельные вызовы склеиваются в один INSERT на несколько строк.
+    """
+    global _flush_task
+    future = asyncio.get_running_loop().create_future()
+    _pending.append((tg_id, delta, reason[:64], future))
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush())
+    await future
+
+
+async def current_balance(user: dict) -> int:
+    """Баланс по строке users: свёрнутое значение плюс ещё не свёрнутые записи.
+
+    Строка может быть из кэша: пара (balance, ledger_folded_id) всегда согласована.
+    """
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_UNFOLDED_SUM, (user["tg_id"], user.get("ledger_folded_id") or 0))
+            row = await cur.fetchone()
+    return (user.get("balance") or 0) + int(row[0])
+
+
+async def debit_up_to(tg_id: int, amount: int, reason: str) -> int:
+    """Списывает amount, но не больше текущего баланса. Возвращает списанное.
+
+    Проверка и запись идут в одной транзакции под блокировкой строки users,
+    поэтому параллельные списания одного пользователя выполняются по очереди
+    и баланс не уходит в минус.
+    """
+    async with acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT balance, ledger_folded_id FROM users WHERE tg_id = %s FOR UPDATE", (tg_id,)
+                )
+                row = await cur.fetchone()
+                if row is None:
+                    await conn.rollback()
+                    return 0
+                balance, folded_id = row
+                await cur.execute(_UNFOLDED_SUM, (tg_id, folded_id or 0))
+                balance = (balance or 0) + int((await cur.fetchone())[0])
+                taken = max(0, min(amount, balance))
+                if taken > 0:
+                    await insert_entry(cur, tg_id, -taken, reason)
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    return taken
+
+
+async def fold_balances() -> int:
+    """Сворачивает журнал в users.balance одной транзакцией. Возвращает число записей.
+
+    Записи помечаются номером свёртки (folded_in) в той же транзакции, что
+    прибавляет их к users.balance. Запись, которую свёртка не увидела (её
+    транзакция ещё не закоммичена), остаётся непомеченной и войдёт в следующую.
+    """
+    global _unfolded
+    async with _fold_lock:
+        _unfolded = 0
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                # Без gap-блокировок REPEATABLE READ: новые начисления не ждут конца свёртки
+                await cur.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            await conn.begin()
+            try:
+                async with conn.cursor() as cur:
+                    # Блокировка счётчика свёрток выстраивает свёртки разных процессов в очередь
+                    await cur.execute("SELECT folded_id FROM ledger_state WHERE id = 1 FOR UPDATE")
+                    fold_id = (await cur.fetchone())[0] + 1
+                    # Записи без строки users прибавлять некуда — они ждут её появления
+                    await cur.execute("""
+                        UPDATE balance_ledger l JOIN users u ON u.tg_id = l.tg_id
+                        SET l.folded_in = %s
+                        WHERE l.folded_in IS NULL
+                    """, (fold_id,))
+                    count = cur.rowcount
+                    if not count:
+                        await conn.rollback()
+                        return 0
+                    await cur.execute("""
+                        UPDATE users u JOIN (
+                            SELECT tg_id, SUM(delta) AS total FROM balance_ledger
+                            WHERE folded_in = %s GROUP BY tg_id
+                        ) l ON l.tg_id = u.tg_id
+                        SET u.balance = u.balance + l.total, u.ledger_folded_id = %s
+                    """, (fold_id, fold_id))
+                    await cur.execute("UPDATE ledger_state SET folded_id = %s WHERE id = 1", (fold_id,))
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+    logger.info("Свёрнуто записей: %d (свёртка %d)", count, fold_id)
+    return count
+
+
+async def _fold_loop():
+    while True:
+        await asyncio.sleep(LEDGER_FOLD_INTERVAL)
+        try:
+            await fold_balances()
+        except Exception:
+            logger.exception("Свёртка журнала не удалась")
+
+
+async def start_folding():
+    global _fold_task
+    if _fold_task is None:
+        _fold_task = asyncio.create_task(_fold_loop())
+
+
+async def stop_folding():
+    global _fold_task
+    if _fold_task is not None:
+        _fold_task.cancel()
+        _fold_task = None
+    if _flush_task is not None:
+        await _flush_task
@@ -0,0 +1,165 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Хендлеры замеряет middlewares.metrics.MetricsMiddleware, запросы к Bot API —
+middlewares.metrics.ApiMetricsMiddleware, запросы к MySQL — наблюдатель,
+который этот модуль вешает на курсоры database.py.
+"""
+import logging
+import os
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+from aiohttp import web
+
+from database import add_query_observer, pool_stats
+from services.users import user_cache_stats
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 — не поднимать HTTP-эндпоинт
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, сек.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *values, amount: float = 1):
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, total in self._values.items():
+            yield f"{self.name}{_labels(self.labels, values)} {total}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # значения меток -> [счётчики корзин (последняя — +Inf), сумма]
+        self._series = {}
+
+    def observe(self, seconds: float, *values):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {cumulative}"
+
+
+class Gauge:
+    """Значение снимается функцией в момент выдачи метрик."""
+
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+handler_seconds = Histogram("bot_handler_seconds", "Время работы хендлера", ("router", "handler"))
+handler_errors = Counter("bot_handler_errors_total", "Исключения в хендлерах", ("router", "handler", "error"))
+api_seconds = Histogram("bot_api_request_seconds", "Время запроса к Bot API", ("method",))
+api_errors = Counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+db_seconds = Histogram("bot_db_query_seconds", "Время запроса к MySQL", ("op", "table"))
+db_errors = Counter("bot_db_errors_total", "Ошибки запросов к MySQL", ("op", "table"))
+
+REGISTRY = [
+    handler_seconds, handler_errors, api_seconds, api_errors, db_seconds, db_errors,
+    Gauge("bot_db_pool_in_use", "Занятые соединения пула", lambda: pool_stats()["in_use"]),
+    Gauge("bot_db_pool_size", "Открытые соединения пула", lambda: pool_stats()["size"]),
+    Gauge("bot_db_pool_waited_total", "Сколько раз ждали свободного соединения", lambda: pool_stats()["waited"]),
+    Gauge("bot_user_cache_hits_total", "Попадания в кэш пользователей", lambda: user_cache_stats()["hits"]),
+    Gauge("bot_user_cache_misses_total", "Промахи кэша пользователей", lambda: user_cache_stats()["misses"]),
+    Gauge("bot_user_cache_size", "Пользователей в кэше", lambda: user_cache_stats()["size"]),
+]
+
+_TABLE = re.compile(r"\b(?:from|into|update|join)\s+`?(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _query_labels(head: str):
+    op = head.split(None, 1)[0].upper() if head.strip() else "?"
+    match = _TABLE.search(head)
+    return op, match.group(1).lower() if match else "-"
+
+
+def _on_query(query: str, args, seconds: float, rowcount: int, error):
+    # Многострочные INSERT из executemany длинные: для меток хватает начала
+    op, table = _query_labels(query[:200])
+    db_seconds.observe(seconds, op, table)
+    if error is not None:
+        db_errors.inc(op, table)
+
+
+add_query_observer(_on_query)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+_runner = None
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(metrics_port: int = METRICS_PORT):
+    """Поднимает /metrics; вызывается из dp.startup."""
+    global _runner
+    if not metrics_port or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, METRICS_HOST, metrics_port).start()
+    logger.info("Метрики: http://%s:%d/metrics", METRICS_HOST, metrics_port)
+
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+# Направления листания: к более старым записям и обратно
+NEXT = "n"
+PREV = "p"
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _b36(n: int) -> str:
+    if n < 0:
+        return "-" + _b36(-n)
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if n == 0:
+            return out
+
+
+def encode_cursor(*parts: int) -> str:
+    """Компактное представление ключа для callback_data (лимит — 64 байта)."""
+    return ".".join(_b36(int(p)) for p in parts)
+
+
+def decode_cursor(cursor: str) -> tuple:
+    return tuple(int(p, 36) for p in cursor.split("."))
+
+
+def dt_to_int(dt: datetime) -> int:
+    return int(dt.strftime("%Y%m%d%H%M%S"))
+
+
+def int_to_dt(value: int) -> datetime:
+    return datetime.strptime(str(value), "%Y%m%d%H%M%S")
+
+
+def parse_nav(data: str):
+    """'<prefix>:<n|p>:<cursor>' -> (direction, cursor) или None при мусоре."""
+    parts = data.split(":", 2)
+    if len(parts) != 3 or parts[1] not in (NEXT, PREV):
+        return None
+    try:
+        return parts[1], decode_cursor(parts[2])
+    except ValueError:
+        return None
+
+
+def seek_condition(key, cursor, direction: str = NEXT):
+    """Условие «строго за курсором» в развёрнутом виде: a < x OR (a = x AND b < y).
+
+    Сравнение кортежей (a, b) < (x, y) MySQL не превращает в диапазон по индексу,
+    если перед ним стоит равенство по префиксу индекса (answered = FALSE AND ...):
+    тогда каждая следующая страница заново сканирует префикс с начала.
+    Возвращает (sql, параметры).
+    """
+    op = "<" if direction == NEXT else ">"
+    branches, args = [], []
+    for i, column in enumerate(key):
+        branch = [f"{c} = %s" for c in key[:i]] + [f"{column} {op} %s"]
+        branches.append(" AND ".join(branch))
+        args.extend(cursor[:i + 1])
+    if len(branches) == 1:
+        return branches[0], args
+    return "(" + " OR ".join(f"({b})" for b in branches) + ")", args
+
+
+async def fetch_keyset_page(cur, table: str, key, per_page: int, cursor=None, direction: str = NEXT,
+                            where: str = None, params=(), select: str = "*"):
+    """Страница строк table по убыванию key (seek-пагинация вместо OFFSET).
+
+    cursor — значения key граничной строки. Возвращает (rows, has_prev, has_next).
+    select — выбираемые столбцы; должен включать key.
+    """
+    conditions = [where] if where else []
+    args = list(params)
+    if cursor is not None:
+        condition, cursor_args = seek_condition(key, cursor, direction)
+        conditions.append(condition)
+        args.extend(cursor_args)
+    order = "DESC" if direction == NEXT else "ASC"
+
+    sql = f"SELECT {select} FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + ", ".join(f"{c} {order}" for c in key) + " LIMIT %s"
+    args.append(per_page + 1)
+
+    await cur.execute(sql, args)
+    rows = list(await cur.fetchall())
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == NEXT:
+        return rows, cursor is not None, more
+    rows.reverse()
+    return rows, more, True
@@ -0,0 +1,152 @@
+import os
+import secrets
+from collections import namedtuple
+from datetime import datetime
+
+from database import acquire
+from services.ledger import insert_entry
+from services.cache import SharedVersion, TTLCache
+
+PROMO_NEGATIVE_CACHE_SIZE = int(os.getenv("PROMO_NEGATIVE_CACHE_SIZE", "10000"))
+PROMO_NEGATIVE_CACHE_TTL = float(os.getenv("PROMO_NEGATIVE_CACHE_TTL", "300"))
+PROMO_CODE_LENGTH = int(os.getenv("PROMO_CODE_LENGTH", "10"))
+PROMO_BATCH_MAX = int(os.getenv("PROMO_BATCH_MAX", "50000"))
+# Строк в одном INSERT при генерации пачки
+PROMO_INSERT_CHUNK = 1000
+
+# Без похожих друг на друга символов (0/O, 1/I/L)
+_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+
+# Результаты активации
+REDEEMED = "redeemed"
+INVALID = "invalid"
+ALREADY_USED = "already_used"
+EXPIRED = "expired"
+EXHAUSTED = "exhausted"
+
+PromoCode = namedtuple("PromoCode", "reward max_uses expires_at batch")
+
+_catalog = None      # {CODE: PromoCode}
+_version = SharedVersion("promo")
+# Несуществующие и исчерпанные коды: перебор не доходит до MySQL
+_negative = TTLCache(maxsize=PROMO_NEGATIVE_CACHE_SIZE, ttl=PROMO_NEGATIVE_CACHE_TTL)
+
+
+async def _load_catalog(cur) -> dict:
+    await cur.execute("SELECT code, reward, max_uses, expires_at, batch FROM promo_codes")
+    # Сравнение в MySQL регистронезависимое, поэтому и ключи каталога — в верхнем регистре
+    return {normalize_code(code): PromoCode(*rest) for code, *rest in await cur.fetchall()}
+
+
+async def get_catalog() -> dict:
+    """Все промокоды {CODE: PromoCode}; даже с пачками таблица целиком помещается в памяти."""
+    global _catalog
+    if _catalog is not None and not _version.due():
+        return _catalog
+    async with _version.lock:
+        if _catalog is not None and not _version.due():
+            return _catalog
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                version = await _version.read(cur)
+                if _catalog is None or version != _version.value:
+                    _catalog = await _load_catalog(cur)
+                    _negative.clear()
+        _version.mark(version)
+    return _catalog
+
+
+def normalize_code(code: str) -> str:
+    """Промокоды хранятся и сравниваются в верхнем регистре, без пробелов по краям."""
+    return code.strip().upper()
+
+
+async def redeem(tg_id: int, code: str):
+    """Активирует промокод одной транзакцией. Возвращает (результат, награда)."""
+    code = normalize_code(code)
+    # Сначала сверка версии: при её смене get_catalog очищает _negative,
+    # иначе код, созданный в другом процессе, оставался бы здесь «несуществующим»
+    catalog = await get_catalog()
+    status = _negative.get(code)
+    if status is not None:
+        return status, None
+    promo = catalog.get(code)
+    if promo is None:
+        _negative.set(code, INVALID)
+        return INVALID, None
+    now = datetime.now()
+    if promo.expires_at is not None and promo.expires_at <= now:
+        return EXPIRED, None
+
+    async with acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                # Уникальный ключ (tg_id, code) сам отсекает повторную и параллельную активацию
+                await cur.execute(
+                    "INSERT IGNORE INTO promo_codes_usage (tg_id, code) VALUES (%s, %s)",
+                    (tg_id, code)
+                )
+                if cur.rowcount == 0:
+                    await conn.rollback()
+                    return ALREADY_USED, promo.reward
+                # Лимит и срок проверяются в том же UPDATE, что увеличивает счётчик,
+                # поэтому параллельные активации не превысят max_uses
+                await cur.execute("""
+                    UPDATE promo_codes SET uses = uses + 1
+                    WHERE code = %s
+                      AND (max_uses IS NULL OR uses < max_uses)
+                      AND (expires_at IS NULL OR expires_at > %s)
+                """, (code, now))
+                if cur.rowcount == 0:
+                    await conn.rollback()
+                    _negative.set(code, EXHAUSTED)
+                    return EXHAUSTED, None
+                # Начисление — строка журнала, строку users не трогаем
+                await insert_entry(cur, tg_id, promo.reward, f"promo:{code}")
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    return REDEEMED, promo.reward
+
+
+def _random_code() -> str:
+    return "".join(secrets.choice(_ALPHABET) for _ in range(PROMO_CODE_LENGTH))
+
+
+async def generate_batch(count: int, reward: int, max_uses: int = None, expires_at: datetime = None):
+    """Создаёт count случайных промокодов одной пачкой. Возвращает (batch, [коды])."""
+    batch = datetime.now().strftime("%Y%m%d%H%M%S") + "-" + secrets.token_hex(3)
+    taken = set(await get_catalog())
+    created = []
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            while len(created) < count:
+                chunk = set()
+                while len(chunk) < min(PROMO_INSERT_CHUNK, count - len(created)):
+                    code = _random_code()
+                    if code not in taken:
+                        chunk.add(code)
+                taken |= chunk
+                await cur.executemany(
+                    "INSERT IGNORE INTO promo_codes (code, reward, max_uses, expires_at, batch) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    [(code, reward, max_uses, expires_at, batch) for code in chunk]
+                )
+                if cur.rowcount == len(chunk):
+                    created.extend(chunk)
+                else:
+                    # Код успел появиться из другого процесса — выясняем, какие строки вставлены
+                    await cur.execute("SELECT code FROM promo_codes WHERE batch = %s", (batch,))
+                    created = [row[0] for row in await cur.fetchall()]
+    await invalidate_promo_codes()
+    return batch, created
+
+
+async def invalidate_promo_codes():
+    """Вызывается после добавления или удаления промокодов."""
+    global _catalog
+    _catalog = None
+    _negative.clear()
+    await _version.bump()
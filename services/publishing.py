@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from database import acquire
+from services.broadcast import FAIL_TRANSIENT, TokenBucket, classify_error, global_limiter
+from services.events_feed import event_photo
+
+# Каналы для публикации событий через запятую
+PUBLISH_CHANNELS = [int(c) for c in os.getenv("PUBLISH_CHANNELS", "-1002292957980").split(",") if c.strip()]
+# В группу или канал Telegram пускает около 20 сообщений в минуту; правки и удаления
+# постов считаются вместе с публикациями. Лимит у каждого канала свой
+PUBLISH_PER_MINUTE = float(os.getenv("PUBLISH_PER_MINUTE", "20"))
+PUBLISH_MAX_RETRIES = int(os.getenv("PUBLISH_MAX_RETRIES", "3"))
+
+logger = logging.getLogger(__name__)
+
+# id канала -> ограничитель на все публикации, правки и удаления в нём.
+# Сверху действует global_limiter рассылок — общий лимит бота
+_limiters = {}
+
+
+class PostGone(Exception):
+    """Пост уже удалён из канала вручную."""
+
+
+def _channel_limiter(chat_id: int) -> TokenBucket:
+    limiter = _limiters.get(chat_id)
+    if limiter is None:
+        # Без всплесков: посты в один канал идут не чаще раза в 60 / PUBLISH_PER_MINUTE секунд
+        limiter = _limiters[chat_id] = TokenBucket(PUBLISH_PER_MINUTE / 60, capacity=1)
+    return limiter
+
+
+def event_post_text(event: dict) -> str:
+    return (f"📢 <b>Событие!</b>\n\n<b>Название:</b> {event.get('title')}\n<b>Дата и время:</b> {event.get('datetime')}"
+            f"\n<b>Описание:</b> {event.get('description')}\n<b>Приз:</b> {event.get('prize')}")
+
+
+def load_published(raw) -> dict:
+    """Содержимое events.published: {"id канала": message_id}."""
+    try:
+        published = json.loads(raw or "{}")
+    except ValueError:
+        logger.warning("Не удалось разобрать events.published: %r", raw)
+        return {}
+    return {str(channel): int(message_id) for channel, message_id in published.items()} if isinstance(published, dict) else {}
+
+
+async def _call(method, **kwargs):
+    """Запрос к Bot API под ограничителями, с повтором после TelegramRetryAfter и сетевых ошибок.
+
+    PUBLISH_MAX_RETRIES ограничивает только сетевые ошибки: после
+    TelegramRetryAfter запрос повторяется, когда Telegram разрешит.
+    """
+    limiter = _channel_limiter(kwargs["chat_id"])
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        await global_limiter.acquire()
+        try:
+            return await method(**kwargs)
+        except TelegramRetryAfter as e:
+            # Ожидание назначено боту: рассылки тоже останавливаются
+            limiter.pause(e.retry_after)
+            global_limiter.pause(e.retry_after)
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            if classify_error(e) != FAIL_TRANSIENT or attempt >= PUBLISH_MAX_RETRIES:
+                raise
+            attempt += 1
+            await asyncio.sleep(attempt)
+
+
+def _mentions(error: Exception, *phrases) -> bool:
+    description = str(error).lower()
+    return any(phrase in description for phrase in phrases)
+
+
+async def _publish_one(bot: Bot, channel: int, text: str, photo: str) -> int:
+    if photo:
+        try:
+            sent = await _call(bot.send_photo, chat_id=channel, photo=photo, caption=text, parse_mode="HTML")
+            return sent.message_id
+        except TelegramBadRequest as e:
+            # Например, file_id устарел — публикуем текстом
+            logger.warning("Канал %s: ошибка публикации фото, публикуем текст: %s", channel, e)
+    sent = await _call(bot.send_message, chat_id=channel, text=text, parse_mode="HTML")
+    return sent.message_id
+
+
+async def _edit_one(bot: Bot, channel: int, message_id: int, text: str, photo: str):
+    # Тип поста не хранится: у события с фото это скорее всего фото с подписью,
+    # но если фото не ушло, пост текстовый — тогда пробуем второй способ
+    edits = [(bot.edit_message_caption, "caption"), (bot.edit_message_text, "text")]
+    if not photo:
+        edits.reverse()
+    for i, (edit, field) in enumerate(edits):
+        try:
+            await _call(edit, chat_id=channel, message_id=message_id, parse_mode="HTML", **{field: text})
+            return
+        except TelegramBadRequest as e:
+            if _mentions(e, "message is not modified"):
+                return
+            if _mentions(e, "message to edit not found"):
+                raise PostGone() from e
+            if i == len(edits) - 1 or not _mentions(e, "no caption", "no text"):
+                raise
+
+
+async def _delete_one(bot: Bot, channel: int, message_id: int):
+    try:
+        await _call(bot.delete_message, chat_id=channel, message_id=message_id)
+    except TelegramBadRequest as e:
+        if not _mentions(e, "message to delete not found"):
+            raise
+
+
+async def save_published(changes: dict):
+    """Записывает events.published сразу для нескольких событий {event_id: published} одним запросом."""
+    if not changes:
+        return
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.executemany("UPDATE events SET published = %s WHERE id = %s",
+                                  [(json.dumps(published), eid) for eid, published in changes.items()])
+            await conn.commit()
+
+
+async def _fan_out(channels, calls) -> dict:
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    for channel, result in zip(channels, results):
+        if isinstance(result, Exception) and not isinstance(result, PostGone):
+            logger.warning("Канал %s: %s", channel, result)
+    return dict(zip(channels, results))
+
+
+async def publish_event(bot: Bot, event: dict, channels=None) -> dict:
+    """Публикует событие одновременно во все каналы, где его ещё нет.
+
+    Возвращает {"id канала": message_id или исключение}; удачные публикации
+    дописываются в events.published одной записью.
+    """
+    published = load_published(event.get("published"))
+    targets = [str(c) for c in (channels or PUBLISH_CHANNELS) if str(c) not in published]
+    text = event_post_text(event)
+    results = await _fan_out(targets, [_publish_one(bot, int(c), text, event_photo(event)) for c in targets])
+    sent = {channel: result for channel, result in results.items() if not isinstance(result, Exception)}
+    if sent:
+        published.update(sent)
+        await save_published({event["id"]: published})
+    logger.info("Событие %s опубликовано: %s", event["id"], sent)
+    return results
+
+
+async def update_published(bot: Bot, event: dict) -> dict:
+    """Переносит новый текст события во все опубликованные посты.
+
+    Возвращает {"id канала": None или исключение}. Посты, удалённые из канала
+    вручную, забываются — тогда events.published переписывается одной записью.
+    """
+    published = load_published(event.get("published"))
+    text = event_post_text(event)
+    results = await _fan_out(list(published), [
+        _edit_one(bot, int(channel), message_id, text, event_photo(event)) for channel, message_id in published.items()
+    ])
+    gone = [channel for channel, result in results.items() if isinstance(result, PostGone)]
+    if gone:
+        await save_published({event["id"]: {c: m for c, m in published.items() if c not in gone}})
+    return results
+
+
+async def delete_published(bot: Bot, published: dict) -> dict:
+    """Удаляет посты события из всех каналов. Возвращает {"id канала": None или исключение}."""
+    return await _fan_out(list(published), [
+        _delete_one(bot, int(channel), message_id) for channel, message_id in published.items()
+    ])
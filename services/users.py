@@ -0,0 +1,117 @@
+import os
+
+from aiomysql import DictCursor
+
+from database import acquire
+from services.cache import PeriodicCheck, TTLCache
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+# Сколько (сек.) хранить журнал user_invalidations. Процесс, который не сверялся
+# дольше USER_CACHE_TTL, уже не держит в кэше ничего, что журнал мог бы сбросить
+USER_INVALIDATIONS_KEEP = max(int(os.getenv("USER_INVALIDATIONS_KEEP", "3600")), int(USER_CACHE_TTL) * 2)
+
+_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+# value — id последней применённой записи user_invalidations
+_changes = PeriodicCheck()
+
+
+async def _apply_invalidations():
+    """Сбрасывает из кэша пользователей, которых с прошлой сверки изменили другие процессы."""
+    if not _changes.due():
+        return
+    async with _changes.lock:
+        if not _changes.due():
+            return
+        async with acquire() as conn:
+            async with conn.cursor() as cur:
+                if _changes.value is None:
+                    # Кэш пока пуст — достаточно запомнить, с какой записи начинать
+                    await cur.execute("SELECT COALESCE(MAX(id), 0) FROM user_invalidations")
+                    last_id, = await cur.fetchone()
+                else:
+                    await cur.execute("SELECT id, tg_id FROM user_invalidations WHERE id > %s ORDER BY id",
+                                      (_changes.value,))
+                    rows = await cur.fetchall()
+                    # id выдаются до коммита, так что запись изредка появляется позже
+                    # соседней с большим id и здесь пропускается; такую строку сбросит USER_CACHE_TTL
+                    for _, tg_id in rows:
+                        _cache.invalidate(tg_id)
+                    last_id = rows[-1][0] if rows else _changes.value
+        _changes.mark(last_id)
+
+
+async def get_user(tg_id: int):
+    """Возвращает строку users (dict) из кэша или из БД; None, если пользователя нет.
+
+    Все, кто меняет строку пользователя, обязаны вызвать invalidate_user().
+    """
+    await _apply_invalidations()
+    user = _cache.get(tg_id)
+    if user is not None:
+        return user
+    async with acquire() as conn:
+        async with conn.cursor(DictCursor) as cur:
+            await cur.execute(
+                "SELECT tg_id, username, full_name, `rank`, balance, ledger_folded_id, blocked, unreachable "
+                "FROM users WHERE tg_id = %s",
+                (tg_id,)
+            )
+            user = await cur.fetchone()
+    if user is not None:
+        _cache.set(tg_id, user)
+    return user
+
+
+async def ensure_user(from_user):
+    """Гарантирует, что пользователь есть в users, и возвращает его строку.
+
+    Пишет в БД одним INSERT ... ON DUPLICATE KEY UPDATE и только если
+    пользователь новый, сменил имя/юзернейм или был помечен недоступным.
+    """
+    tg_id = from_user.id
+    # Отпечаток — пара (username, full_name), сравниваемая с закэшированной строкой
+    fingerprint = (from_user.username or "-", from_user.full_name or "-")
+    user = await get_user(tg_id)
+    if user is not None and not user["unreachable"] and (user["username"], user["full_name"]) == fingerprint:
+        return user
+
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                INSERT INTO users (tg_id, username, full_name, `rank`, balance)
+                VALUES (%s, %s, %s, 'Гость', 0)
+                ON DUPLICATE KEY UPDATE
+                    username = VALUES(username),
+                    full_name = VALUES(full_name),
+                    unreachable = FALSE
+            """, (tg_id, *fingerprint))
+
+    # Строку собираем сами, чтобы не перечитывать её из БД
+    if user is None:
+        user = {"tg_id": tg_id, "rank": "Гость", "balance": 0, "ledger_folded_id": 0, "blocked": 0}
+    user = dict(user, username=fingerprint[0], full_name=fingerprint[1], unreachable=0)
+    _cache.set(tg_id, user)
+    return user
+
+
+async def invalidate_user(*tg_ids: int):
+    """Сбрасывает строки пользователей здесь и, через журнал user_invalidations, в остальных процессах.
+
+    Остальные пользователи остаются в кэше, так что пачка недоступных
+    из рассылки не возвращает таблицу users на горячий путь.
+    """
+    if not tg_ids:
+        return
+    for tg_id in tg_ids:
+        _cache.invalidate(tg_id)
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.executemany("INSERT INTO user_invalidations (tg_id) VALUES (%s)", [(tg_id,) for tg_id in tg_ids])
+            await cur.execute("DELETE FROM user_invalidations WHERE created_at < NOW() - INTERVAL %s SECOND",
+                              (USER_INVALIDATIONS_KEEP,))
+
+
+def user_cache_stats() -> dict:
+    """Размер и попадания/промахи кэша; отдаются в /metrics (services.metrics)."""
+    return _cache.stats()
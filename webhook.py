@@ -0,0 +1,47 @@
+import logging
+import os
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+# Публичный адрес бота без пути, например https://bot.example.com
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram присылает его в X-Telegram-Bot-Api-Secret-Token; чужие запросы получают 401
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or "8080")
+
+logger = logging.getLogger(__name__)
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH,
+                       secret: str = WEBHOOK_SECRET) -> web.Application:
+    """aiohttp-приложение, принимающее обновления на path.
+
+    Telegram сразу получает 200, а обновление обрабатывается отдельной задачей,
+    так что медленный хендлер не задерживает приём следующих.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret,
+    ).register(app, path=path)
+    # Пробрасывает startup/shutdown приложения в dp.startup / dp.shutdown
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    """Регистрирует вебхук в Telegram; вызывается из dp.startup."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_URL")
+    await bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+    logger.info("Вебхук установлен: %s%s", WEBHOOK_URL.rstrip("/"), WEBHOOK_PATH)
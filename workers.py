@@ -0,0 +1,350 @@
+"""Многопроцессный режим: приём обновлений в одном процессе, обработка в N воркерах.
+
+Процесс приёма получает обновления (long polling или вебхук) и раскладывает
+их по воркерам по chat_id, поэтому все обновления одного чата попадают в один
+процесс и обрабатываются там по очереди — FSM-диалоги вроде создания события
+не перемешиваются. Каждый воркер поднимает собственные Bot и Dispatcher из
+фабрики (по умолчанию main.create_bot / main.create_dispatcher).
+
+Супервизор перезапускает упавшие воркеры и те, что перестали обновлять
+heartbeat (завис event loop).
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import time
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+from logs import setup_logging
+
+# Сколько обновлений может ждать в очереди одного воркера
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+# Сколько обновлений воркер обрабатывает одновременно
+WORKER_MAX_INFLIGHT = int(os.getenv("WORKER_MAX_INFLIGHT", "256"))
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))
+WORKER_CHECK_INTERVAL = float(os.getenv("WORKER_CHECK_INTERVAL", "2"))
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+# Сколько (сек.) ждать остановки воркеров: они дорабатывают очередь и идущие
+# рассылки (BROADCAST_SHUTDOWN_TIMEOUT в handlers/manage.py), потом убиваются
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "45"))
+# Базовый порт /metrics; воркеры слушают следующие за ним
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FACTORY = "main:create_bot,create_dispatcher"
+
+_CHAT_UPDATES = ("message", "edited_message", "channel_post", "edited_channel_post")
+_USER_UPDATES = ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query",
+                 "my_chat_member", "chat_member", "chat_join_request", "poll_answer")
+
+
+def shard_key(update: dict) -> int:
+    """chat_id обновления (или id пользователя, если чата нет)."""
+    for name in _CHAT_UPDATES:
+        if name in update:
+            return update[name]["chat"]["id"]
+    query = update.get("callback_query")
+    if query:
+        message = query.get("message")
+        return message["chat"]["id"] if message else query["from"]["id"]
+    for name in _USER_UPDATES:
+        if name in update:
+            body = update[name]
+            if "chat" in body:
+                return body["chat"]["id"]
+            user = body.get("from") or body.get("user")
+            if user:
+                return user["id"]
+    return update.get("update_id", 0)
+
+
+def _load_factory(spec: str):
+    module_name, names = spec.split(":")
+    module = importlib.import_module(module_name)
+    make_bot, make_dispatcher = names.split(",")
+    return getattr(module, make_bot), getattr(module, make_dispatcher)
+
+
+# --- воркер ---
+
+def _take(updates, limit: int = 100):
+    """Блокирующе ждёт обновление и забирает всё, что уже накопилось (выполняется в потоке)."""
+    batch = [updates.get()]
+    while len(batch) < limit:
+        try:
+            batch.append(updates.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+async def _feed(dp, bot, update: dict, previous):
+    # Следующее обновление чата ждёт завершения предыдущего
+    if previous is not None:
+        await asyncio.wait([previous])
+    try:
+        await dp.feed_raw_update(bot, update)
+    except Exception:
+        logger.exception("Ошибка обработки update %s", update.get("update_id"))
+
+
+async def _beat(heartbeat):
+    while True:
+        heartbeat.value = time.time()
+        await asyncio.sleep(1)
+
+
+async def _worker(index: int, updates, heartbeat, factory: str):
+    make_bot, make_dispatcher = _load_factory(factory)
+    bot, dp = make_bot(), make_dispatcher()
+    # У каждого воркера свой порт /metrics: METRICS_PORT + 1 + номер
+    metrics_port = METRICS_PORT and METRICS_PORT + 1 + index
+    # Heartbeat идёт и во время старта: миграции под GET_LOCK могут ждать
+    # и выполняться дольше WORKER_HEARTBEAT_TIMEOUT, но event loop при этом жив
+    beat = asyncio.create_task(_beat(heartbeat))
+    try:
+        await dp.emit_startup(bot=bot, dispatcher=dp, metrics_port=metrics_port)
+    except BaseException:
+        beat.cancel()
+        raise
+    logger.info("Воркер %d запущен, pid %d", index, os.getpid())
+
+    loop = asyncio.get_running_loop()
+    inflight = asyncio.Semaphore(WORKER_MAX_INFLIGHT)
+    tails = {}
+    running = set()
+    stopping = False
+    try:
+        while not stopping:
+            for update in await loop.run_in_executor(None, _take, updates):
+                if update is None:
+                    stopping = True
+                    break
+                await inflight.acquire()
+                key = shard_key(update)
+                task = asyncio.create_task(_feed(dp, bot, update, tails.get(key)))
+                tails[key] = task
+                running.add(task)
+
+                def _done(t, key=key):
+                    inflight.release()
+                    running.discard(t)
+                    if tails.get(key) is t:
+                        del tails[key]
+
+                task.add_done_callback(_done)
+        if running:
+            await asyncio.wait(running)
+    finally:
+        beat.cancel()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+def worker_main(index: int, updates, heartbeat, factory: str = DEFAULT_FACTORY):
+    """Точка входа процесса-воркера."""
+    setup_logging()
+    asyncio.run(_worker(index, updates, heartbeat, factory))
+
+
+# --- супервизор ---
+
+class Supervisor:
+    def __init__(self, workers: int, factory: str = DEFAULT_FACTORY):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.factory = factory
+        self.queues = [self.ctx.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self.heartbeats = [self.ctx.Value("d", 0.0, lock=False) for _ in range(workers)]
+        self.procs = [None] * workers
+        self.restarts = 0
+
+    def _spawn(self, index: int):
+        self.heartbeats[index].value = time.time()
+        proc = self.ctx.Process(
+            target=worker_main,
+            args=(index, self.queues[index], self.heartbeats[index], self.factory),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        proc.start()
+        self.procs[index] = proc
+
+    def start(self):
+        for index in range(len(self.procs)):
+            self._spawn(index)
+
+    async def dispatch(self, update: dict):
+        target = self.queues[shard_key(update) % len(self.queues)]
+        while True:
+            try:
+                target.put_nowait(update)
+                return
+            except queue.Full:
+                # Воркер не успевает — притормаживаем приём, а не копим память
+                await asyncio.sleep(0.01)
+
+    def check(self):
+        now = time.time()
+        for index, proc in enumerate(self.procs):
+            hung = now - self.heartbeats[index].value > WORKER_HEARTBEAT_TIMEOUT
+            if proc.is_alive() and not hung:
+                continue
+            if proc.is_alive():
+                logger.warning("Воркер %d не отвечает, перезапуск", index)
+                proc.kill()
+                proc.join(5)
+                # Убитый процесс мог держать блокировку очереди — заводим новую
+                # и переносим в неё всё, что он не успел забрать
+                old = self.queues[index]
+                self.queues[index] = self.ctx.Queue(WORKER_QUEUE_SIZE)
+                moved, lost = self._move_pending(old, self.queues[index])
+                if lost:
+                    logger.error("Воркер %d: потеряно обновлений из очереди: %d (перенесено %d)", index, lost, moved)
+                elif moved:
+                    logger.info("Воркер %d: перенесено обновлений в новую очередь: %d", index, moved)
+            else:
+                logger.warning("Воркер %d завершился с кодом %s, перезапуск", index, proc.exitcode)
+            self.restarts += 1
+            self._spawn(index)
+
+    @staticmethod
+    def _move_pending(old, new):
+        """Перекладывает обновления из очереди убитого воркера; возвращает (перенесено, потеряно)."""
+        moved = dropped = 0
+        while True:
+            try:
+                # get_nowait не ждёт блокировку чтения: если её унёс убитый
+                # процесс, сразу получим Empty, а не зависнем на битом pipe
+                update = old.get_nowait()
+            except queue.Empty:
+                break
+            except Exception:
+                logger.exception("Не удалось дочитать очередь убитого воркера")
+                break
+            if update is None:
+                continue
+            try:
+                new.put_nowait(update)
+            except queue.Full:
+                dropped = 1
+                break
+            moved += 1
+        try:
+            lost = old.qsize() + dropped
+        except NotImplementedError:
+            lost = dropped
+        # Остаток в буфере фидера уже не нужен — не ждём его при выходе
+        old.cancel_join_thread()
+        old.close()
+        return moved, lost
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            self.check()
+
+    def stop(self, timeout: float = WORKER_STOP_TIMEOUT):
+        deadline = time.time() + timeout
+        for index, q in enumerate(self.queues):
+            try:
+                # Полная очередь освобождается, пока воркер её разбирает; не дождались — его убьют ниже
+                q.put(None, timeout=max(0.0, deadline - time.time()))
+            except queue.Full:
+                logger.warning("Воркер %d: очередь переполнена, остановка без дообработки", index)
+        for proc in self.procs:
+            proc.join(max(0.0, deadline - time.time()))
+            if proc.is_alive():
+                proc.kill()
+
+
+# --- приём обновлений ---
+
+async def poll_updates(bot, supervisor: Supervisor, allowed_updates=None, timeout: int = POLLING_TIMEOUT):
+    """getUpdates без разбора в объекты aiogram: воркерам уходят исходные словари."""
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    offset = None
+    backoff = 1
+    async with ClientSession(timeout=ClientTimeout(total=timeout + 10)) as http:
+        while True:
+            params = {"timeout": timeout}
+            if offset is not None:
+                params["offset"] = offset
+            if allowed_updates is not None:
+                params["allowed_updates"] = ",".join(allowed_updates)
+            try:
+                async with http.post(url, data=params) as resp:
+                    payload = await resp.json()
+            except Exception as e:
+                logger.warning("Ошибка getUpdates: %s", e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            if not payload.get("ok"):
+                # 409 — другой поллер или включён вебхук, 401 — неверный токен:
+                # ответ приходит сразу, поэтому без паузы цикл долбил бы getUpdates
+                retry_after = (payload.get("parameters") or {}).get("retry_after")
+                logger.error("getUpdates вернул ошибку %s: %s", payload.get("error_code"), payload.get("description"))
+                await asyncio.sleep(retry_after or backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+            for update in payload.get("result") or []:
+                await supervisor.dispatch(update)
+                offset = update["update_id"] + 1
+
+
+def create_intake_app(supervisor: Supervisor, path: str, secret: str = None) -> web.Application:
+    async def receive(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if secret and not secrets.compare_digest(token, secret):
+            return web.Response(status=401)
+        await supervisor.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
+
+
+async def _intake(workers: int, mode: str):
+    from main import create_bot, create_dispatcher
+    from webhook import WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, set_webhook
+
+    bot = create_bot()
+    # Диспетчер в процессе приёма нужен только для списка используемых типов обновлений
+    dp = create_dispatcher()
+    allowed_updates = dp.resolve_used_update_types()
+    supervisor = Supervisor(workers)
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+    runner = None
+    logger.info("Режим %s, воркеров: %d", mode, workers)
+    try:
+        if mode == "webhook":
+            runner = web.AppRunner(create_intake_app(supervisor, WEBHOOK_PATH, WEBHOOK_SECRET))
+            await runner.setup()
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            await set_webhook(bot, dp)
+            await asyncio.Event().wait()
+        else:
+            await bot.delete_webhook()
+            await poll_updates(bot, supervisor, allowed_updates)
+    finally:
+        watcher.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        supervisor.stop()
+        await bot.session.close()
+
+
+def run_sharded(workers: int, mode: str = "polling"):
+    try:
+        asyncio.run(_intake(workers, mode))
+    except KeyboardInterrupt:
+        pass